@@ -0,0 +1,271 @@
+"""Implements resumable uploads of files sent in chunks"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import Optional
+
+from file_cache import FileCache
+
+# Extension of the files holding the state of uploads
+UPLOAD_STATE_EXTENSION = '.upload.json'
+
+# Extension of the files being uploaded
+PARTIAL_UPLOAD_EXTENSION = '.partial'
+
+# Number of bytes read at a time when receiving or hashing uploaded data
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+# Maximum number of in-progress upload hashes kept; uploads without a hash kept here have theirs rebuilt from their file
+UPLOAD_MAX_HASHERS = 100
+
+# Number of seconds an upload can go without receiving a chunk before it's considered abandoned and removed
+UPLOAD_MAX_IDLE_SEC = 24 * 60 * 60
+
+# Hashes of the data received so far, keyed by the path of the partial file and kept with the number of bytes hashed
+UPLOAD_HASHERS = FileCache(UPLOAD_MAX_HASHERS)
+
+
+def _get_paths(folder: str, upload_id: str) -> tuple:
+    """Returns the paths of an upload's state file and partial file
+    Arguments:
+        folder: the folder the file is being uploaded to
+        upload_id: the ID of the upload
+    Return:
+        A 2-tuple of the paths to the state file and the partial file
+    Exceptions:
+        ValueError is raised if the upload ID isn't valid
+    """
+    if not upload_id or len(upload_id) != 32 or any(one_char not in '0123456789abcdef' for one_char in upload_id):
+        raise ValueError(f'Invalid upload ID "{upload_id}"')
+
+    return os.path.join(folder, '.' + upload_id + UPLOAD_STATE_EXTENSION), \
+           os.path.join(folder, '.' + upload_id + PARTIAL_UPLOAD_EXTENSION)
+
+
+def _write_state(state_path: str, state: dict) -> None:
+    """Replaces the upload state file in one step
+    Arguments:
+        state_path: the path of the state file
+        state: the state to write
+    """
+    temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(state_path), prefix=os.path.basename(state_path) + '.')
+    try:
+        with os.fdopen(temp_fd, 'w', encoding='utf8') as out_file:
+            json.dump(state, out_file)
+        os.replace(temp_path, state_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def _get_hasher(partial_path: str, offset: int) -> object:
+    """Returns the hash of the first bytes of the partial file
+    Arguments:
+        partial_path: the path of the partial file
+        offset: the number of bytes received
+    Return:
+        Returns a SHA256 hash object updated with the received bytes
+    Notes:
+        The hash kept in this process is used when it's up to date. Otherwise, such as when the earlier chunks were
+        received by another process, the hash is rebuilt by reading the received bytes from the file
+    """
+    hasher = UPLOAD_HASHERS.get(partial_path, (offset,))
+    if hasher is not None:
+        return hasher
+
+    hasher = hashlib.sha256()
+    remaining = offset
+    with open(partial_path, 'rb') as in_file:
+        while remaining > 0:
+            chunk = in_file.read(min(UPLOAD_BLOCK_SIZE, remaining))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            remaining -= len(chunk)
+
+    return hasher
+
+
+def remove_abandoned_uploads(folder: str, max_idle_sec: float = UPLOAD_MAX_IDLE_SEC) -> list:
+    """Removes the files of uploads that haven't received a chunk for a while
+    Arguments:
+        folder: the folder files are being uploaded to
+        max_idle_sec: the number of seconds an upload can go without receiving a chunk before it's removed
+    Return:
+        Returns the list of IDs of the removed uploads
+    Notes:
+        Uploads that have a chunk being written are kept
+    """
+    upload_ids = set()
+    for one_entry in os.scandir(folder):
+        for one_extension in (UPLOAD_STATE_EXTENSION, PARTIAL_UPLOAD_EXTENSION):
+            if one_entry.name.startswith('.') and one_entry.name.endswith(one_extension):
+                upload_ids.add(one_entry.name[1:-len(one_extension)])
+
+    removed = []
+    now = time.time()
+    for one_id in sorted(upload_ids):
+        try:
+            state_path, partial_path = _get_paths(folder, one_id)
+        except ValueError:
+            continue
+
+        last_change = 0
+        for one_path in (state_path, partial_path):
+            try:
+                last_change = max(last_change, os.stat(one_path).st_mtime)
+            except FileNotFoundError:
+                pass
+        if now - last_change < max_idle_sec:
+            continue
+
+        try:
+            with open(partial_path, 'rb') as in_file:
+                fcntl.flock(in_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # Chunks waiting on the lock find the upload is gone once the state is removed
+                if os.path.exists(state_path):
+                    os.unlink(state_path)
+                os.unlink(partial_path)
+        except FileNotFoundError:
+            if os.path.exists(state_path):
+                os.unlink(state_path)
+        except BlockingIOError:
+            continue
+        UPLOAD_HASHERS.remove(partial_path)
+        removed.append(one_id)
+
+    return removed
+
+
+def start_upload(folder: str, filename: str, size: Optional[int] = None, sha256: Optional[str] = None) -> dict:
+    """Starts a chunked upload
+    Arguments:
+        folder: the folder to upload the file to
+        filename: the name of the file to upload; expected to be safe to use as a file name
+        size: the optional size of the file, which is checked when the upload is finished
+        sha256: the optional SHA256 hex digest of the file, which is checked when the upload is finished
+    Return:
+        Returns the state of the upload: its 'id', 'filename', 'size', 'sha256', and the 'offset' to send the next chunk at
+    Notes:
+        Abandoned uploads in the folder are removed by remove_abandoned_uploads()
+    """
+    remove_abandoned_uploads(folder)
+
+    upload_id = uuid.uuid4().hex
+    state_path, partial_path = _get_paths(folder, upload_id)
+
+    with open(partial_path, 'wb'):
+        pass
+    state = {'id': upload_id, 'filename': filename, 'size': size, 'sha256': sha256.lower() if sha256 else None, 'offset': 0}
+    _write_state(state_path, state)
+
+    return state
+
+
+def load_upload(folder: str, upload_id: str) -> Optional[dict]:
+    """Returns the state of an upload
+    Arguments:
+        folder: the folder the file is being uploaded to
+        upload_id: the ID of the upload
+    Return:
+        Returns the state of the upload, or None if the upload isn't found
+    Exceptions:
+        ValueError is raised if the upload ID isn't valid
+    """
+    state_path, _ = _get_paths(folder, upload_id)
+    try:
+        with open(state_path, 'r', encoding='utf8') as in_file:
+            return json.load(in_file)
+    except FileNotFoundError:
+        return None
+
+
+def write_chunk(folder: str, upload_id: str, offset: int, in_stream: object) -> tuple:
+    """Writes a chunk of an upload to the file
+    Arguments:
+        folder: the folder the file is being uploaded to
+        upload_id: the ID of the upload
+        offset: the offset of the chunk in the file; needs to match the upload's offset
+        in_stream: the stream to read the chunk from
+    Return:
+        A 2-tuple of the upload's state after the chunk, or None if the upload isn't found, and whether the chunk was
+        accepted. A chunk is only accepted at the upload's offset; otherwise the state is returned so the sender can resume
+        from the upload's offset
+    Exceptions:
+        ValueError is raised if the upload ID isn't valid or the chunk goes past the size of the file
+    Notes:
+        If reading the chunk fails part way through, the bytes received are kept and the exception is raised
+    """
+    state_path, partial_path = _get_paths(folder, upload_id)
+    if not os.path.exists(state_path):
+        return None, False
+
+    with open(partial_path, 'r+b') as out_file:
+        # Only one chunk of an upload is written at a time, even across processes
+        fcntl.flock(out_file.fileno(), fcntl.LOCK_EX)
+        state = load_upload(folder, upload_id)
+        if state is None or state['offset'] != offset:
+            return state, False
+
+        hasher = _get_hasher(partial_path, offset)
+        out_file.seek(offset)
+        received = 0
+        try:
+            while True:
+                chunk = in_stream.read(UPLOAD_BLOCK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if state['size'] is not None and offset + received > state['size']:
+                    received -= len(chunk)
+                    raise ValueError(f'Upload chunk goes past the end of the file at {state["size"]} bytes')
+                out_file.write(chunk)
+                hasher.update(chunk)
+        finally:
+            # Keep what was received so that the upload can resume from there
+            out_file.truncate(offset + received)
+            out_file.flush()
+            os.fsync(out_file.fileno())
+            state['offset'] = offset + received
+            _write_state(state_path, state)
+            UPLOAD_HASHERS.put(partial_path, (state['offset'],), hasher)
+
+    return state, True
+
+
+def finish_upload(folder: str, upload_id: str) -> Optional[dict]:
+    """Finishes an upload by checking the file and moving it to its final name
+    Arguments:
+        folder: the folder the file is being uploaded to
+        upload_id: the ID of the upload
+    Return:
+        Returns the 'filename', 'size', and 'sha256' of the uploaded file, or None if the upload isn't found
+    Exceptions:
+        ValueError is raised if the upload ID isn't valid or the file doesn't match the expected size or SHA256 digest
+    """
+    state_path, partial_path = _get_paths(folder, upload_id)
+    if not os.path.exists(state_path):
+        return None
+
+    with open(partial_path, 'rb') as in_file:
+        fcntl.flock(in_file.fileno(), fcntl.LOCK_EX)
+        state = load_upload(folder, upload_id)
+        if state is None:
+            return None
+
+        if state['size'] is not None and state['offset'] != state['size']:
+            raise ValueError(f'Upload is incomplete: received {state["offset"]} of {state["size"]} bytes')
+        digest = _get_hasher(partial_path, state['offset']).hexdigest()
+        if state['sha256'] is not None and digest != state['sha256']:
+            raise ValueError(f'Uploaded file does not match its SHA256 digest: received {digest}')
+
+        os.replace(partial_path, os.path.join(folder, state['filename']))
+        os.unlink(state_path)
+        UPLOAD_HASHERS.remove(partial_path)
+
+    return {'filename': state['filename'], 'size': state['offset'], 'sha256': digest}
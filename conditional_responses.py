@@ -0,0 +1,53 @@
+"""Builds responses that are answered with 304 Not Modified when the client already has them"""
+
+import hashlib
+from collections.abc import Callable
+from typing import Optional
+
+from flask import Response, make_response, request
+
+
+def conditional_response(validator: Optional[tuple], build_func: Callable) -> Response:
+    """Returns the response built by the function, or 304 Not Modified if the client already has it
+    Arguments:
+        validator: values that change whenever the response changes; the response is always built when None
+        build_func: called without arguments to build the response when the client doesn't have it
+    Return:
+        Returns the response
+    Notes:
+        The entity tag is derived from the validator and the request's path and arguments, so the response body isn't
+        built or serialised to check it. Only successful responses are tagged
+    """
+    if validator is None:
+        return make_response(build_func())
+
+    etag = hashlib.sha1(repr((request.full_path, validator)).encode('utf8')).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(build_func())
+        if response.status_code != 200:
+            return response
+
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response
+
+
+def body_conditional_response(build_func: Callable) -> Response:
+    """Returns the response built by the function, or 304 Not Modified if the client already has it
+    Arguments:
+        build_func: called without arguments to build the response
+    Return:
+        Returns the response
+    Notes:
+        The entity tag is a hash of the response body, so the response is always built. This saves sending the body when
+        a validator would cost about as much as building the response. Only successful responses are tagged
+    """
+    response = make_response(build_func())
+    if response.status_code != 200:
+        return response
+
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -0,0 +1,135 @@
+"""Implements a bounded cache of values loaded from files"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+from collections.abc import Callable
+
+
+class FileCache:
+    """Least recently used cache of values loaded from files
+
+    Values are stored with the signature of their file (such as the modification time and size) at the time they
+    were loaded and are only returned while the file's signature is unchanged. Pinned values are for files that aren't
+    expected to change; they're kept apart from the other values so that they aren't evicted by them, and only the
+    least recently used of them are evicted once there are more than max_pinned
+    """
+
+    def __init__(self, max_size: int, size_func: Callable = None, max_pinned: Optional[int] = None):
+        """Initializes class instance
+        Arguments:
+            max_size - the maximum total size of the unpinned values to keep
+            size_func - optional function returning the size of a value; each value has a size of 1 by default
+            max_pinned - the maximum number of pinned values to keep; defaults to max_size
+        """
+        self.max_size = max_size
+        self.size_func = size_func
+        self.max_pinned = max_pinned if max_pinned is not None else max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._pinned = OrderedDict()
+        self._lock = Lock()
+
+
+    def get(self, path: str, signature: Optional[tuple] = None) -> Optional[object]:
+        """Returns the value cached for the file
+        Arguments:
+            path - the path of the file
+            signature - the current signature of the file
+        Returns:
+            Returns the cached value, or None if there isn't a current value for the file
+        Notes:
+            When signature is None nothing is returned, and it isn't counted as a miss
+        """
+        with self._lock:
+            if signature is None:
+                return None
+
+            if path in self._pinned:
+                cached_signature, value = self._pinned[path]
+                if cached_signature == signature:
+                    self._pinned.move_to_end(path)
+                    self.hits += 1
+                    return value
+
+                # The file has been written again, such as when its workflow is recovered
+                del self._pinned[path]
+
+            if path in self._entries:
+                cached_signature, value = self._entries[path]
+                if cached_signature == signature:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return value
+
+                # The file has changed
+                self._remove_entry(path)
+
+            self.misses += 1
+            return None
+
+
+    def put(self, path: str, signature: Optional[tuple], value: object, pinned: bool = False) -> None:
+        """Caches the value loaded from the file
+        Arguments:
+            path - the path of the file
+            signature - the signature of the file when the value was loaded
+            value - the value to cache
+            pinned - when True the value is kept with the other pinned values
+        """
+        with self._lock:
+            self._remove_entry(path)
+            self._pinned.pop(path, None)
+            if pinned:
+                self._pinned[path] = (signature, value)
+                while len(self._pinned) > self.max_pinned:
+                    self._pinned.popitem(last=False)
+                    self.evictions += 1
+                return
+
+            self._entries[path] = (signature, value)
+            self.size += self._value_size(value)
+            while self.size > self.max_size and self._entries:
+                self._remove_entry(next(iter(self._entries)))
+                self.evictions += 1
+
+
+    def remove(self, path: str) -> None:
+        """Removes any value cached for the file
+        Arguments:
+            path - the path of the file
+        """
+        with self._lock:
+            self._remove_entry(path)
+            self._pinned.pop(path, None)
+
+
+    def stats(self) -> dict:
+        """Returns the cache statistics
+        Returns:
+            A dict containing the number of entries, pinned entries, total size of unpinned entries, hits, misses, and evictions
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'pinned': len(self._pinned), 'size': self.size, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+    def _value_size(self, value: object) -> int:
+        """Returns the size of a value
+        Arguments:
+            value - the value to get the size of
+        """
+        return self.size_func(value) if self.size_func is not None else 1
+
+
+    def _remove_entry(self, path: str) -> None:
+        """Removes an unpinned value and updates the total size; the caller is expected to hold the lock
+        Arguments:
+            path - the path of the file
+        """
+        if path in self._entries:
+            _, value = self._entries.pop(path)
+            self.size -= self._value_size(value)
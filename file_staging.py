@@ -0,0 +1,373 @@
+"""Stages workflow input files concurrently and without copying them where possible"""
+
+import errno
+import fcntl
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, wait, FIRST_EXCEPTION
+from threading import Lock
+from typing import Optional
+from collections.abc import Callable
+
+# Name of the file in a workflow's folder listing the read-only files to mount into containers
+READ_ONLY_MOUNTS_FILE_NAME = '_mounts'
+
+# The ioctl request for cloning a file on Linux (FICLONE)
+FICLONE_REQUEST = 0x40049409
+
+# Errors indicating a file can't be cloned or copied by the kernel and the next method should be tried
+UNSUPPORTED_ERRNOS = (errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EOPNOTSUPP,
+                      errno.EBADF)
+
+# Serializes updates to the read-only mount files
+READ_ONLY_MOUNTS_LOCK = Lock()
+
+
+class HostLimits:
+    """Limits the number of transfers from each host that can run at the same time
+
+    Transfers are queued for their host and are only submitted to the executor when the host has capacity, so that the
+    executor's threads aren't held waiting on a busy host while transfers from other hosts could run
+    """
+
+    def __init__(self, max_per_host: int):
+        """Initializes class instance
+        Arguments:
+            max_per_host - the maximum number of transfers from a host that can run at the same time
+        """
+        self.max_per_host = max_per_host
+        self._running = {}
+        self._pending = {}
+        self._lock = Lock()
+
+
+    def submit(self, host: str, executor: Executor, func: Callable, *args) -> Future:
+        """Runs the function on the executor once the host has capacity for it
+        Arguments:
+            host - the name of the host
+            executor - the executor to run the function on
+            func - the function to run
+            args - the arguments to call the function with
+        Return:
+            Returns the future of the function's result; cancelling the future before the function starts keeps it
+            from running
+        """
+        future = Future()
+        with self._lock:
+            if self._running.get(host, 0) >= self.max_per_host:
+                self._pending.setdefault(host, deque()).append((executor, future, func, args))
+                return future
+            self._running[host] = self._running.get(host, 0) + 1
+
+        self._start(host, executor, future, func, args)
+        return future
+
+
+    def _start(self, host: str, executor: Executor, future: Future, func: Callable, args: tuple) -> None:
+        """Submits a function that's been given one of the host's places to the executor
+        Arguments:
+            host - the name of the host
+            executor - the executor to run the function on
+            future - the future to set the function's result on
+            func - the function to run
+            args - the arguments to call the function with
+        """
+        try:
+            executor.submit(self._run, host, future, func, args)
+        except RuntimeError as ex:
+            # The executor has been shut down
+            if future.set_running_or_notify_cancel():
+                future.set_exception(ex)
+            self._finished(host)
+
+
+    def _run(self, host: str, future: Future, func: Callable, args: tuple) -> None:
+        """Runs a function on the executor and starts the next one queued for the host when it's done
+        Arguments:
+            host - the name of the host
+            future - the future to set the function's result on
+            func - the function to run
+            args - the arguments to call the function with
+        """
+        # pylint: disable=broad-exception-caught
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args))
+                except BaseException as ex:
+                    future.set_exception(ex)
+        finally:
+            self._finished(host)
+
+
+    def _finished(self, host: str) -> None:
+        """Gives the place of a finished function to the next one queued for the host
+        Arguments:
+            host - the name of the host
+        """
+        with self._lock:
+            pending = self._pending.get(host)
+            if not pending:
+                self._pending.pop(host, None)
+                self._running[host] -= 1
+                if self._running[host] <= 0:
+                    del self._running[host]
+                return
+            executor, future, func, args = pending.popleft()
+
+        self._start(host, executor, future, func, args)
+
+
+class StagingProgress:
+    """Tracks the aggregate progress of a set of transfers and periodically reports it"""
+
+    def __init__(self, total_files: int, report_func: Callable, min_interval_sec: float):
+        """Initializes class instance
+        Arguments:
+            total_files - the number of files being transferred
+            report_func - called with the dict returned by summary() when there's progress to report
+            min_interval_sec - the minimum number of seconds between reports of transferred bytes
+        """
+        self.total_files = total_files
+        self.report_func = report_func
+        self.min_interval_sec = min_interval_sec
+        self.files_done = 0
+        self.bytes_done = 0
+        self._last_report_ts = None
+        self._lock = Lock()
+        self._report_lock = Lock()
+
+
+    def add_bytes(self, num_bytes: int) -> None:
+        """Records transferred bytes
+        Arguments:
+            num_bytes - the number of bytes transferred since the last call
+        """
+        with self._lock:
+            self.bytes_done += num_bytes
+        self._report(False)
+
+
+    def file_done(self) -> None:
+        """Records that a file has been transferred"""
+        with self._lock:
+            self.files_done += 1
+        self._report(True)
+
+
+    def summary(self) -> dict:
+        """Returns the progress
+        Returns:
+            A dict with the number of files transferred ('files_done'), the total number of files ('files_total'), and
+            the number of bytes transferred ('bytes_done')
+        """
+        with self._lock:
+            return {'files_done': self.files_done, 'files_total': self.total_files, 'bytes_done': self.bytes_done}
+
+
+    def _report(self, force: bool) -> None:
+        """Reports the progress if it's been long enough since the last report
+        Arguments:
+            force - when True the progress is reported regardless of when the last report was made
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._last_report_ts is not None and now - self._last_report_ts < self.min_interval_sec:
+                return
+            self._last_report_ts = now
+
+        # Reports are made one at a time so that an older report can't replace a newer one
+        with self._report_lock:
+            try:
+                self.report_func(self.summary())
+            except Exception as ex:
+                print('Ignoring exception caught while reporting staging progress:', ex)
+
+
+def _run_transfer(transfer_func: Callable, progress: StagingProgress) -> object:
+    """Runs one transfer
+    Arguments:
+        transfer_func - the function doing the transfer; called with a function to report transferred bytes to
+        progress - the progress of the staging
+    Return:
+        Returns the value returned by transfer_func
+    """
+    res = transfer_func(progress.add_bytes)
+    progress.file_done()
+    return res
+
+
+def stage_files(transfers: list, executor: Executor, host_limits: HostLimits, progress: StagingProgress) -> list:
+    """Runs the transfers concurrently and waits for them to finish
+    Arguments:
+        transfers - a list of (host, transfer_func) tuples; each transfer_func is called with a function to report
+                    transferred bytes to
+        executor - the executor to run the transfers on
+        host_limits - the limits on the number of transfers from each host
+        progress - the progress of the staging
+    Return:
+        Returns the list of the values returned by the transfer functions, in the same order as the transfers
+    Exceptions:
+        If a transfer raises an exception the transfers that haven't started are cancelled, the running ones are
+        waited on, and the exception is raised
+    """
+    futures = [host_limits.submit(host, executor, _run_transfer, transfer_func, progress)
+               for host, transfer_func in transfers]
+
+    _, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+    if not_done:
+        for one_future in not_done:
+            one_future.cancel()
+        wait(not_done)
+
+    for one_future in futures:
+        if not one_future.cancelled() and one_future.exception() is not None:
+            raise one_future.exception()
+
+    return [one_future.result() for one_future in futures]
+
+
+def _clone_file(in_fd: int, out_fd: int) -> bool:
+    """Clones a file so that it shares its data blocks with the source (a reflink)
+    Arguments:
+        in_fd - the file descriptor of the source file
+        out_fd - the file descriptor of the empty destination file
+    Return:
+        Returns True if the file was cloned and False if the file system doesn't support it
+    """
+    try:
+        fcntl.ioctl(out_fd, FICLONE_REQUEST, in_fd)
+    except OSError as ex:
+        if ex.errno not in UNSUPPORTED_ERRNOS:
+            raise
+        return False
+
+    return True
+
+
+def _copy_file_range(in_fd: int, out_fd: int) -> bool:
+    """Copies a file within the kernel, which lets file systems share or copy data blocks without reading them
+    Arguments:
+        in_fd - the file descriptor of the source file
+        out_fd - the file descriptor of the empty destination file
+    Return:
+        Returns True if the file was copied and False if the kernel can't copy the file
+    """
+    if not hasattr(os, 'copy_file_range'):
+        return False
+
+    copied = 0
+    remaining = os.fstat(in_fd).st_size
+    while remaining > 0:
+        try:
+            num_copied = os.copy_file_range(in_fd, out_fd, remaining, copied, copied)
+        except OSError as ex:
+            if copied > 0 or ex.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            return False
+        if num_copied == 0:
+            break
+        copied += num_copied
+        remaining -= num_copied
+
+    return True
+
+
+def clone_or_copy_file(source_path: str, dest_path: str) -> str:
+    """Makes a private copy of a file at the destination while avoiding copying its contents where possible
+    Arguments:
+        source_path - the path of the file
+        dest_path - the path to make the file available at; an existing file is replaced
+    Return:
+        Returns the method used: 'reflink', 'copy_file_range', or 'copy'
+    Notes:
+        A clone of the file is tried first, then a copy by the kernel, and finally a byte copy. The file isn't hard linked
+        since changes made through the destination would change the source. The copy is writable by its owner
+    """
+    if os.path.lexists(dest_path):
+        os.unlink(dest_path)
+
+    method = None
+    with open(source_path, 'rb') as in_file, open(dest_path, 'wb') as out_file:
+        if _clone_file(in_file.fileno(), out_file.fileno()):
+            method = 'reflink'
+        elif _copy_file_range(in_file.fileno(), out_file.fileno()):
+            method = 'copy_file_range'
+
+    if method is None:
+        shutil.copyfile(source_path, dest_path)
+        method = 'copy'
+    os.chmod(dest_path, stat.S_IMODE(os.stat(source_path).st_mode) | stat.S_IWUSR)
+
+    return method
+
+
+def load_read_only_mounts(folder: str) -> list:
+    """Returns the read-only files to mount into containers
+    Arguments:
+        folder - the workflow folder
+    Return:
+        Returns a list of [source path, file name] pairs; the file name is relative to the workflow folder
+    """
+    mounts_path = os.path.join(folder, READ_ONLY_MOUNTS_FILE_NAME)
+    if not os.path.exists(mounts_path):
+        return []
+
+    with open(mounts_path, 'r', encoding='utf8') as in_file:
+        return json.load(in_file)
+
+
+def add_read_only_mount(source_path: str, dest_path: str) -> None:
+    """Arranges for a read-only file to be mounted into containers instead of copying it
+    Arguments:
+        source_path - the path of the file
+        dest_path - the path in the workflow folder the file is to be mounted at
+    Notes:
+        An empty file is created at the destination as a mount point and the file is added to the list of mounts kept in
+        the destination's folder
+    """
+    folder = os.path.dirname(dest_path)
+    file_name = os.path.basename(dest_path)
+
+    if os.path.lexists(dest_path):
+        os.unlink(dest_path)
+    with open(dest_path, 'w', encoding='utf8'):
+        pass
+
+    with READ_ONLY_MOUNTS_LOCK:
+        mounts = [one_mount for one_mount in load_read_only_mounts(folder) if one_mount[1] != file_name]
+        mounts.append([os.path.abspath(source_path), file_name])
+
+        temp_fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.' + READ_ONLY_MOUNTS_FILE_NAME + '.')
+        try:
+            with os.fdopen(temp_fd, 'w', encoding='utf8') as out_file:
+                json.dump(mounts, out_file, indent=2)
+            os.replace(temp_path, os.path.join(folder, READ_ONLY_MOUNTS_FILE_NAME))
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+
+def link_read_only_file(source_path: str, dest_path: str, use_mounts: bool) -> Optional[str]:
+    """Makes a read-only file available at the destination without copying it
+    Arguments:
+        source_path - the path of the file
+        dest_path - the path to make the file available at
+        use_mounts - when True the file is mounted into containers by add_read_only_mount(), otherwise a symbolic
+                     link is made
+    Return:
+        Returns the method used: 'mount' or 'symlink'
+    """
+    if use_mounts:
+        add_read_only_mount(source_path, dest_path)
+        return 'mount'
+
+    if os.path.lexists(dest_path):
+        os.unlink(dest_path)
+    os.symlink(os.path.abspath(source_path), dest_path)
+    return 'symlink'
@@ -0,0 +1,95 @@
+"""Lists the contents of folders for browsing"""
+
+import fnmatch
+import os
+from typing import Optional
+
+# The keys that listings can be sorted on
+LISTING_SORT_KEYS = ('name', 'size', 'date')
+
+
+def scan_folder(folder_path: str) -> list:
+    """Returns the entries of a folder
+    Arguments:
+        folder_path: the path of the folder to scan
+    Return:
+        Returns a list of dicts with the 'name', 'size', 'mtime' (seconds since the epoch), and 'type' ('file' or 'folder')
+        of each entry. Hidden entries (starting with a period) are skipped
+    Notes:
+        Each entry is checked with at most one stat call. Entries that can't be checked, such as broken links, are skipped
+    """
+    entries = []
+    with os.scandir(folder_path) as scanned:
+        for one_entry in scanned:
+            if one_entry.name[0] == '.':
+                continue
+
+            try:
+                entry_stat = one_entry.stat()
+                is_dir = one_entry.is_dir()
+            except OSError as ex:
+                print(f'Skipping folder entry that can\'t be checked: "{one_entry.path}"', ex)
+                continue
+
+            entries.append({'name': one_entry.name,
+                            'size': entry_stat.st_size,
+                            'mtime': entry_stat.st_mtime,
+                            'type': 'folder' if is_dir else 'file'
+                            })
+
+    return entries
+
+
+def filter_entries(entries: list, file_filter: Optional[str]) -> list:
+    """Returns the entries with names matching the filter
+    Arguments:
+        entries: the list of entries to filter
+        file_filter: the shell-style pattern names need to match; all entries are returned if the filter is empty
+    Return:
+        Returns the list of matching entries
+    """
+    if not file_filter:
+        return entries
+
+    return [one_entry for one_entry in entries if fnmatch.fnmatch(one_entry['name'], file_filter)]
+
+
+def sort_entries(entries: list, sort_key: str = 'name', descending: bool = False) -> list:
+    """Returns a sorted copy of the entries
+    Arguments:
+        entries: the list of entries to sort
+        sort_key: one of the keys in LISTING_SORT_KEYS to sort on
+        descending: sorts in descending order when True
+    Return:
+        Returns the sorted list of entries. Entries with the same value are sorted by name
+    Exceptions:
+        Raises ValueError if the sort key isn't supported
+    """
+    key_funcs = {
+        'name': lambda entry: entry['name'],
+        'size': lambda entry: (entry['size'], entry['name']),
+        'date': lambda entry: (entry['mtime'] or 0, entry['name']),
+    }
+    if sort_key not in key_funcs:
+        raise ValueError(f'Unsupported sort key "{sort_key}": expected one of {LISTING_SORT_KEYS}')
+
+    return sorted(entries, key=key_funcs[sort_key], reverse=descending)
+
+
+def page_entries(entries: list, file_filter: Optional[str] = None, sort_key: str = 'name', descending: bool = False,
+                 offset: int = 0, limit: Optional[int] = None) -> tuple:
+    """Filters, sorts, and returns one page of entries
+    Arguments:
+        entries: the list of entries to page through
+        file_filter: the optional shell-style pattern names need to match
+        sort_key: one of the keys in LISTING_SORT_KEYS to sort on
+        descending: sorts in descending order when True
+        offset: the number of matching entries to skip
+        limit: the maximum number of entries to return; all remaining entries are returned when None
+    Return:
+        Returns a 2-tuple of the page of entries and the total number of matching entries
+    """
+    matched = sort_entries(filter_entries(entries, file_filter), sort_key, descending)
+    end_index = offset + limit if limit is not None else None
+
+    return matched[offset:end_index], len(matched)
@@ -0,0 +1,15 @@
+"""Configures gunicorn to start the server's workflow services in each of its worker processes"""
+
+
+def post_worker_init(worker) -> None:
+    """Starts the workflow services once a worker process has loaded the app
+    Arguments:
+        worker - the worker process
+    Notes:
+        The runner pool stops with the gunicorn master process, which is the worker's parent
+    """
+    # The app is loaded by the worker before this is called
+    # pylint: disable=import-outside-toplevel
+    import main
+
+    main.start_workflow_services(worker.ppid)
@@ -0,0 +1,213 @@
+"""Implements a local content-addressed cache of fetched input files"""
+
+import fcntl
+import hashlib
+import os
+import tempfile
+from threading import Lock
+from typing import Optional, TextIO
+from collections.abc import Callable
+
+from file_staging import clone_or_copy_file
+
+# Extension of the lock files used to coordinate fetches between processes
+LOCK_FILE_EXTENSION = '.lock'
+
+
+class InputCache:
+    """Keeps copies of fetched files for reuse by later workflows
+
+    Files are identified by their source path, checksum, and size so that a changed source is fetched again. Cached
+    files are made read-only, and the workflows using them get their own copies, which share the cached file's data
+    blocks where the file system supports it. When the cache grows past its byte budget the least recently used files
+    are removed. Only one fetch of a file is made at a time, even across processes sharing the cache folder; other
+    callers wait for it and use its result
+    """
+
+    def __init__(self, folder: str, max_bytes: int):
+        """Initializes class instance
+        Arguments:
+            folder - the folder to keep cached files in
+            max_bytes - the maximum number of bytes of cached files to keep
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._key_locks = {}
+        self._lock = Lock()
+        os.makedirs(self.folder, exist_ok=True)
+
+
+    @staticmethod
+    def get_key(source_path: str, checksum: str, size: int) -> str:
+        """Returns the cache key of a file
+        Arguments:
+            source_path - the path of the file at its source
+            checksum - the checksum of the file
+            size - the size of the file
+        """
+        return hashlib.sha256(f'{source_path}\n{checksum}\n{size}'.encode('utf8')).hexdigest()
+
+
+    def fetch(self, source_path: str, checksum: str, size: int, dest_path: str, fetch_func: Callable) -> bool:
+        """Makes the file available at the destination, fetching it into the cache if it isn't cached
+        Arguments:
+            source_path - the path of the file at its source
+            checksum - the checksum of the file
+            size - the size of the file
+            dest_path - the path to make the file available at
+            fetch_func - called with the path to fetch the file to; returns True if the file was fetched and False if not
+        Return:
+            Returns True if the file is available at the destination and False if it couldn't be fetched
+        """
+        key = self.get_key(source_path, checksum, size)
+        cache_path = self._get_cache_path(key)
+
+        with self._key_lock(key):
+            with self._open_locked(cache_path + LOCK_FILE_EXTENSION, True):
+                if os.path.isfile(cache_path):
+                    with self._lock:
+                        self.hits += 1
+                    os.utime(cache_path)
+                else:
+                    with self._lock:
+                        self.misses += 1
+                    if not self._fetch_to_cache(cache_path, fetch_func):
+                        return False
+
+                clone_or_copy_file(cache_path, dest_path)
+
+        self.evict(keep_path=cache_path)
+        return True
+
+
+    def evict(self, keep_path: str = None) -> None:
+        """Removes the least recently used files until the cached files are within the byte budget
+        Arguments:
+            keep_path - optional path of a cached file that's not to be removed
+        Notes:
+            Files that are being fetched or linked are skipped. A removed file's lock file is removed with it
+        """
+        cached_files = []
+        total_bytes = 0
+        for dir_path, _, file_names in os.walk(self.folder):
+            for one_name in file_names:
+                if one_name.startswith('.') or one_name.endswith(LOCK_FILE_EXTENSION):
+                    continue
+                one_path = os.path.join(dir_path, one_name)
+                try:
+                    file_stat = os.stat(one_path)
+                except OSError:
+                    continue
+                cached_files.append((file_stat.st_mtime, one_path, file_stat.st_size))
+                total_bytes += file_stat.st_size
+
+        for _, one_path, one_size in sorted(cached_files):
+            if total_bytes <= self.max_bytes:
+                break
+            if one_path == keep_path:
+                continue
+            lock_file = self._open_locked(one_path + LOCK_FILE_EXTENSION, False)
+            if lock_file is None:
+                continue
+            with lock_file:
+                try:
+                    os.unlink(one_path)
+                    total_bytes -= one_size
+                    os.unlink(one_path + LOCK_FILE_EXTENSION)
+                except OSError as ex:
+                    print(f'Unable to remove cached input file "{one_path}"', ex)
+                    continue
+
+            with self._lock:
+                key_lock = self._key_locks.get(os.path.basename(one_path))
+                if key_lock is not None and not key_lock.locked():
+                    del self._key_locks[os.path.basename(one_path)]
+
+
+    def stats(self) -> dict:
+        """Returns the cache statistics
+        Returns:
+            A dict containing the number of hits and misses
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+    def _get_cache_path(self, key: str) -> str:
+        """Returns the path of a cached file, making sure its folder exists
+        Arguments:
+            key - the cache key of the file
+        """
+        key_folder = os.path.join(self.folder, key[:2])
+        os.makedirs(key_folder, exist_ok=True)
+        return os.path.join(key_folder, key)
+
+
+    def _key_lock(self, key: str) -> Lock:
+        """Returns the lock coordinating the fetches of a file in this process
+        Arguments:
+            key - the cache key of the file
+        """
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = Lock()
+            return self._key_locks[key]
+
+
+    @staticmethod
+    def _open_locked(lock_path: str, blocking: bool) -> Optional[TextIO]:
+        """Opens a lock file and locks it for exclusive use
+        Arguments:
+            lock_path - the path of the lock file; it's created if it doesn't exist
+            blocking - whether to wait for the lock when it's held elsewhere
+        Return:
+            Returns the locked file, which is unlocked when it's closed, or None if the lock is held elsewhere and
+            blocking is False
+        Notes:
+            Lock files are removed along with their cached file, so the lock is only kept when the path still refers to
+            the locked file; otherwise the new file at the path is locked instead
+        """
+        while True:
+            # pylint: disable=consider-using-with
+            lock_file = open(lock_path, 'a', encoding='utf8')
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+            except BaseException:
+                lock_file.close()
+                raise
+
+            try:
+                if os.path.samestat(os.stat(lock_path), os.fstat(lock_file.fileno())):
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+
+    @staticmethod
+    def _fetch_to_cache(cache_path: str, fetch_func: Callable) -> bool:
+        """Fetches a file into the cache
+        Arguments:
+            cache_path - the path of the cached file
+            fetch_func - called with the path to fetch the file to
+        Return:
+            Returns True if the file was fetched and False if not
+        """
+        temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), prefix='.' + os.path.basename(cache_path) + '.')
+        os.close(temp_fd)
+        try:
+            if not fetch_func(temp_path):
+                return False
+            # Workflows share the cached file and shouldn't be changing it
+            os.chmod(temp_path, 0o444)
+            os.replace(temp_path, cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+        return True
@@ -0,0 +1,184 @@
+"""Lists the contents of iRODS collections for browsing using catalog queries"""
+
+import fnmatch
+import os
+from typing import Optional
+
+from irods.column import Column, Like
+from irods.exception import CollectionDoesNotExist
+from irods.models import Collection, DataObject
+from irods.query import Query
+from irods.session import iRODSSession
+
+
+def irods_like_pattern(file_filter: str) -> tuple:
+    """Converts a shell-style filter to an iRODS catalog LIKE pattern
+    Arguments:
+        file_filter: the filter to convert
+    Return:
+        A 2-tuple of the LIKE pattern and whether the pattern matches exactly the same names as the filter. When the match
+        isn't exact the pattern matches more names than the filter and the filter needs to be applied to the results
+    """
+    like_chars = []
+    exact = True
+    index = 0
+    while index < len(file_filter):
+        cur_char = file_filter[index]
+        if cur_char == '*':
+            like_chars.append('%')
+        elif cur_char == '?':
+            like_chars.append('_')
+        elif cur_char == '[' and ']' in file_filter[index + 2:]:
+            # A character set matches a single character
+            like_chars.append('_')
+            exact = False
+            index = file_filter.index(']', index + 2)
+        else:
+            # LIKE wildcards in the filter match more than the literal characters
+            if cur_char in ('%', '_'):
+                exact = False
+            like_chars.append(cur_char)
+        index += 1
+
+    return ''.join(like_chars), exact
+
+
+def _query_page(query: Query, offset: int, limit: Optional[int]) -> list:
+    """Returns a page of query results
+    Arguments:
+        query: the query to run
+        offset: the number of rows to skip
+        limit: the maximum number of rows to return; all the remaining rows are returned when None
+    Return:
+        Returns the list of result rows
+    """
+    if limit is None:
+        return list(query.offset(offset).get_results())
+
+    if limit <= 0:
+        return []
+
+    page_query = query.offset(offset).limit(limit)
+    results = page_query.execute()
+    if results.continue_index > 0:
+        page_query.continue_index(results.continue_index).close()
+
+    return list(results)
+
+
+def _query_count(conn: iRODSSession, column: Column, conditions: list) -> int:
+    """Returns the number of catalog rows matching the conditions
+    Arguments:
+        conn: the iRODS session to use
+        column: the column to count
+        conditions: the list of query conditions to apply
+    """
+    results = conn.query(column).count(column).filter(*conditions).execute()
+    return int(results[0][column]) if len(results) > 0 else 0
+
+
+def _query_distinct_count(conn: iRODSSession, column: Column, conditions: list) -> int:
+    """Returns the number of distinct values of a column in the catalog rows matching the conditions
+    Arguments:
+        conn: the iRODS session to use
+        column: the column to count the values of
+        conditions: the list of query conditions to apply
+    Notes:
+        The values are fetched and counted, which takes a round trip for each page of values
+    """
+    return sum(1 for _ in conn.query(column).filter(*conditions).get_results())
+
+
+def _query_object_count(conn: iRODSSession, conditions: list) -> int:
+    """Returns the number of data objects matching the conditions
+    Arguments:
+        conn: the iRODS session to use
+        conditions: the list of query conditions to apply
+    Notes:
+        The catalog counts rows, and data objects have a row for each replica. When every row is of a first replica,
+        each data object has one row and the catalog's count is used. Otherwise the names are fetched and counted
+    """
+    row_count = _query_count(conn, DataObject.id, conditions)
+    first_replica_count = _query_count(conn, DataObject.id, conditions + [DataObject.replica_number == 0])
+    if row_count == first_replica_count:
+        return row_count
+
+    return _query_distinct_count(conn, DataObject.name, conditions)
+
+
+def list_irods_collection(conn: iRODSSession, path: str, file_filter: Optional[str], offset: int,
+                          limit: Optional[int]) -> tuple:
+    """Lists the sub-collections and data objects of a collection
+    Arguments:
+        conn: the iRODS session to use
+        path: the path of the collection to list
+        file_filter: optional shell-style filter for the names of the data objects
+        offset: the number of entries to skip
+        limit: the maximum number of entries to return; all the remaining entries are returned when None
+    Return:
+        Returns a 2-tuple of the listed entries and the total number of entries. Sub-collections are listed first, followed
+        by the data objects; each is sorted by name
+    Exceptions:
+        CollectionDoesNotExist is raised if the collection doesn't exist
+    Notes:
+        The filter is applied by the catalog. Data objects with several replicas are listed once, with the size and date
+        of their largest and newest replica
+    """
+    # pylint: disable=too-many-locals
+    folder_conditions = [Collection.parent_name == path, Collection.name != path]
+    file_conditions = [Collection.name == path]
+
+    exact_filter = True
+    if file_filter:
+        like_pattern, exact_filter = irods_like_pattern(file_filter)
+        file_conditions.append(Like(DataObject.name, like_pattern))
+
+    # Sub-collections come first
+    folder_query = conn.query(Collection.name).filter(*folder_conditions).order_by(Collection.name)
+    folder_total = _query_count(conn, Collection.id, folder_conditions) if limit is not None else None
+    if folder_total is None or offset < folder_total:
+        folder_rows = _query_page(folder_query, offset, limit)
+    else:
+        folder_rows = []
+    if folder_total is None:
+        folder_total = offset + len(folder_rows) if folder_rows else _query_count(conn, Collection.id, folder_conditions)
+
+    # Selecting the name with aggregated columns returns one row for each data object rather than for each replica
+    file_offset = max(0, offset - folder_total)
+    file_limit = limit - len(folder_rows) if limit is not None else None
+    file_query = conn.query(DataObject.name).max(DataObject.size, DataObject.modify_time).filter(*file_conditions) \
+                     .order_by(DataObject.name)
+    if exact_filter:
+        file_rows = _query_page(file_query, file_offset, file_limit)
+        if file_limit is None or len(file_rows) < file_limit:
+            file_total = file_offset + len(file_rows)
+        else:
+            file_total = _query_object_count(conn, file_conditions)
+    else:
+        # Finish filtering the names before paging through them
+        file_rows = [one_row for one_row in file_query.get_results() if fnmatch.fnmatch(one_row[DataObject.name], file_filter)]
+        file_total = len(file_rows)
+        file_rows = file_rows[file_offset:file_offset + file_limit if file_limit is not None else None]
+
+    # An empty listing may be of a collection that doesn't exist
+    if folder_total + file_total == 0 and not conn.collections.exists(path):
+        raise CollectionDoesNotExist(path)
+
+    entries = []
+    for one_row in folder_rows:
+        entries.append({'name': os.path.basename(one_row[Collection.name]),
+                        'path': one_row[Collection.name],
+                        'size': 0,
+                        'date': '',
+                        'type': 'folder'
+                        })
+    for one_row in file_rows:
+        # pylint:  disable=consider-using-f-string
+        entries.append({'name': one_row[DataObject.name],
+                        'path': path.rstrip('/') + '/' + one_row[DataObject.name],
+                        'size': int(one_row[DataObject.size]),
+                        'date': '{0:%Y-%m-%d %H:%M:%S}'.format(one_row[DataObject.modify_time]),
+                        'type': 'file'
+                        })
+
+    return entries, folder_total + file_total
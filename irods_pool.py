@@ -0,0 +1,225 @@
+"""Implements a pool of reusable iRODS sessions"""
+
+import hashlib
+import time
+from contextlib import contextmanager
+from threading import Condition, Lock
+from typing import Optional
+from irods.session import iRODSSession
+
+
+class IRODSSessionPool:
+    """Keeps authenticated iRODS sessions for reuse by later requests using the same connection information
+
+    A session is only used by one caller at a time. Sessions are discarded when an exception is raised while
+    they're in use, when they have been idle too long, or when they fail a health check. When there's a limit on the
+    number of sessions open for the same connection information, callers wait for a session to be returned once the
+    limit is reached
+    """
+
+    def __init__(self, max_idle_sessions: int, idle_timeout_sec: float, health_check_sec: float,
+                 max_sessions_per_key: Optional[int] = None, wait_timeout_sec: Optional[float] = None):
+        """Initializes class instance
+        Arguments:
+            max_idle_sessions - the maximum number of idle sessions to keep for reuse
+            idle_timeout_sec - the number of seconds a session can be idle before it's discarded
+            health_check_sec - the number of seconds a session can be idle before it's checked before being reused
+            max_sessions_per_key - the maximum number of sessions, in use or idle, open for the same connection
+                                   information; there's no limit when None
+            wait_timeout_sec - the maximum number of seconds to wait for a session when at the limit; waits
+                               indefinitely when None
+        """
+        self.max_idle_sessions = max_idle_sessions
+        self.idle_timeout_sec = idle_timeout_sec
+        self.health_check_sec = health_check_sec
+        self.max_sessions_per_key = max_sessions_per_key
+        self.wait_timeout_sec = wait_timeout_sec
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.waits = 0
+        self._idle = {}
+        self._open = {}
+        self._lock = Lock()
+        self._returned = Condition(self._lock)
+
+
+    @staticmethod
+    def get_key(auth: dict) -> tuple:
+        """Returns the pool key of the connection information
+        Arguments:
+            auth - the connection information with the 'host', 'port', 'zone', 'user', and 'password' of the account
+        Returns:
+            The key of sessions that can be shared with the connection information
+        Notes:
+            The password is part of the key so that a session is never handed to a caller with different credentials
+        """
+        return (auth['host'], str(auth['port']), auth['zone'], auth['user'],
+                hashlib.sha256(auth['password'].encode('utf8')).hexdigest())
+
+
+    @contextmanager
+    def session(self, auth: dict):
+        """Context manager providing a session for the connection information
+        Arguments:
+            auth - the connection information with the 'host', 'port', 'zone', 'user', and 'password' of the account
+        Returns:
+            Yields an iRODS session that is returned to the pool when the context exits normally
+        Exceptions:
+            TimeoutError is raised if no session became available within wait_timeout_sec
+        """
+        key = self.get_key(auth)
+        conn = self._acquire(key, auth)
+        try:
+            yield conn
+        except BaseException:
+            self._discard(key, conn)
+            raise
+
+        self._release(key, conn)
+
+
+    def clear(self) -> None:
+        """Discards all the idle sessions"""
+        with self._lock:
+            idle_sessions = [(key, conn) for key, key_sessions in self._idle.items() for conn, _ in key_sessions]
+            self._idle = {}
+
+        for key, conn in idle_sessions:
+            self._discard(key, conn)
+
+
+    def stats(self) -> dict:
+        """Returns the pool statistics
+        Returns:
+            A dict containing the number of idle and open sessions, the number of sessions created, reused, and
+            discarded, and the number of times callers waited for a session
+        """
+        with self._lock:
+            return {'idle': sum(len(key_sessions) for key_sessions in self._idle.values()),
+                    'open': sum(self._open.values()), 'created': self.created, 'reused': self.reused,
+                    'discarded': self.discarded, 'waits': self.waits}
+
+
+    def _acquire(self, key: tuple, auth: dict) -> iRODSSession:
+        """Returns an idle session for the key, or a new session if there aren't any usable idle sessions
+        Arguments:
+            key - the key of the connection information
+            auth - the connection information
+        Notes:
+            Waits for a session to be returned or discarded when the key is at the limit of open sessions
+        """
+        deadline = time.monotonic() + self.wait_timeout_sec if self.wait_timeout_sec is not None else None
+        while True:
+            with self._lock:
+                key_sessions = self._idle.get(key)
+                if not key_sessions:
+                    if self.max_sessions_per_key is None or self._open.get(key, 0) < self.max_sessions_per_key:
+                        self._open[key] = self._open.get(key, 0) + 1
+                        self.created += 1
+                        break
+
+                    self.waits += 1
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f'Timed out waiting for an iRODS session to {auth["host"]}')
+                    self._returned.wait(remaining)
+                    continue
+
+                conn, idle_ts = key_sessions.pop()
+                if not key_sessions:
+                    del self._idle[key]
+
+            idle_sec = time.monotonic() - idle_ts
+            if idle_sec < self.idle_timeout_sec and (idle_sec < self.health_check_sec or self._is_healthy(conn, auth)):
+                with self._lock:
+                    self.reused += 1
+                return conn
+
+            self._discard(key, conn)
+
+        try:
+            return iRODSSession(host=auth['host'], port=auth['port'], user=auth['user'], password=auth['password'],
+                                zone=auth['zone'])
+        except BaseException:
+            with self._lock:
+                self._forget(key)
+            raise
+
+
+    def _release(self, key: tuple, conn: iRODSSession) -> None:
+        """Returns the session to the pool for reuse
+        Arguments:
+            key - the key of the connection information
+            conn - the session to return
+        """
+        expired = []
+        now = time.monotonic()
+        with self._lock:
+            # Drop expired sessions while we're here
+            for one_key, key_sessions in list(self._idle.items()):
+                keep_sessions = []
+                for one_conn, idle_ts in key_sessions:
+                    if now - idle_ts < self.idle_timeout_sec:
+                        keep_sessions.append((one_conn, idle_ts))
+                    else:
+                        expired.append((one_key, one_conn))
+                if keep_sessions:
+                    self._idle[one_key] = keep_sessions
+                else:
+                    del self._idle[one_key]
+
+            if sum(len(key_sessions) for key_sessions in self._idle.values()) < self.max_idle_sessions:
+                self._idle.setdefault(key, []).append((conn, now))
+                # Callers of every key wait on the condition, so they're all woken to check for theirs
+                self._returned.notify_all()
+                conn = None
+
+        for one_key, one_conn in expired:
+            self._discard(one_key, one_conn)
+        if conn is not None:
+            self._discard(key, conn)
+
+
+    @staticmethod
+    def _is_healthy(conn: iRODSSession, auth: dict) -> bool:
+        """Checks that the session can still talk to the server
+        Arguments:
+            conn - the session to check
+            auth - the connection information of the session
+        Returns:
+            Returns True if the session is usable and False if not
+        """
+        try:
+            conn.collections.exists('/' + auth['zone'])
+            return True
+        except Exception as ex:
+            print('Discarding iRODS session that failed its health check:', ex)
+
+        return False
+
+
+    def _forget(self, key: tuple) -> None:
+        """Stops counting a session as open and lets a waiting caller open another; the caller is expected to hold the lock
+        Arguments:
+            key - the key of the session's connection information
+        """
+        self._open[key] -= 1
+        if not self._open[key]:
+            del self._open[key]
+        self._returned.notify_all()
+
+
+    def _discard(self, key: tuple, conn: iRODSSession) -> None:
+        """Cleans up the session
+        Arguments:
+            key - the key of the session's connection information
+            conn - the session to clean up
+        """
+        with self._lock:
+            self.discarded += 1
+            self._forget(key)
+        try:
+            conn.cleanup()
+        except Exception as ex:
+            print('Ignoring exception caught while cleaning up iRODS session:', ex)
@@ -0,0 +1,124 @@
+"""Transfers files to iRODS and verifies them against the server's checksums"""
+
+import base64
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Callable
+
+import irods.keywords
+from irods.data_object import chunks
+from irods.session import iRODSSession
+
+# Prefix of iRODS checksums using SHA256; other checksums use MD5
+IRODS_SHA256_CHECKSUM_PREFIX = 'sha2:'
+
+
+def irods_checksum_hasher(server_checksum: str) -> object:
+    """Returns a hash object for the checksum scheme used by the server
+    Arguments:
+        server_checksum: the checksum stored by the server
+    Return:
+        A SHA256 hash object for checksums with the IRODS_SHA256_CHECKSUM_PREFIX prefix and a MD5 hash object otherwise
+    """
+    if server_checksum.startswith(IRODS_SHA256_CHECKSUM_PREFIX):
+        return hashlib.sha256()
+
+    return hashlib.md5()
+
+
+def irods_checksum_value(hasher: object) -> str:
+    """Returns the checksum of a hash object formatted the way the server stores it
+    Arguments:
+        hasher: the hash object returned by irods_checksum_hasher() that has been updated with the file's contents
+    """
+    if hasher.name == 'sha256':
+        return IRODS_SHA256_CHECKSUM_PREFIX + base64.b64encode(hasher.digest()).decode()
+
+    return hasher.hexdigest()
+
+
+def _hash_file(source_path: str, chunk_size: int) -> tuple:
+    """Hashes a file with both of the server's checksum schemes in one pass
+    Arguments:
+        source_path: path to the file
+        chunk_size: the number of bytes to read at a time
+    Return:
+        Returns a 2-tuple of the MD5 and SHA256 checksums formatted the way the server stores them
+    """
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    with open(source_path, 'rb') as in_file:
+        for chunk in chunks(in_file, chunk_size):
+            md5.update(chunk)
+            sha256.update(chunk)
+
+    return irods_checksum_value(md5), irods_checksum_value(sha256)
+
+
+def _stream_data_object(conn: iRODSSession, source_path: str, dest_path: str, chunk_size: int,
+                        progress_func: Callable = None) -> tuple:
+    """Streams a file to a data object, hashing it as it's sent
+    Arguments:
+        conn: the iRODS session to use
+        source_path: path to the source file
+        dest_path: path of the data object to upload to; an existing data object is replaced
+        chunk_size: the number of bytes to read and send at a time
+        progress_func: optional function called with the number of bytes sent as the file is transferred
+    Return:
+        Returns a 2-tuple of the MD5 and SHA256 checksums of the file formatted the way the server stores them
+    """
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    with open(source_path, 'rb') as in_file, conn.data_objects.open(dest_path, 'w') as out_file:
+        for chunk in chunks(in_file, chunk_size):
+            md5.update(chunk)
+            sha256.update(chunk)
+            out_file.write(chunk)
+            if progress_func is not None:
+                progress_func(len(chunk))
+
+    return irods_checksum_value(md5), irods_checksum_value(sha256)
+
+
+def put_irods_data_object(conn: iRODSSession, source_path: str, dest_path: str, chunk_size: int, retries: int,
+                          progress_func: Callable = None, parallel_min_size: int = None, num_threads: int = 0) -> bool:
+    """Uploads a file to iRODS and verifies the server's checksum of the uploaded file
+    Arguments:
+        conn: the iRODS session to use
+        source_path: path to the source file
+        dest_path: path of the data object to upload to; an existing data object is replaced
+        chunk_size: the number of bytes to read and send at a time
+        retries: the number of times to try the upload before giving up
+        progress_func: optional function called with the number of bytes sent as the file is transferred
+        parallel_min_size: the size of the smallest file that's uploaded over num_threads connections, or None to stream
+                           every file
+        num_threads: the number of connections to upload large files over
+    Return:
+        Returns True if the file was uploaded and its checksum matches, and False if not
+    Notes:
+        Small files are hashed with both of the server's checksum schemes as they're streamed, so they're only read once
+        for each try. Large files are uploaded in parts over several connections by the client while the file is
+        hashed in a single sequential pass alongside the transfer
+    """
+    parallel = parallel_min_size is not None and os.path.getsize(source_path) >= parallel_min_size
+    local_checksums = None
+
+    for cur_try in range(0, retries):
+        if not parallel:
+            local_checksums = _stream_data_object(conn, source_path, dest_path, chunk_size, progress_func)
+        else:
+            with ThreadPoolExecutor(max_workers=1) as hash_executor:
+                hashing = hash_executor.submit(_hash_file, source_path, chunk_size) if local_checksums is None else None
+                conn.data_objects.put(source_path, dest_path, num_threads=num_threads,
+                                      updatables=[progress_func] if progress_func is not None else [],
+                                      **{irods.keywords.FORCE_FLAG_KW: ''})
+                if hashing is not None:
+                    local_checksums = hashing.result()
+
+        # Have the server calculate the checksum using its own scheme
+        server_checksum = conn.data_objects.chksum(dest_path)
+        if server_checksum in local_checksums:
+            return True
+
+        print ("IRODS: attempt", (cur_try + 1), "Bad checksum on uploaded file:", dest_path)
+
+    return False
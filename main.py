@@ -6,7 +6,7 @@ import json
 import datetime
 import copy
 import os
-import fnmatch
+import functools
 import time
 import shutil
 import hashlib
@@ -16,20 +16,43 @@ import tempfile
 import traceback
 import subprocess
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional, Union
+from collections.abc import Callable
 from crypt import Crypt
 from pathlib import Path
-from irods.session import iRODSSession
 from irods.data_object import chunks
+from irods.session import iRODSSession
 import irods.exception
-from flask import Flask, make_response, render_template, request, send_file, session
+import irods.keywords
+from flask import Flask, Response, make_response, render_template, request, send_file, session
 from flask_cors import CORS, cross_origin
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import MultiDict
 from pylint import lint
 from pylint.reporters.text import TextReporter
 
+import chunked_upload
+from conditional_responses import body_conditional_response, conditional_response
+from file_cache import FileCache
+from file_staging import READ_ONLY_MOUNTS_FILE_NAME, HostLimits, StagingProgress, clone_or_copy_file, link_read_only_file, \
+                         load_read_only_mounts, stage_files
+from input_cache import InputCache
+from folder_listing import LISTING_SORT_KEYS, page_entries, scan_folder
+from irods_listing import list_irods_collection
+from irods_pool import IRODSSessionPool
+from irods_transfers import irods_checksum_hasher, irods_checksum_value, put_irods_data_object
+from run_registry import RUN_FINISHED_STATUSES, RunRegistry
+from runner_pool import RunnerPoolClient
+from session_store import SqliteSessionInterface, make_private_folder
+from stageout_queue import StageoutQueue
+from static_assets import StaticAsset, StaticAssets
+from status_file import STATUS_SEQUENCE_KEY, status_file_signature, write_status_file
+from workflow_artifacts import WORKFLOW_SAVE_FILE_NAME, artifact_response, find_artifact, load_run_workflow
 from workflow_definitions import WORKFLOW_DEFINITIONS
+from workflow_registry import WorkflowRegistry
+from workflow_scheduler import WorkflowScheduler
+from zip_stream import stream_zip
 
 def _get_additional_folders() -> Optional[dict]:
     """Returns additional user accessible folders"""
@@ -97,6 +120,24 @@ def _get_default_passcode() -> str:
     return cur_pc
 
 
+def _get_session_interface() -> Optional[SqliteSessionInterface]:
+    """Returns the server-side session store to use, or None to keep sessions in cookies"""
+    session_store = os.getenv('SESSION_STORE', 'sqlite')
+    if session_store == 'cookie':
+        return None
+    if session_store != 'sqlite':
+        print(f'Ignoring unknown session store "{session_store}" and using the default')
+
+    db_path = os.getenv('SESSION_DB_PATH')
+    if db_path is None or len(db_path) == 0:
+        # Keep the sessions in a folder of the server's user so that other users can't get at them
+        session_folder = os.path.join(tempfile.gettempdir(), f'atlana-{os.getuid()}')
+        make_private_folder(session_folder)
+        db_path = os.path.join(session_folder, 'atlana_sessions.sqlite')
+
+    return SqliteSessionInterface(db_path)
+
+
 def create_app(config_file: str = None) -> Flask:
     """Creates the Flask app to use using an optional configuration file
     Arguments:
@@ -110,6 +151,11 @@ def create_app(config_file: str = None) -> Flask:
 
     new_app.config['SECRET_KEY'] = _get_secret_key()
 
+    # Keep session values on the server so that they're not sent with every request
+    session_interface = _get_session_interface()
+    if session_interface is not None:
+        new_app.session_interface = session_interface
+
     return new_app
 
 
@@ -163,6 +209,34 @@ WORKFLOW_RUN_PATH = os.path.join(tempfile.gettempdir(), 'atlana')
 if not os.path.exists(WORKFLOW_RUN_PATH):
     os.makedirs(WORKFLOW_RUN_PATH, exist_ok=True)
 
+# Registry of workflow runs, kept with the running workflows
+RUN_REGISTRY_PATH = os.path.join(WORKFLOW_RUN_PATH, 'runs.sqlite')
+RUN_REGISTRY = RunRegistry(RUN_REGISTRY_PATH)
+
+# Maximum number of workflows run at the same time by all the server's processes; when zero, it's based on the
+# available cores
+WORKFLOW_MAX_RUNNING = int(os.getenv('WORKFLOW_MAX_RUNNING', '0'))
+
+# Number of cores each running workflow is expected to keep busy
+WORKFLOW_CORES_PER_RUN = float(os.getenv('WORKFLOW_CORES_PER_RUN', '2'))
+
+# Megabytes of memory each running workflow is expected to use; queued workflows wait while less memory is available
+WORKFLOW_MEMORY_PER_RUN_MB = int(os.getenv('WORKFLOW_MEMORY_PER_RUN_MB', '2048'))
+
+# Number of seconds between checks for finished workflows and queued workflows that can be run
+WORKFLOW_SCHEDULER_POLL_SEC = 2
+
+# Highest priority a workflow can be started with; the lowest is its negative
+WORKFLOW_MAX_PRIORITY = 10
+
+# Folder for cached input files; it needs to be on the same file system as the running workflows for files to be shared
+INPUT_CACHE_PATH = os.getenv('INPUT_CACHE_FOLDER')
+if INPUT_CACHE_PATH is None:
+    INPUT_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'atlana_cache')
+
+# Maximum number of bytes of cached input files; zero disables the cache
+INPUT_CACHE_MAX_BYTES = int(os.getenv('INPUT_CACHE_MAX_BYTES', str(20 * 1024 * 1024 * 1024)))
+
 # Starting point for code checking files
 CODE_CHECKING_PATH = os.getenv('CODE_CHECK_FOLDER')
 if CODE_CHECKING_PATH is None:
@@ -199,18 +273,95 @@ STATUS_FINISHED = 2
 # Number of tries to download from iRODS before giving up
 IRODS_DOWNLOAD_RETRIES = 2
 
-# Number of times to try to access queue status; should not exceed delays defined in FILE_PROCESS_QUEUE_STATUS_TIMEOUTS
-FILE_PROCESS_QUEUE_STATUS_RETRIES = 3
+# Number of tries to upload to iRODS before giving up
+IRODS_UPLOAD_RETRIES = 2
+
+# Number of threads used to transfer large iRODS data objects
+IRODS_TRANSFER_THREADS = 4
+
+# Number of bytes read at a time when transferring iRODS data objects
+IRODS_TRANSFER_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Size of the smallest file that's uploaded to iRODS over IRODS_TRANSFER_THREADS connections; smaller files are streamed
+IRODS_PARALLEL_UPLOAD_MIN_SIZE = 32 * 1024 * 1024
+
+# Cache of fetched iRODS files
+INPUT_CACHE = InputCache(INPUT_CACHE_PATH, INPUT_CACHE_MAX_BYTES) if INPUT_CACHE_MAX_BYTES > 0 else None
+
+# Maximum number of input files staged at the same time across all workflows
+STAGING_MAX_WORKERS = 8
+
+# Maximum number of input files staged from the same host at the same time
+STAGING_MAX_PER_HOST = 4
+
+# Minimum number of seconds between updates of the staging progress
+STAGING_PROGRESS_INTERVAL_SEC = 1.0
+
+# Runs the staging of input files
+STAGING_EXECUTOR = ThreadPoolExecutor(max_workers=STAGING_MAX_WORKERS, thread_name_prefix='staging')
+
+# Limits on the number of files staged from each host
+STAGING_HOST_LIMITS = HostLimits(STAGING_MAX_PER_HOST)
+
+# Maximum number of workflows having their input files staged at the same time; the files of each are fetched on
+# STAGING_EXECUTOR
+WORKFLOW_START_MAX_WORKERS = 4
+
+# Runs the staging and starting of workflows in the background so that starting requests return immediately
+WORKFLOW_START_EXECUTOR = ThreadPoolExecutor(max_workers=WORKFLOW_START_MAX_WORKERS, thread_name_prefix='workflow-start')
+
+# Maximum number of workflows having their results uploaded at the same time
+STAGEOUT_MAX_WORKERS = 4
+
+# Name of the file in a workflow's folder with the status of uploading its results
+STAGEOUT_FILE_NAME = 'stageout.json'
+
+# Runs the uploads of workflow results; kept separate from staging so that new workflows aren't held up
+STAGEOUT_EXECUTOR = ThreadPoolExecutor(max_workers=STAGEOUT_MAX_WORKERS, thread_name_prefix='stageout')
+
+# Names of the workflow files used to run workflows that aren't included in archives of the results
+WORKFLOW_ARCHIVE_EXCLUDED_NAMES = ('queue', '_params', WORKFLOW_SAVE_FILE_NAME, READ_ONLY_MOUNTS_FILE_NAME, STAGEOUT_FILE_NAME)
+
+# Workflows run in containers have read-only files mounted; otherwise they're linked
+STAGING_MOUNT_READ_ONLY_FILES = 'ATLANA_USE_SCIF_WORKFLOW' not in os.environ
+
+# Maximum number of idle iRODS sessions kept for reuse
+IRODS_POOL_MAX_IDLE_SESSIONS = 16
+
+# Number of seconds an iRODS session can be idle before it's closed
+IRODS_POOL_IDLE_TIMEOUT_SEC = 600
+
+# Number of seconds an iRODS session can be idle before it's checked before being reused
+IRODS_POOL_HEALTH_CHECK_SEC = 60
+
+# Maximum number of iRODS sessions open at the same time for the same account; later requests wait for one
+IRODS_POOL_MAX_SESSIONS_PER_ACCOUNT = 16
+
+# Maximum number of seconds to wait for an iRODS session when an account has the maximum number open
+IRODS_POOL_WAIT_TIMEOUT_SEC = 120
+
+# Reusable iRODS sessions
+IRODS_SESSION_POOL = IRODSSessionPool(IRODS_POOL_MAX_IDLE_SESSIONS, IRODS_POOL_IDLE_TIMEOUT_SEC, IRODS_POOL_HEALTH_CHECK_SEC,
+                                      IRODS_POOL_MAX_SESSIONS_PER_ACCOUNT, IRODS_POOL_WAIT_TIMEOUT_SEC)
 
 # Number of times to try to access queue status; should not exceed delays defined in FILE_PROCESS_QUEUE_MESSAGE_TIMEOUTS
 FILE_PROCESS_QUEUE_MESSAGES_RETRIES = 3
 
-# Delay times to access the queue status before giving up
-FILE_PROCESS_QUEUE_STATUS_TIMEOUTS = [0.1, 0.2, 0.4, 0.7]
-
 # Delay times to a access the queue messages before giving up
 FILE_PROCESS_QUEUE_MESSAGE_TIMEOUTS = [0.1, 0.2, 0.1, 0.2, 0.4]
 
+# Number of seconds a log file needs to be unchanged before a trailing partial line is returned
+LOG_PARTIAL_LINE_QUIET_SEC = 2.0
+
+# Number of seconds between checks for changes when streaming workflow events
+WORKFLOW_STREAM_POLL_SEC = 0.5
+
+# Number of seconds between keep-alive comments when streaming workflow events with no changes
+WORKFLOW_STREAM_HEARTBEAT_SEC = 15
+
+# Maximum number of seconds a workflow event stream is kept open before the client needs to reconnect
+WORKFLOW_STREAM_MAX_SEC = 300
+
 # The current version of the workflow save file
 CURRENT_WORKFLOW_SAVE_VERSION = '1.0'
 
@@ -229,6 +380,37 @@ WORKFLOW_DEFINITION_SAVE_VERSIONS_SUPPORTED = [CURRENT_WORKFLOW_DEFINITION_SAVE_
 # Maximum code length acccepted
 MAX_CODE_LENGTH = 30 * 1024
 
+# Maximum number of parsed status files of running workflows to keep
+STATUS_CACHE_MAX_ENTRIES = 1000
+
+# Maximum number of parsed status files of finished workflows to keep; they're kept apart from running workflows
+STATUS_CACHE_MAX_FINISHED_ENTRIES = 10000
+
+# Parsed workflow status files
+PARSED_STATUS_CACHE = FileCache(STATUS_CACHE_MAX_ENTRIES, max_pinned=STATUS_CACHE_MAX_FINISHED_ENTRIES)
+
+# Maximum number of folder entries, across all cached folders, to keep for listing folders
+LISTING_CACHE_MAX_ENTRIES = 200000
+
+# Maximum number of seconds to use cached folder entries; files changing in place don't change their folder
+LISTING_CACHE_MAX_AGE_SEC = 60
+
+# Cached folder entries for listing folders
+FOLDER_LISTING_CACHE = FileCache(LISTING_CACHE_MAX_ENTRIES, len)
+
+# Known workflow definitions, including ones added while running
+WORKFLOW_REGISTRY = WorkflowRegistry(WORKFLOW_DEFINITIONS)
+
+# Largest static asset, or encoded variant of one, to hold in memory
+STATIC_ASSET_MAX_MEMORY_SIZE = 2 * 1024 * 1024
+
+# Number of seconds browsers can cache static assets with hashed names
+STATIC_ASSET_IMMUTABLE_MAX_AGE_SEC = 365 * 24 * 60 * 60
+
+# Index of the static assets, loaded at startup
+STATIC_ASSETS = StaticAssets(RESOURCE_START_PATH, STATIC_ASSET_MAX_MEMORY_SIZE)
+STATIC_ASSETS.load()
+
 
 def _clean_for_json(dirty: object) -> dict:
     """Cleans the dictionary of non-JSON compatible elements
@@ -482,14 +664,21 @@ def normalize_path(path: str) -> str:
     return os.path.sep.join(new_parts)
 
 
-def copy_server_file(auth: dict, source_path: str, dest_path: str) -> bool:
-    """Copies the server side file to the specified location
+def copy_server_file(auth: dict, source_path: str, dest_path: str, progress_func: Callable = None,
+                     upload_folder: str = None) -> bool:
+    """Makes the server side file available at the specified location
     Arguments:
         auth: authorization information
         source_path: path to the file to copy
         dest_path: path to copy the file to
+        progress_func: optional function called with the number of bytes copied
+        upload_folder: the upload folder that source paths are relative to; the session's upload folder is used by default
     Exceptions:
         RuntimeError is raised if the path to copy from is not in the correct top folder
+    Notes:
+        Files in the ADDITIONAL_LOCAL_FOLDERS are treated as read-only and are mounted into the workflow's containers, or
+        linked to when workflows aren't run in containers. Other files are linked or cloned when possible and are only
+        copied as a last resort
     """
     # pylint: disable=unused-argument
     working_path = normalize_path(source_path)
@@ -499,16 +688,26 @@ def copy_server_file(auth: dict, source_path: str, dest_path: str) -> bool:
         dir_name = Path(working_path).parts[1]
         if ADDITIONAL_LOCAL_FOLDERS and dir_name in ADDITIONAL_LOCAL_FOLDERS:
             cur_path = os.path.join(ADDITIONAL_LOCAL_FOLDERS[dir_name], working_path[len(dir_name) + 2:])
-            shutil.copyfile (cur_path, dest_path)
+            if not os.path.isfile(cur_path):
+                raise RuntimeError("Invalid source file for server side copy:", cur_path)
+            method = link_read_only_file(cur_path, dest_path, STAGING_MOUNT_READ_ONLY_FILES)
+            print("Staged server side file using", method, cur_path, dest_path)
+            if progress_func is not None:
+                progress_func(os.path.getsize(cur_path))
             return True
 
+    if upload_folder is None:
+        upload_folder = session['upload_folder']
     if working_path[0] == '/':
         working_path = '.'  + working_path
-    cur_path = os.path.abspath(os.path.join(session['upload_folder'], working_path))
-    if not cur_path.startswith(session['upload_folder']):
+    cur_path = os.path.abspath(os.path.join(upload_folder, working_path))
+    if not cur_path.startswith(upload_folder):
         raise RuntimeError("Invalid source path for server side copy:", cur_path)
 
-    shutil.copyfile (cur_path, dest_path)
+    method = clone_or_copy_file(cur_path, dest_path)
+    print("Staged server side file using", method, cur_path, dest_path)
+    if progress_func is not None:
+        progress_func(os.path.getsize(dest_path))
     return True
 
 
@@ -527,49 +726,136 @@ def irods_sha256_checksum(file_path: str, block_size: int=65536) -> str:
     return base64.b64encode(sha256.digest()).decode()
 
 
-def irod_md5_checksum(file_path: str) -> str:
+def irod_md5_checksum(file_path: str, block_size: int=65536) -> str:
     """Calcualtes the IRODS MD5 checksum for a file
     Arguments:
         file_path: the path of the file to calculate the checksum  for
+        block_size: the size of the blocks to read in
     Return:
         The checksum as a string
     """
+    md5 = hashlib.md5()
     with open(file_path, 'rb') as in_file:
-        return hashlib.md5(in_file.read()).hexdigest()
+        for chunk in chunks(in_file, block_size):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _get_irods_checksum_replica(obj: object) -> Optional[object]:
+    """Returns the replica of a data object to download and verify
+    Arguments:
+        obj: the data object
+    Return:
+        Returns the first good replica that has a checksum, or None if there isn't one
+    """
+    for one_replica in obj.replicas:
+        if getattr(one_replica, 'checksum', None) and str(one_replica.status) == '1':
+            return one_replica
+
+    return None
 
 
-def get_irods_file(auth: dict, source_path: str, dest_path: str) -> bool:
+def _download_irods_replica(conn: iRODSSession, source_path: str, replica: object, dest_path: str,
+                            progress_func: Callable = None) -> bool:
+    """Downloads a replica of a data object, checking the checksum as the file is received
+    Arguments:
+        conn: the iRODS session to use
+        source_path: path to the file to pull down
+        replica: the replica to download; it needs to have a checksum
+        dest_path: path to the destination file
+        progress_func: optional function called with the number of bytes received as the file is transferred
+    Return:
+        Returns True if the downloaded file matches the replica's checksum and False if not
+    """
+    hasher = irods_checksum_hasher(replica.checksum)
+    with conn.data_objects.open(source_path, 'r', **{irods.keywords.REPL_NUM_KW: str(replica.number)}) as in_file, \
+         open(dest_path, 'wb') as out_file:
+        for chunk in chunks(in_file, IRODS_TRANSFER_CHUNK_SIZE):
+            hasher.update(chunk)
+            out_file.write(chunk)
+            if progress_func is not None:
+                progress_func(len(chunk))
+
+    return irods_checksum_value(hasher) == replica.checksum
+
+
+def get_irods_file(auth: dict, source_path: str, dest_path: str, progress_func: Callable = None) -> bool:
     """Fetches the iRODS file to the specified location on the local Machine
     Arguments:
         auth: authorization information
         source_path: path to the file to pull down
         dest_path: path to the destination file
+        progress_func: optional function called with the number of bytes received as the file is transferred
+    Notes:
+        When the server has a checksum for the file, the file is hashed as it's received using the server's checksum
+        scheme and compared to the server's checksum. Files without a checksum can't be verified and large ones are
+        transferred over IRODS_TRANSFER_THREADS connections instead.
+        Files with a checksum are kept in INPUT_CACHE when it's enabled, and later requests for the same file are linked
+        to the cached copy
     """
     have_success = False
 
     for cur_try in range(0, IRODS_DOWNLOAD_RETRIES):
-        with iRODSSession(host=auth['host'], port=auth['port'], user=auth['user'], password=auth['password'], zone=auth['zone']) as conn:
-            obj = conn.data_objects.get(source_path, dest_path)
-            # Check the checksums
-            # TODO: determine which checksum method the server uses (depending upon file size it may be faster to try both methods?)
-            local_checksum = irod_md5_checksum(dest_path)
-            if local_checksum == obj.checksum:      # pylint: disable=no-member
+        with IRODS_SESSION_POOL.session(auth) as conn:
+            obj = conn.data_objects.get(source_path)
+            replica = _get_irods_checksum_replica(obj)
+            if replica is None:
+                print("IRODS: no checksum available to verify downloaded file:", source_path)
+                conn.data_objects.get(source_path, dest_path, num_threads=IRODS_TRANSFER_THREADS,
+                                      updatables=[progress_func] if progress_func is not None else [],
+                                      **{irods.keywords.FORCE_FLAG_KW: ''})
                 have_success = True
                 break
 
+            # Check the checksum as the file is received
+            if INPUT_CACHE is not None:
+                have_success = INPUT_CACHE.fetch(source_path, replica.checksum, replica.size, dest_path,
+                                                 functools.partial(_download_irods_replica, conn, source_path, replica,
+                                                                   progress_func=progress_func))
+            else:
+                have_success = _download_irods_replica(conn, source_path, replica, dest_path, progress_func)
+            if have_success:
+                break
+
             print ("IRODS: attempt", (cur_try + 1), "Bad checksum on downloaded file:", source_path)
 
     return have_success
 
 
-def put_irods_file(auth: dict, source_path: str, dest_path: str) -> bool:
+def put_irods_file(auth: dict, source_path: str, dest_path: str, progress_func: Callable = None) -> bool:
     """Uploads the file to iRODS
     Arguments:
         auth: authorization information
-        source_path: path to the source file
+        source_path: path to the source file or folder
         dest_path: path to upload the file to
+        progress_func: optional function called with the number of bytes sent as the file is transferred
+    Return:
+        Returns True if everything was uploaded and verified, and False if not
+    Notes:
+        Folders are uploaded with their sub-folders, creating any missing collections. Small files are checksummed as
+        they're sent, and large files are uploaded over IRODS_TRANSFER_THREADS connections while they're checksummed.
+        The checksum is compared to the one the server calculates for the uploaded file
     """
-    raise RuntimeError("iRODS put is not implemented")
+    have_success = True
+
+    with IRODS_SESSION_POOL.session(auth) as conn:
+        if not os.path.isdir(source_path):
+            return put_irods_data_object(conn, source_path, dest_path, IRODS_TRANSFER_CHUNK_SIZE, IRODS_UPLOAD_RETRIES,
+                                         progress_func, IRODS_PARALLEL_UPLOAD_MIN_SIZE, IRODS_TRANSFER_THREADS)
+
+        for dir_path, dir_names, file_names in os.walk(source_path):
+            dir_names.sort()
+            rel_path = os.path.relpath(dir_path, source_path)
+            cur_collection = dest_path.rstrip('/') if rel_path == '.' else dest_path.rstrip('/') + '/' + rel_path.replace(os.sep, '/')
+            conn.collections.create(cur_collection)
+
+            for one_name in sorted(file_names):
+                if not put_irods_data_object(conn, os.path.join(dir_path, one_name), cur_collection + '/' + one_name,
+                                             IRODS_TRANSFER_CHUNK_SIZE, IRODS_UPLOAD_RETRIES, progress_func,
+                                             IRODS_PARALLEL_UPLOAD_MIN_SIZE, IRODS_TRANSFER_THREADS):
+                    have_success = False
+
+    return have_success
 
 
 FILE_HANDLERS = {
@@ -585,6 +871,23 @@ FILE_HANDLERS = {
     }
 }
 
+def _write_json_file_atomic(file_path: str, data: object) -> None:
+    """Writes the JSON to a temporary file and then renames it to the file so that readers never see a partial file
+    Arguments:
+        file_path: the path to the file to write
+        data: the data to write as JSON
+    """
+    temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix='.' + os.path.basename(file_path) + '.')
+    try:
+        with os.fdopen(temp_fd, 'w', encoding='utf8') as out_file:
+            json.dump(data, out_file, indent=2)
+        os.replace(temp_path, file_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
 def get_queue_path(working_folder: str) -> str:
     """ Gets the path to the working queue
     Arguments:
@@ -628,47 +931,115 @@ def queue_start(workflow_id: str, working_folder: str, recover: bool) -> dict:
                 pass
 
             if starting_queue:
-                os.unlink(starting_queue)
+                os.unlink(queue_path)
                 # TODO: Signal cleanup
                 cleanup = True
 
         # Begin the starting queue
-        with open(queue_path, 'w', encoding='utf8') as out_file:
-            json.dump([], out_file)
+        _write_json_file_atomic(queue_path, [])
 
     return {'recover': recover, 'cleanup': cleanup}
 
 
-def queue_one_process(workflow_id: str, cur_command: dict, working_folder: str, process_info: dict):
-    """Handles queueing one command
+def _get_staging_host(parameter: dict) -> str:
+    """Returns the name of the host a file parameter is staged from
     Arguments:
-        workflow_id: the  workflow ID
-        cur_command: the command to queue
-        working_folder: string representing the working folder
-        process_info: dictionary returned by starting process call
+        parameter: the file parameter
+    Return:
+        Returns the host of the parameter's connection information, or the name of its file handler if there isn't a host
     """
-    print("Current command ", cur_command['step'], " with working folder '", cur_command['working_folder'], "'", cur_command)
+    if isinstance(parameter.get('auth'), dict) and parameter['auth'].get('host'):
+        return parameter['auth']['host']
 
-    print("    Checking for files")
-    for one_parameter in cur_command['parameters']:
-        print("    ", one_parameter)
-        # Skip over special cases
-        if 'visibility' in one_parameter and one_parameter['visibility'] == 'server':
-            continue
+    return parameter.get('name', 'local')
+
+
+def _write_staging_status(status_path: str, progress: dict) -> None:
+    """Writes the staging progress to the workflow status file
+    Arguments:
+        status_path: the path to the status file
+        progress: the progress returned by StagingProgress.summary()
+    """
+    msg = f'Staging input files: {progress["files_done"]} of {progress["files_total"]} complete ' \
+          f'({progress["bytes_done"] / (1024 * 1024):.1f} MB)'
+    write_status_file(status_path, {'starting': {'message': msg}})
+
+
+def stage_workflow_files(workflow_id: str, workflow: list, working_folder: str, upload_folder: str) -> None:
+    """Fetches the input files of all the workflow steps
+    Arguments:
+        workflow_id: the workflow ID
+        workflow: the list of workflow steps
+        working_folder: string representing the working folder
+        upload_folder: the upload folder of the session that started the workflow, for fetching server side files
+    Notes:
+        The files are fetched concurrently on STAGING_EXECUTOR with at most STAGING_MAX_PER_HOST files being fetched from
+        the same host at a time. The aggregate progress is written to the workflow status file. The parameter values are
+        updated to the paths of the fetched files
+    """
+    print("Staging files for workflow", workflow_id)
+
+    # Files with the same destination are only fetched once; the last one wins as when the files were fetched one at a time
+    staged_files = {}
+    staged_parameters = []
+    for cur_command in workflow:
+        for one_parameter in cur_command['parameters']:
+            print("    ", one_parameter)
+            # Skip over special cases
+            if 'visibility' in one_parameter and one_parameter['visibility'] == 'server':
+                continue
+            if one_parameter['type'] != 'file':
+                continue
 
-        # Handle downloading files
-        if one_parameter['type'] == 'file':
             # Check for missing optional files
             if not one_parameter['value'] and 'mandatory' in one_parameter and one_parameter['mandatory'] is False:
                 print('    Skipping missing non-mandatory file', one_parameter)
                 continue
 
-            # Copy mandatory file
             dest_path = os.path.join(cur_command['working_folder'], os.path.basename(one_parameter['value']))
-            print("Downloading file '", one_parameter['value'], "' to '", dest_path, "'")
-            print("    one_parameter: '", one_parameter)
-            one_parameter['getFile'](one_parameter['auth'], one_parameter['value'], dest_path)
-            one_parameter['value'] = dest_path
+            staged_files[dest_path] = one_parameter
+            staged_parameters.append((one_parameter, dest_path))
+
+    transfers = []
+    for dest_path, one_parameter in staged_files.items():
+        print("Downloading file '", one_parameter['value'], "' to '", dest_path, "'")
+
+        # Files are staged outside of the request starting the workflow, so server side files need the upload folder
+        get_file = one_parameter['getFile']
+        if get_file is copy_server_file:
+            get_file = functools.partial(copy_server_file, upload_folder=upload_folder)
+
+        def transfer_func(progress_func: Callable, parameter: dict = one_parameter, dest_path: str = dest_path,
+                          get_file: Callable = get_file) -> bool:
+            return get_file(parameter['auth'], parameter['value'], dest_path, progress_func=progress_func)
+
+        transfers.append((_get_staging_host(one_parameter), transfer_func))
+
+    if transfers:
+        status_path = os.path.join(working_folder, 'status.json')
+        progress = StagingProgress(len(transfers), lambda summary: _write_staging_status(status_path, summary),
+                                   STAGING_PROGRESS_INTERVAL_SEC)
+        results = stage_files(transfers, STAGING_EXECUTOR, STAGING_HOST_LIMITS, progress)
+        for one_result, dest_path in zip(results, staged_files):
+            if one_result is False:
+                print("Unable to successfully fetch file for workflow", workflow_id, dest_path)
+        print("Staged files for workflow", workflow_id, progress.summary())
+
+    for one_parameter, dest_path in staged_parameters:
+        one_parameter['value'] = dest_path
+
+
+def queue_one_process(workflow_id: str, cur_command: dict, working_folder: str, process_info: dict):
+    """Handles queueing one command
+    Arguments:
+        workflow_id: the  workflow ID
+        cur_command: the command to queue
+        working_folder: string representing the working folder
+        process_info: dictionary returned by starting process call
+    Notes:
+        The command's input files are expected to have been fetched by stage_workflow_files()
+    """
+    print("Current command ", cur_command['step'], " with working folder '", cur_command['working_folder'], "'", cur_command)
 
     print("Run workflow step", workflow_id, cur_command['step'], cur_command['command'])
     queue_path = get_queue_path(working_folder)
@@ -684,8 +1055,7 @@ def queue_one_process(workflow_id: str, cur_command: dict, working_folder: str,
     current_workflow.append(_clean_for_json(cur_command))
 
     print("Current workflow: ", current_workflow)
-    with open(queue_path, 'w', encoding='utf8') as out_file:
-        json.dump(current_workflow, out_file, indent=2)
+    _write_json_file_atomic(queue_path, current_workflow)
 
 
 def queue_finish(workflow_id: str, working_folder: str, process_info: dict):
@@ -696,14 +1066,150 @@ def queue_finish(workflow_id: str, working_folder: str, process_info: dict):
         process_info: dictionary returned by starting process call
     """
     # pylint: disable=unused-argument
-    workflow_script = os.path.join(OUR_LOCAL_PATH, 'workflow_runner.py')
-    print("Finished queueing", workflow_id, working_folder, workflow_script)
-    cmd = ['python3', workflow_script, working_folder]
-    # Deliberately let the command run
-    # pylint: disable=consider-using-with
-    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    print("Finished queueing", workflow_id, working_folder)
+    RUN_REGISTRY.queue_run(workflow_id)
+    WORKFLOW_SCHEDULER.schedule()
+
+
+def launch_workflow_runner(workflow_id: str) -> int:
+    """Starts the workflow runner of a queued workflow
+    Arguments:
+        workflow_id: the ID of the workflow
+    Return:
+        Returns the ID of the process running the workflow
+    """
+    return RUNNER_POOL.start_run(os.path.join(WORKFLOW_RUN_PATH, workflow_id))
+
+
+def reap_workflow_runners() -> None:
+    """Waits on the finished workflow runner processes started by this server process and starts uploading the results
+    of the finished workflows"""
+    RUNNER_POOL.reap()
+    STAGEOUT_QUEUE.submit_finished()
+
+
+def write_workflow_status(workflow_id: str, status: dict) -> None:
+    """Writes the status of a workflow that isn't being run by its workflow runner
+    Arguments:
+        workflow_id: the ID of the workflow
+        status: the status to write
+    """
+    working_folder = os.path.join(WORKFLOW_RUN_PATH, workflow_id)
+    if os.path.isdir(working_folder):
+        write_status_file(os.path.join(working_folder, 'status.json'), status)
+
+
+def read_workflow_completion(workflow_id: str) -> Optional[dict]:
+    """Returns the completion written to a workflow's status file
+    Arguments:
+        workflow_id: the ID of the workflow
+    Return:
+        Returns the completion, or None if the workflow hasn't finished
+    """
+    cur_status = _load_status_file(os.path.join(WORKFLOW_RUN_PATH, workflow_id, 'status.json'))
+    if not cur_status or not isinstance(cur_status.get('completion'), dict):
+        return None
+    return cur_status['completion']
+
+
+# Runs queued workflows when there's room for them; the limits are shared by all the server's processes
+WORKFLOW_SCHEDULER = WorkflowScheduler(RUN_REGISTRY, launch_workflow_runner, write_workflow_status, WORKFLOW_MAX_RUNNING,
+                                       WORKFLOW_CORES_PER_RUN, WORKFLOW_MEMORY_PER_RUN_MB, WORKFLOW_SCHEDULER_POLL_SEC,
+                                       reap_workflow_runners, read_workflow_completion)
+
+# Number of workflow runner processes kept ready to run workflows; by default there's one for each workflow that can be
+# run at the same time. When zero, each workflow is run in a new process
+WORKFLOW_RUNNER_POOL_SIZE = int(os.getenv('WORKFLOW_RUNNER_POOL_SIZE', str(WORKFLOW_SCHEDULER.max_running)))
+
+# Unix socket the workflow runner pool listens on; the pool is shared by all the server's processes
+WORKFLOW_RUNNER_POOL_SOCKET = os.path.join(WORKFLOW_RUN_PATH, 'runner_pool.sock')
+
+# Starts workflow runners in the pool, falling back to new processes when the pool can't run them
+RUNNER_POOL = RunnerPoolClient(WORKFLOW_RUNNER_POOL_SOCKET, WORKFLOW_RUNNER_POOL_SIZE, RUN_REGISTRY_PATH, OUR_LOCAL_PATH)
+
+
+def start_workflow_services(server_pid: int) -> None:
+    """Starts the workflow runner pool and the scheduling of workflows in this server process
+    Arguments:
+        server_pid: the ID of the server process the runner pool stops with
+    Notes:
+        Called once the server process that handles requests is running, instead of when this module is imported, so
+        that the scheduler's thread isn't lost to a fork and importing the module doesn't start any processes
+    """
+    RUNNER_POOL.start_pool(server_pid)
+    WORKFLOW_SCHEDULER.start()
+
+
+def _get_file_signature(file_path: str) -> Optional[tuple]:
+    """Returns a value that changes when the file is written to
+    Arguments:
+        file_path: the path to the file
+    Return:
+        Returns a tuple of the modification time and size of the file, or None if the file doesn't exist
+    """
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def _load_status_file(status_path: str) -> Optional[dict]:
+    """Returns the contents of a workflow's status file
+    Arguments:
+        status_path: the path to the status file
+    Return:
+        Returns the status including its sequence number, None if the status file doesn't exist, or an empty dict if it
+        can't be loaded
+    """
+    status_signature = status_file_signature(status_path)
+    if status_signature is None:
+        return None
 
-    print("PROC: ", cmd, proc.pid)
+    # Use the previously loaded status if the file hasn't changed
+    cur_status = PARSED_STATUS_CACHE.get(status_path, status_signature)
+    if cur_status is not None:
+        return cur_status
+
+    # The status file is replaced in one step by the runner so there's no need to retry reading it
+    cur_status = None
+    try:
+        with open(status_path, 'r', encoding='utf8') as in_file:
+            file_stat = os.fstat(in_file.fileno())
+            status_signature = (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+            cur_status = json.load(in_file)
+    except json.JSONDecodeError as ex:
+        print("A JSON decode error was caught while loading status information", ex)
+    except OSError as ex:
+        msg = f'An OS exception was caught while trying to open status file "{status_path}"'
+        print(msg, ex)
+    except Exception as ex:
+        msg = f'Unknown exception caught while trying to access the status file "{status_path}"'
+        print(msg, ex)
+
+    if not isinstance(cur_status, dict):
+        return {}
+
+    PARSED_STATUS_CACHE.put(status_path, status_signature, cur_status, pinned='completion' in cur_status)
+    return cur_status
+
+
+def _get_status_version(working_folder: str) -> Optional[tuple]:
+    """Returns a value that changes each time the status of a workflow is written
+    Arguments:
+        working_folder: the working folder for the workflow
+    Return:
+        Returns a tuple of the inode and sequence number of the status file, or None if the workflow isn't started
+    """
+    status_path = os.path.join(working_folder, 'status.json')
+    cur_status = _load_status_file(status_path)
+    if cur_status is None:
+        return None
+
+    # A status file that's replaced by a new run of the workflow starts its sequence again
+    status_signature = status_file_signature(status_path)
+    return (status_signature[0] if status_signature is not None else None, cur_status.get(STATUS_SEQUENCE_KEY))
 
 
 def queue_status(workflow_id: str, working_folder: str) -> Union[dict, str, None]:
@@ -717,97 +1223,96 @@ def queue_status(workflow_id: str, working_folder: str) -> Union[dict, str, None
         returned if the real status can't be obtained
     """
     print("Checking queue status", workflow_id, working_folder)
-    status_path = os.path.join(working_folder, 'status.json')
-    if not os.path.exists(status_path):
+    cur_status = _load_status_file(os.path.join(working_folder, 'status.json'))
+    if cur_status is None:
         return None
+    if not cur_status:
+        return {'status': 'Pending...'}
 
-    cur_status = None
-    caught_exception = False
-    for one_attempt in range(0, FILE_PROCESS_QUEUE_STATUS_RETRIES):
-        caught_exception = True
+    if 'completion' in cur_status:
+        return cur_status['completion']
+
+    return {key: value for key, value in cur_status.items() if key != STATUS_SEQUENCE_KEY}
+
+
+def _read_log_file(file_path: str, offset: Optional[int] = None) -> tuple:
+    """Reads the complete lines of a log file starting at an optional byte offset
+    Arguments:
+        file_path: the path of the file to read
+        offset: the byte offset to start reading from; the whole file is read when None
+    Return:
+        A 2-tuple of the list of lines read and the byte offset to pass in on the next read. None is returned for the
+        list of lines if the file couldn't be read
+    Notes:
+        A trailing partial line is held back until it's completed, or until the file hasn't been written to for
+        LOG_PARTIAL_LINE_QUIET_SEC seconds. If the offset is past the end of the file (the file was rewritten) the file
+        is read from the beginning
+    """
+    lines = None
+    next_offset = offset if offset is not None else 0
+
+    for one_attempt in range(0, FILE_PROCESS_QUEUE_MESSAGES_RETRIES):
         try:
-            with open(status_path, 'r', encoding='utf8') as in_file:
-                try:
-                    cur_status = json.load(in_file)
-                    caught_exception = False
-                except json.JSONDecodeError as ex:
-                    print("A JSON decode error was caught while loading status information", ex)
-                except Exception as ex:
-                    print("An unknown exception was caught while checking workflow status", ex)
+            with open(file_path, 'rb') as in_file:
+                file_stat = os.fstat(in_file.fileno())
+                start_offset = offset if offset is not None and offset <= file_stat.st_size else 0
+                in_file.seek(start_offset)
+                data = in_file.read(file_stat.st_size - start_offset)
+
+            # Hold back any partial line unless the writer appears to be done with it
+            end_index = data.rfind(b'\n') + 1
+            if end_index < len(data) and time.time() - file_stat.st_mtime >= LOG_PARTIAL_LINE_QUIET_SEC:
+                end_index = len(data)
+
+            lines = data[:end_index].decode('utf8', errors='replace').splitlines(keepends=True)
+            next_offset = start_offset + end_index
         except OSError as ex:
-            msg = f'An OS exception was caught while trying to open status file "{status_path}"'
+            msg = f'An OS exception was caught while trying to read log file "{file_path}"'
             print(msg, ex)
         except Exception as ex:
-            msg = f'Unknown exception caught while trying to access the status file "{status_path}"'
+            msg = f'An unknown exception was caught while trying to read log file "{file_path}"'
             print(msg, ex)
 
-        if cur_status is None:
-            print("Sleeping before trying to get status again")
-            time.sleep(FILE_PROCESS_QUEUE_STATUS_TIMEOUTS[one_attempt])
+        if lines is None:
+            msg = f'Sleeping {one_attempt} before trying to read log file again "{file_path}"'
+            print(msg)
+            time.sleep(FILE_PROCESS_QUEUE_MESSAGE_TIMEOUTS[one_attempt])
         else:
             break
 
-    if cur_status and 'completion' in cur_status:
-        cur_status = cur_status['completion']
-
-    return cur_status if not caught_exception else {'status': 'Pending...'}
+    return lines, next_offset
 
 
-def queue_messages(workflow_id: str, working_folder: str) -> tuple:
+def queue_messages(workflow_id: str, working_folder: str, cursors: dict = None) -> tuple:
     """Reurns the messages of the workflow
     Arguments:
         workflow_id: the ID of the current workflow
         working_folder: the working folder for the workflow
+        cursors: optional dict of 'messages' and 'errors' byte offsets returned by a previous call; only the lines written
+                 after an offset are returned. All the lines are returned for a missing offset
     Return:
-        A 2-tuple of: normal messages and error messages as separate lists. None is returned if the messages can't be loaded
+        A 3-tuple of: normal messages and error messages as separate lists, and a dict of the cursors to use for the next
+        call. None is returned for the messages or errors if they can't be loaded
     """
     messages, errors = None, None
-    print("Checking queue messages", workflow_id, working_folder)
+    if cursors is None:
+        cursors = {}
+    next_cursors = {'messages': cursors.get('messages', 0), 'errors': cursors.get('errors', 0)}
+    print("Checking queue messages", workflow_id, working_folder, cursors)
 
     cur_path = os.path.join(working_folder, 'messages.txt')
     if os.path.exists(cur_path):
-        for one_attempt in range(0, FILE_PROCESS_QUEUE_STATUS_RETRIES):
-            try:
-                with open(cur_path, 'r', encoding='utf8') as in_file:
-                    messages = in_file.readlines()
-            except OSError as ex:
-                msg = f'An OS exception was caught while trying to read output file "{cur_path}"'
-                print(msg, ex)
-            except Exception as ex:
-                msg = f'An unknown exception was caught while trying to read output file "{cur_path}"'
-                print(msg, ex)
-
-            if messages is None:
-                msg = f'Sleeping {one_attempt} before trying to get messages again "{cur_path}"'
-                print(msg)
-                time.sleep(FILE_PROCESS_QUEUE_MESSAGE_TIMEOUTS[one_attempt])
-            else:
-                break
+        messages, next_cursors['messages'] = _read_log_file(cur_path, cursors.get('messages'))
 
     cur_path = os.path.join(working_folder, 'errors.txt')
     if os.path.exists(cur_path):
-        for one_attempt in range(0, FILE_PROCESS_QUEUE_STATUS_RETRIES):
-            try:
-                with open(cur_path, 'r', encoding='utf8') as in_file:
-                    errors = in_file.readlines()
-            except OSError as ex:
-                msg = f'An OS exception was caught while trying to read error file "{cur_path}"'
-                print(msg, ex)
-            except Exception as ex:
-                msg = f'An unknown exception was caught while trying to read error file "{cur_path}"'
-                print(msg, ex)
-
-            if errors is None:
-                msg = f'Sleeping {one_attempt} before trying to get errors again "{cur_path}"'
-                print(msg)
-                time.sleep(FILE_PROCESS_QUEUE_MESSAGE_TIMEOUTS[one_attempt])
-            else:
-                break
+        errors, next_cursors['errors'] = _read_log_file(cur_path, cursors.get('errors'))
 
-    return messages, errors
+    return messages, errors, next_cursors
 
 
-def workflow_start(workflow_id: str, workflow_template: dict, data: list, file_handlers: list, working_folder: str, recover: bool=False):
+def workflow_start(workflow_id: str, workflow_template: dict, data: list, file_handlers: list, working_folder: str,
+                   upload_folder: str, recover: bool=False) -> Future:
     """Starts a workflow
     Arguments:
         workflow_id: the ID of the current workflow
@@ -815,7 +1320,15 @@ def workflow_start(workflow_id: str, workflow_template: dict, data: list, file_h
         data: the data used by the template for processing
         file_handlers: the list of known file handlers
         working_folder: the working folder for the workflow
+        upload_folder: the upload folder of the session starting the workflow
         recover: flag to indicate we're trying to recover a workflow that had a problem
+    Return:
+        Returns the future of staging the workflow's files and running it
+    Exceptions:
+        RuntimeError is raised if a mandatory value is missing
+    Notes:
+        The workflow is checked and queued before returning. Its files are staged, and it's run, in the background on
+        WORKFLOW_START_EXECUTOR; the progress is reported through the workflow's status
     """
     # Disable these warnings to keep avoid breaking the preparation into too many small pieces
     # pylint: disable=too-many-nested-blocks, too-many-branches
@@ -873,9 +1386,40 @@ def workflow_start(workflow_id: str, workflow_template: dict, data: list, file_h
 
     process_info = queue_start(workflow_id, working_folder, recover)
     print("FINAL WORKFLOW: ",workflow)
-    for one_process in workflow:
-        queue_one_process(workflow_id, one_process, working_folder, process_info)
-    queue_finish(workflow_id, working_folder, process_info)
+    write_status_file(os.path.join(working_folder, 'status.json'), {'starting': {'message': 'Waiting to stage input files'}})
+
+    return WORKFLOW_START_EXECUTOR.submit(workflow_stage_and_run, workflow_id, workflow, working_folder, process_info,
+                                          upload_folder)
+
+
+def workflow_stage_and_run(workflow_id: str, workflow: list, working_folder: str, process_info: dict, upload_folder: str) -> bool:
+    """Stages the input files of a queued workflow and starts running it
+    Arguments:
+        workflow_id: the ID of the workflow
+        workflow: the list of workflow steps
+        working_folder: the working folder for the workflow
+        process_info: dictionary returned by starting process call
+        upload_folder: the upload folder of the session that started the workflow
+    Return:
+        Returns True if the workflow was started and False if not
+    Notes:
+        If the workflow can't be started its completion is written as an error, as the workflow runner would
+    """
+    try:
+        stage_workflow_files(workflow_id, workflow, working_folder, upload_folder)
+        for one_process in workflow:
+            queue_one_process(workflow_id, one_process, working_folder, process_info)
+        queue_finish(workflow_id, working_folder, process_info)
+    except Exception as ex:
+        print("Exception caught staging and starting workflow", workflow_id, str(ex))
+        traceback.print_exc()
+        completion = {'error': f'Unable to start workflow: {ex}'}
+        if os.path.isdir(working_folder):
+            write_status_file(os.path.join(working_folder, 'status.json'), {'completion': completion})
+        RUN_REGISTRY.finish_run(workflow_id, completion, 0)
+        return False
+
+    return True
 
 
 def workflow_status(workflow_id: str, working_folder: str) -> dict:
@@ -891,26 +1435,296 @@ def workflow_status(workflow_id: str, working_folder: str) -> dict:
     if cur_status is None:
         return {'result': STATUS_NOT_STARTED}
 
-    if isinstance(cur_status, dict) and 'running' in cur_status:
+    if isinstance(cur_status, dict) and ('running' in cur_status or 'starting' in cur_status):
         return {'result': STATUS_RUNNNG, 'status': cur_status}
 
     return {'result': STATUS_FINISHED, 'status': str(cur_status)}
 
 
-def workflow_messages(workflow_id: str, working_folder: str) -> dict:
+def workflow_statuses(workflow_ids: list) -> dict:
+    """Returns the status of several workflows
+    Arguments:
+        workflow_ids: the IDs of the workflows to check
+    Return:
+        Returns a dict of the status of each workflow, keyed by workflow ID. The status is None for workflows that no longer
+        exist
+    """
+    statuses = {}
+    runs = RUN_REGISTRY.get_runs(list(workflow_ids))
+    for one_workflow_id in workflow_ids:
+        # Finished workflows have their completion in the registry
+        run = runs.get(one_workflow_id)
+        if run is not None and run['status'] in RUN_FINISHED_STATUSES:
+            statuses[one_workflow_id] = {'result': STATUS_FINISHED, 'status': str(run['completion'])}
+            continue
+
+        working_dir = os.path.abspath(os.path.join(WORKFLOW_RUN_PATH, one_workflow_id))
+        if not working_dir.startswith(WORKFLOW_RUN_PATH) or not os.path.isdir(working_dir):
+            print(f'Skipping status of invalid or missing workflow: "{one_workflow_id}"', flush=True)
+            statuses[one_workflow_id] = None
+            continue
+
+        statuses[one_workflow_id] = workflow_status(one_workflow_id, working_dir)
+
+    return statuses
+
+
+def workflow_messages(workflow_id: str, working_folder: str, cursors: dict = None) -> dict:
     """Returns the messages from the workflow
     Arguments:
         workflow_id: the ID of the current workflow
         working_folder: the working folder for the workflow
+        cursors: optional dict of 'messages' and 'errors' cursors returned by a previous call
     Return:
-        Returns a dict containing any normal and error messages from the workflow query
+        Returns a dict containing any normal and error messages from the workflow query, and the cursors to use to fetch
+        only newer messages
     """
     print("Checking workflow messages", workflow_id, working_folder)
 
-    messages, errors = queue_messages(workflow_id, working_folder)
+    messages, errors, next_cursors = queue_messages(workflow_id, working_folder, cursors)
 
     return {'messages': messages if messages is not None else [],
-            'errors': errors if errors is not None else []}
+            'errors': errors if errors is not None else [],
+            'cursors': next_cursors}
+
+
+def workflow_messages_signature(working_folder: str) -> tuple:
+    """Returns values that change when the messages of the workflow change
+    Arguments:
+        working_folder: the working folder for the workflow
+    Return:
+        Returns a tuple of the modification time, size, and whether a trailing partial line can be returned, for each of
+        the message files
+    """
+    signature = ()
+    for one_name in ['messages.txt', 'errors.txt']:
+        file_signature = _get_file_signature(os.path.join(working_folder, one_name))
+        if file_signature is None:
+            signature += (None,)
+        else:
+            # A partial line is held back until the file has been quiet for a while
+            is_quiet = time.time() - file_signature[0] / 1e9 >= LOG_PARTIAL_LINE_QUIET_SEC
+            signature += (file_signature + (is_quiet,),)
+
+    return signature
+
+
+def _write_stageout_status(working_folder: str, status: str, message: str, progress: dict = None) -> None:
+    """Writes the status of uploading a workflow's results
+    Arguments:
+        working_folder: the working folder for the workflow
+        status: one of 'waiting', 'uploading', 'completed', or 'failed'
+        message: the message associated with the status
+        progress: optional progress returned by StagingProgress.summary()
+    Notes:
+        The ID of the process doing the upload is included so that an upload abandoned by a stopped process can be detected
+    """
+    _write_json_file_atomic(os.path.join(working_folder, STAGEOUT_FILE_NAME),
+                            {'status': status, 'message': message, 'pid': os.getpid(), **(progress if progress else {})})
+
+
+def workflow_stageout_status(working_folder: str) -> Optional[dict]:
+    """Returns the status of uploading a workflow's results
+    Arguments:
+        working_folder: the working folder for the workflow
+    Return:
+        Returns the status written by _write_stageout_status(), or None if the results aren't being uploaded
+    """
+    stageout_path = os.path.join(working_folder, STAGEOUT_FILE_NAME)
+    try:
+        with open(stageout_path, 'r', encoding='utf8') as in_file:
+            return json.load(in_file)
+    except FileNotFoundError:
+        pass
+    except Exception as ex:
+        print(f'Unable to load stage-out status "{stageout_path}"', ex)
+
+    return None
+
+
+def is_stageout_active(stageout_status: Optional[dict]) -> bool:
+    """Checks if a workflow's results are being uploaded
+    Arguments:
+        stageout_status: the status returned by workflow_stageout_status()
+    Return:
+        Returns True if the upload hasn't finished and the process doing it is still running
+    """
+    if stageout_status is None or stageout_status['status'] not in ('waiting', 'uploading'):
+        return False
+
+    try:
+        os.kill(stageout_status['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def _get_stageout_files(working_folder: str) -> list:
+    """Returns the result files of a workflow
+    Arguments:
+        working_folder: the working folder for the workflow
+    Return:
+        Returns a list of (file path, path relative to the working folder) tuples of the files in the workflow steps' folders
+    """
+    result_files = []
+    for one_entry in sorted(os.scandir(working_folder), key=lambda entry: entry.name):
+        if one_entry.name[0] == '.' or not one_entry.is_dir(follow_symlinks=False):
+            continue
+        for dir_path, dir_names, file_names in os.walk(one_entry.path):
+            dir_names.sort()
+            for one_name in sorted(file_names):
+                file_path = os.path.join(dir_path, one_name)
+                result_files.append((file_path, os.path.relpath(file_path, working_folder).replace(os.sep, '/')))
+
+    return result_files
+
+
+def workflow_stageout(workflow_id: str, working_folder: str, auth: dict, dest_path: str) -> bool:
+    """Uploads the results of a finished workflow to iRODS
+    Arguments:
+        workflow_id: the ID of the workflow
+        working_folder: the working folder for the workflow
+        auth: the iRODS connection information
+        dest_path: the iRODS collection to upload to; the results are put into a sub-collection named after the workflow
+    Return:
+        Returns True if the results were uploaded and False if not
+    Notes:
+        The progress is written to the workflow's STAGEOUT_FILE_NAME file. Files are uploaded concurrently on
+        STAGING_EXECUTOR with the same per-host limits as staging input files
+    """
+    collection = dest_path.rstrip('/') + '/' + workflow_id
+    result_files = _get_stageout_files(working_folder)
+    print("Uploading results for workflow", workflow_id, len(result_files), collection)
+    _write_stageout_status(working_folder, 'uploading', f'Uploading results to {collection}')
+
+    try:
+        with IRODS_SESSION_POOL.session(auth) as conn:
+            for one_folder in sorted({os.path.dirname(rel_path) for _, rel_path in result_files} | {''}):
+                conn.collections.create(collection + '/' + one_folder if one_folder else collection)
+
+        transfers = [(auth['host'], functools.partial(put_irods_file, auth, file_path, collection + '/' + rel_path))
+                     for file_path, rel_path in result_files]
+        msg = f'Uploading results to {collection}'
+        progress = StagingProgress(len(transfers),
+                                   lambda summary: _write_stageout_status(working_folder, 'uploading', msg, summary),
+                                   STAGING_PROGRESS_INTERVAL_SEC)
+        results = stage_files(transfers, STAGING_EXECUTOR, STAGING_HOST_LIMITS, progress)
+    except Exception as ex:
+        print("Exception caught uploading results for workflow", workflow_id, str(ex))
+        traceback.print_exc()
+        _write_stageout_status(working_folder, 'failed', f'Unable to upload results to {collection}: {ex}')
+        return False
+
+    failed_files = [rel_path for one_result, (_, rel_path) in zip(results, result_files) if one_result is not True]
+    if failed_files:
+        _write_stageout_status(working_folder, 'failed', f'Unable to verify uploaded results: {", ".join(failed_files)}',
+                               progress.summary())
+        return False
+
+    _write_stageout_status(working_folder, 'completed', f'Uploaded results to {collection}', progress.summary())
+    return True
+
+
+def is_workflow_finished(workflow_id: str, working_folder: str) -> bool:
+    """Returns whether a workflow has finished
+    Arguments:
+        workflow_id: the ID of the workflow
+        working_folder: the working folder for the workflow
+    """
+    return workflow_status(workflow_id, working_folder)['result'] == STATUS_FINISHED
+
+
+# Uploads of workflow results waiting for their workflows to finish; checked when finished workflow runners are reaped
+STAGEOUT_QUEUE = StageoutQueue(STAGEOUT_EXECUTOR, is_workflow_finished, workflow_stageout)
+
+
+def start_workflow_stageout(workflow_id: str, working_folder: str, auth: dict, dest_path: str) -> None:
+    """Starts uploading a workflow's results to iRODS once it finishes, without waiting for the upload
+    Arguments:
+        workflow_id: the ID of the workflow
+        working_folder: the working folder for the workflow
+        auth: the iRODS connection information
+        dest_path: the iRODS collection to upload to
+    """
+    # Mark the upload as pending right away so that the workflow isn't removed before the upload starts
+    _write_stageout_status(working_folder, 'waiting', 'Waiting for the workflow to finish')
+    STAGEOUT_QUEUE.add(workflow_id, working_folder, auth, dest_path)
+
+
+def _format_stream_event(event: str, data: object, event_id: str = None) -> str:
+    """Formats a server-sent event
+    Arguments:
+        event: the name of the event
+        data: the data of the event; it's converted to JSON
+        event_id: optional ID of the event
+    Return:
+        Returns the formatted event
+    """
+    event_lines = [f'event: {event}']
+    if event_id is not None:
+        event_lines.append(f'id: {event_id}')
+    event_lines.append('data: ' + json.dumps(data))
+
+    return '\n'.join(event_lines) + '\n\n'
+
+
+def workflow_events(workflow_id: str, working_folder: str, cursors: dict = None):
+    """Generates server-sent events for workflow status changes and new messages
+    Arguments:
+        workflow_id: the ID of the current workflow
+        working_folder: the working folder for the workflow
+        cursors: optional dict of 'messages' and 'errors' cursors of messages already received
+    Return:
+        Yields 'status' events when the status changes, 'messages' events when there are new messages, and a final 'done'
+        event when the workflow has finished
+    Notes:
+        Changes are detected by checking the modification time and size of the files in the working folder. The generator
+        returns after WORKFLOW_STREAM_MAX_SEC seconds and the client is expected to reconnect
+    """
+    status_path = os.path.join(working_folder, 'status.json')
+    log_paths = {'messages': os.path.join(working_folder, 'messages.txt'),
+                 'errors': os.path.join(working_folder, 'errors.txt')}
+    cursors = {**{'messages': 0, 'errors': 0}, **(cursors if cursors is not None else {})}
+
+    status_signature = None
+    cur_status = None
+    end_ts = time.time() + WORKFLOW_STREAM_MAX_SEC
+    heartbeat_ts = time.time() + WORKFLOW_STREAM_HEARTBEAT_SEC
+    while time.time() < end_ts:
+        have_event = False
+
+        # Check for new messages before the status so that they are received before a final status
+        log_signatures = {name: _get_file_signature(path) for name, path in log_paths.items()}
+        if any(signature is not None and signature[1] != cursors[name] for name, signature in log_signatures.items()):
+            cur_messages = workflow_messages(workflow_id, working_folder, cursors)
+            cursors = cur_messages['cursors']
+            if cur_messages['messages'] or cur_messages['errors']:
+                yield _format_stream_event('messages', cur_messages, f'{cursors["messages"]}:{cursors["errors"]}')
+                have_event = True
+
+        new_signature = status_file_signature(status_path)
+        if new_signature != status_signature or cur_status is None:
+            status_signature = new_signature
+            new_status = workflow_status(workflow_id, working_folder)
+            if new_status != cur_status:
+                cur_status = new_status
+                yield _format_stream_event('status', cur_status)
+                have_event = True
+
+        if cur_status['result'] == STATUS_FINISHED:
+            yield _format_stream_event('done', {'id': workflow_id})
+            return
+
+        if have_event:
+            heartbeat_ts = time.time() + WORKFLOW_STREAM_HEARTBEAT_SEC
+        elif time.time() >= heartbeat_ts:
+            yield ': keep-alive\n\n'
+            heartbeat_ts = time.time() + WORKFLOW_STREAM_HEARTBEAT_SEC
+
+        time.sleep(WORKFLOW_STREAM_POLL_SEC)
 
 
 def workflow_has_secure_parameters(params: list) -> bool:
@@ -1004,12 +1818,49 @@ def add_cors_headers(response):
     return response
 
 
+def _send_static_asset(asset: StaticAsset) -> Response:
+    """Returns the response for a static asset in the best encoding the client accepts
+    Arguments:
+        asset - the asset to send
+    Return:
+        Returns the response, which is 304 Not Modified if the client's copy is current
+    Notes:
+        Assets with hashed names are cached by browsers forever; other assets are revalidated on each use
+    """
+    encoding = request.accept_encodings.best_match(asset.get_encodings(), 'identity')
+    data, path = asset.variants[encoding]
+
+    if data is not None:
+        response = Response(data, mimetype=asset.mimetype)
+        response.set_etag(asset.get_etag(encoding))
+        response.last_modified = asset.mtime
+        response.make_conditional(request, accept_ranges=True, complete_length=len(data))
+    else:
+        response = send_file(path, mimetype=asset.mimetype, conditional=True, etag=asset.get_etag(encoding),
+                             last_modified=asset.mtime)
+
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if asset.immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_ASSET_IMMUTABLE_MAX_AGE_SEC
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+
+    return response
+
+
 @app.route('/')
 @cross_origin()
 def index():
     """Default page"""
     print("RENDERING TEMPLATE")
-    return render_template(DEFAULT_TEMPLATE_PAGE)
+    response = make_response(render_template(DEFAULT_TEMPLATE_PAGE))
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @app.route('/<string:filename>')
@@ -1018,14 +1869,12 @@ def sendfile(filename: str):
     """Return root files"""
     print("RETURN FILENAME:",filename)
 
-    fullpath = os.path.realpath(os.path.join(RESOURCE_START_PATH, filename.lstrip('/')))
-    print("   FILE PATH:", fullpath)
-
-    # Make sure we're only serving something that's in the same location that we are in and that it exists
-    if not fullpath or not os.path.exists(fullpath) or not fullpath.startswith(RESOURCE_START_PATH):
+    # Only assets in the same location that we are in are found
+    asset = STATIC_ASSETS.get(filename.lstrip('/'))
+    if asset is None:
         return 'Resource not found', 404
 
-    return send_file(fullpath)
+    return _send_static_asset(asset)
 
 
 @app.route('/static/css/<string:filename>')
@@ -1034,12 +1883,11 @@ def sendcss(filename: str):
     """Return CSS"""
     print("RETURN CSS:",filename)
 
-    fullpath = os.path.realpath(os.path.join(RESOURCE_START_PATH, 'css', filename))
-
-    if not filename or not os.path.exists(fullpath) or not fullpath.startswith(RESOURCE_START_PATH):
+    asset = STATIC_ASSETS.get('css/' + filename) if filename else None
+    if asset is None:
         return 'Resource not found', 404
 
-    return send_file(fullpath)
+    return _send_static_asset(asset)
 
 
 @app.route('/static/js/<string:filename>')
@@ -1048,19 +1896,23 @@ def sendjs(filename: str):
     """Return js"""
     print("RETURN JS:",filename)
 
-    fullpath = os.path.realpath(os.path.join(RESOURCE_START_PATH, 'js', filename))
-
-    if not filename or not os.path.exists(fullpath) or not fullpath.startswith(RESOURCE_START_PATH):
+    asset = STATIC_ASSETS.get('js/' + filename) if filename else None
+    if asset is None:
         return 'Resource not found', 404
 
-    return send_file(fullpath)
+    return _send_static_asset(asset)
+
+
+def _get_run_owner() -> str:
+    """Returns the ID used to record the session as the owner of workflow runs, creating it if needed"""
+    if 'run_owner' not in session or not session['run_owner']:
+        session['run_owner'] = uuid.uuid4().hex
+
+    return session['run_owner']
 
 
-@app.route('/upload', methods=['PUT'])
-@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
-def upload_file():
-    """Upload files"""
-    print("UPLOADED FILES", len(request.files))
+def _get_upload_folder() -> str:
+    """Returns the upload folder of the session, creating it if needed"""
     if not os.path.exists(FILE_START_PATH):
         os.makedirs(FILE_START_PATH)
 
@@ -1069,6 +1921,16 @@ def upload_file():
     if 'upload_folder' not in session or session['upload_folder'] is None or not os.path.isdir(session['upload_folder']):
         session['upload_folder'] = tempfile.mkdtemp(dir=FILE_START_PATH)
 
+    return session['upload_folder']
+
+
+@app.route('/upload', methods=['PUT'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def upload_file():
+    """Upload files"""
+    print("UPLOADED FILES", len(request.files))
+    _get_upload_folder()
+
     loaded_filenames = []
     for file_id in request.files:
         one_file = request.files[file_id]
@@ -1081,6 +1943,106 @@ def upload_file():
     return json.dumps(loaded_filenames)
 
 
+@app.route('/upload/chunked', methods=['POST'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def upload_chunked_start() -> tuple:
+    """Starts a resumable upload of a file sent in chunks
+    Request body:
+        filename: the name of the file
+        size: optional size of the file in bytes, which is checked when the upload is finished
+        sha256: optional SHA256 hex digest of the file, which is checked when the upload is finished
+    Return:
+        Returns the state of the upload, including its 'id' and the 'offset' to send the first chunk at
+    """
+    upload_data = request.get_json(force=True)
+    filename = secure_filename(upload_data.get('filename', '')) if isinstance(upload_data, dict) else ''
+    size = upload_data.get('size') if isinstance(upload_data, dict) else None
+    sha256 = upload_data.get('sha256') if isinstance(upload_data, dict) else None
+    # pylint: disable=too-many-boolean-expressions
+    if not filename or (size is not None and (not isinstance(size, int) or size < 0)) or \
+       (sha256 is not None and (not isinstance(sha256, str) or len(sha256) != 64)):
+        msg = f'Invalid chunked upload requested: {upload_data}'
+        print(msg, flush=True)
+        return msg, 400     # Bad request
+
+    state = chunked_upload.start_upload(_get_upload_folder(), filename, size, sha256)
+    print("Started chunked upload", state, flush=True)
+
+    return json.dumps(state), 201
+
+
+@app.route('/upload/chunked/<string:upload_id>', methods=['GET'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def upload_chunked_status(upload_id: str) -> tuple:
+    """Returns the state of a chunked upload so that it can be resumed from its offset
+    Arguments:
+        upload_id: the ID of the upload
+    """
+    try:
+        state = chunked_upload.load_upload(_get_upload_folder(), upload_id)
+    except ValueError as ex:
+        print(str(ex), flush=True)
+        return str(ex), 400     # Bad request
+
+    if state is None:
+        return 'Resource not found', 404
+
+    return json.dumps(state)
+
+
+@app.route('/upload/chunked/<string:upload_id>', methods=['PUT'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def upload_chunked_write(upload_id: str) -> tuple:
+    """Receives a chunk of a file; the body of the request is the chunk's data
+    Arguments:
+        upload_id: the ID of the upload
+    Request args:
+        offset: the offset of the chunk in the file
+    Return:
+        Returns the state of the upload. If the offset doesn't match the upload's offset the chunk is rejected with a
+        409 status and the chunk needs to be resent from the upload's offset
+    """
+    offset = request.args.get('offset', '')
+    if not offset.isdigit():
+        return f'Invalid chunk offset "{offset}"', 400     # Bad request
+
+    try:
+        state, accepted = chunked_upload.write_chunk(_get_upload_folder(), upload_id, int(offset), request.stream)
+    except ValueError as ex:
+        print(str(ex), flush=True)
+        return str(ex), 400     # Bad request
+
+    if state is None:
+        return 'Resource not found', 404
+    if not accepted:
+        print(f'Rejected chunk for upload {upload_id} at offset {offset}; expected offset {state["offset"]}', flush=True)
+        return json.dumps(state), 409
+
+    return json.dumps(state)
+
+
+@app.route('/upload/chunked/<string:upload_id>/finalize', methods=['POST'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def upload_chunked_finish(upload_id: str) -> tuple:
+    """Finishes a chunked upload, checking its size and SHA256 digest when they were provided
+    Arguments:
+        upload_id: the ID of the upload
+    Return:
+        Returns the 'filename', 'size', and 'sha256' of the uploaded file
+    """
+    try:
+        uploaded = chunked_upload.finish_upload(_get_upload_folder(), upload_id)
+    except ValueError as ex:
+        print(str(ex), flush=True)
+        return str(ex), 400     # Bad request
+
+    if uploaded is None:
+        return 'Resource not found', 404
+
+    print("Finished chunked upload", uploaded, flush=True)
+    return json.dumps(uploaded)
+
+
 def _handle_files_get_path(working_path: str, upload_folder: str, additional_folders: dict) -> Optional[str]:
     """Returns the path to search when returning server files list"""
     # Check if it's an additional path as defined on startup
@@ -1099,6 +2061,30 @@ def _handle_files_get_path(working_path: str, upload_folder: str, additional_fol
     return cur_path
 
 
+def _get_folder_entries(folder_path: str) -> list:
+    """Returns the entries of the folder, using previously scanned entries when the folder hasn't changed
+    Arguments:
+        folder_path: the path of the folder
+    Return:
+        Returns a new list of the folder's entries
+    """
+    resolved_path = os.path.realpath(folder_path)
+    folder_signature = _get_file_signature(resolved_path)
+
+    if folder_signature is not None:
+        # Entries are rescanned periodically to pick up changes to their size and modification time
+        folder_signature += (int(time.time() // LISTING_CACHE_MAX_AGE_SEC),)
+        entries = FOLDER_LISTING_CACHE.get(resolved_path, folder_signature)
+        if entries is not None:
+            return list(entries)
+
+    entries = scan_folder(resolved_path)
+    if folder_signature is not None:
+        FOLDER_LISTING_CACHE.put(resolved_path, folder_signature, entries)
+
+    return list(entries)
+
+
 @app.route('/server/files', methods=['GET'])
 @cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
 def handle_files() -> tuple:
@@ -1106,13 +2092,26 @@ def handle_files() -> tuple:
     Request args:
         path: the relative path to list
         file_filter: the filter to apply to the returned names
+        sort: optional name of the field to sort on: 'name' (the default), 'size', or 'date'
+        order: optional sort order: 'asc' (the default) or 'desc'
+        offset: optional number of matching entries to skip
+        limit: optional maximum number of entries to return
+    Notes:
+        The total number of matching entries is returned in the X-Total-Count header
     """
     print("LIST FILES")
-    return_names = []
     have_error = False
 
     path = request.args['path']
     file_filter = request.args['filter']
+    sort_key = request.args.get('sort', 'name')
+    descending = request.args.get('order', 'asc') == 'desc'
+    offset = request.args.get('offset', '0')
+    limit = request.args.get('limit')
+
+    if sort_key not in LISTING_SORT_KEYS or not offset.isdigit() or (limit is not None and not limit.isdigit()):
+        print(f'Invalid listing arguments requested: sort "{sort_key}" offset "{offset}" limit "{limit}"', flush=True)
+        return 'Invalid listing arguments', 400
 
     if len(path) <= 0:
         print(f'Zero length path requested {path}', flush=True)
@@ -1136,26 +2135,45 @@ def handle_files() -> tuple:
     if have_error:
         return 'Resource not found', 404
 
-    for one_file in os.listdir(cur_path):
-        file_path = os.path.join(cur_path, one_file)
-        if not one_file[0] == '.' and (not file_filter or (file_filter and fnmatch.fnmatch(one_file, file_filter))):
-            return_names.append({'name': one_file,
-                                 'path': os.path.join(path, one_file),
-                                 'size': os.path.getsize(file_path),
-                                 'date': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(file_path))),
-                                 'type': 'folder' if os.path.isdir(file_path) else 'file'
+    def build_response() -> Response:
+        """Builds the listing response"""
+        entries = _get_folder_entries(cur_path)
+
+        if ADDITIONAL_LOCAL_FOLDERS and path == '/':
+            for one_name, _ in ADDITIONAL_LOCAL_FOLDERS.items():
+                entries.append({'name': one_name,
+                                'size': 0,
+                                'mtime': None,
+                                'type': 'folder'
+                                })
+
+        page, total = page_entries(entries, file_filter, sort_key, descending, int(offset), int(limit) if limit is not None else None)
+
+        return_names = []
+        for one_entry in page:
+            entry_date = ''
+            if one_entry['mtime'] is not None:
+                entry_date = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(one_entry['mtime']))
+            return_names.append({'name': one_entry['name'],
+                                 'path': os.path.join(path, one_entry['name']),
+                                 'size': one_entry['size'],
+                                 'date': entry_date,
+                                 'type': one_entry['type']
                                  })
 
-    if ADDITIONAL_LOCAL_FOLDERS and path == '/':
-        for one_name, _ in ADDITIONAL_LOCAL_FOLDERS.items():
-            return_names.append({'name': one_name,
-                                 'path': '/' + one_name,
-                                 'size': 0,
-                                 'date': '',
-                                 'type': 'folder'
-                                 })
+        response = make_response(json.dumps(return_names))
+        response.headers.set('X-Total-Count', str(total))
+        response.headers.set('Access-Control-Expose-Headers', 'X-Total-Count')
+        return response
+
+    # The listing changes with the folder, and with the sizes and dates of its files as they're periodically rescanned
+    resolved_path = os.path.realpath(cur_path)
+    folder_signature = _get_file_signature(resolved_path)
+    validator = None
+    if folder_signature is not None:
+        validator = (resolved_path, folder_signature, int(time.time() // LISTING_CACHE_MAX_AGE_SEC))
 
-    return json.dumps(return_names)
+    return conditional_response(validator, build_response)
 
 
 @app.route('/irods/connect', methods=['POST'])
@@ -1205,40 +2223,43 @@ def handle_irods_files() -> tuple:
     Request args:
         path: the relative path to list
         file_filter: the filter to apply to the returned names
+        offset: optional number of entries to skip
+        limit: optional maximum number of entries to return
+    Notes:
+        The total number of entries is returned in the X-Total-Count header
     """
-    return_names = []
-
     path = request.args['path']
     file_filter = request.args['filter']
+    offset = request.args.get('offset', '0')
+    limit = request.args.get('limit')
 
     conn_info = session['connection']
-    conn = iRODSSession(host=conn_info['host'], port=conn_info['port'], user=conn_info['user'],
-                        password=conn_info['password'], zone=conn_info['zone'])
 
     if len(path) <= 0:
         print('Zero length path requested {path}', flush=True)
         return 'Resource not found', 404
 
+    if not offset.isdigit() or (limit is not None and not limit.isdigit()):
+        print(f'Invalid iRODS listing arguments requested: offset "{offset}" limit "{limit}"', flush=True)
+        return 'Invalid listing arguments', 400
+
+    def build_response() -> Response:
+        """Builds the listing response"""
+        return_names, total = list_irods_collection(conn, path, file_filter, int(offset),
+                                                     int(limit) if limit is not None else None)
+
+        response = make_response(json.dumps(return_names))
+        response.headers.set('X-Total-Count', str(total))
+        response.headers.set('Access-Control-Expose-Headers', 'X-Total-Count')
+        return response
+
     try:
-        col = conn.collections.get(path)
-        for one_obj in col.data_objects:
-            if not one_obj.name == '.' and (not file_filter or (file_filter and fnmatch.fnmatch(one_obj.name, file_filter))):
-                # pylint:  disable=consider-using-f-string
-                return_names.append({'name': one_obj.name,
-                                     'path': one_obj.path,
-                                     'size': one_obj.size,
-                                     'date': '{0:%Y-%m-%d %H:%M:%S}'.format(one_obj.modify_time),
-                                     'type': 'file'
-                                     })
-
-        for one_obj in col.subcollections:
-            return_names.append({'name': one_obj.name,
-                                 'path': one_obj.path,
-                                 'size': 0,
-                                 'date': '',
-                                 'type': 'folder'
-                                 })
+        with IRODS_SESSION_POOL.session(conn_info) as conn:
+            return body_conditional_response(build_response)
 
+    except irods.exception.CollectionDoesNotExist as ex:
+        print('Missing collection requested for iRODS listing: ', path, ex)
+        return f'iRODS collection not found: {path}', 404
     except irods.exception.NetworkException as ex:
         print('Network exception caught for iRODS listing: ', path, ex)
         return f'Unable to complete iRODS listing request: {path}', 504
@@ -1249,8 +2270,6 @@ def handle_irods_files() -> tuple:
         print('Invalid user exception caught for iRODS listing: ', path, ex)
         return f'Invalid user specified for iRODS listing request: {path}', 401
 
-    return json.dumps(return_names)
-
 
 @app.route('/workflow/definitions', methods=['GET'])
 @cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
@@ -1259,7 +2278,19 @@ def handle_workflow_definitions() -> tuple:
     """
     print("Workflow definitions")
 
-    return json.dumps(WORKFLOW_DEFINITIONS)
+    definitions_json, definitions_gzip, definitions_digest = WORKFLOW_REGISTRY.get_serialised()
+
+    def build_response() -> Response:
+        """Builds the response, compressed when the client accepts it"""
+        if request.accept_encodings['gzip']:
+            response = make_response(definitions_gzip)
+            response.headers.set('Content-Encoding', 'gzip')
+        else:
+            response = make_response(definitions_json)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return conditional_response((definitions_digest,), build_response)
 
 
 def _handle_workflow_start_save(workflow_save_path: str, params_save_path: str, cur_workflow: dict, workflow_params: list) -> None:
@@ -1282,12 +2313,7 @@ def _handle_workflow_start_find(workflow_data: dict) -> dict:
     Arguments:
         workflow_data - the workflow data to find the workflow for
     """
-    cur_workflow = None
-
-    for one_workflow in WORKFLOW_DEFINITIONS:
-        if one_workflow['id'] == workflow_data['id']:
-            cur_workflow = one_workflow
-            break
+    cur_workflow = WORKFLOW_REGISTRY.find(workflow_data['id'])
 
     # If we can't find the workflow, check for uploaded workflows
     if cur_workflow is None and 'workflow_files' in session and session['workflow_files'] is not None:
@@ -1319,12 +2345,30 @@ def handle_workflow_start() -> tuple:
     """Handles starting a workflow
     Request body:
         config: the workflow configuration to run
+        stageout: optional dict with the iRODS collection 'path' to upload the workflow's results to when it finishes; the
+                  session needs to be connected to iRODS
+        priority: optional integer from -WORKFLOW_MAX_PRIORITY to WORKFLOW_MAX_PRIORITY; when the session has several
+                  workflows waiting to run, the ones with a higher priority are run first
     """
     print("Workflow start")
     cur_workflow = None
 
     workflow_data = request.get_json(force=True)
 
+    stageout_path = None
+    if workflow_data.get('stageout'):
+        stageout_path = workflow_data['stageout'].get('path')
+        if not stageout_path or 'connection' not in session:
+            msg = "Stage-out of workflow results requires a path and an iRODS connection"
+            print(msg)
+            return msg, 400     # Bad request
+
+    priority = workflow_data.get('priority', 0)
+    if not isinstance(priority, int) or isinstance(priority, bool) or abs(priority) > WORKFLOW_MAX_PRIORITY:
+        msg = f'Workflow priority must be a whole number from -{WORKFLOW_MAX_PRIORITY} to {WORKFLOW_MAX_PRIORITY}'
+        print(msg)
+        return msg, 400     # Bad request
+
     # Set the workflow folder for this user if it hasn't been set yet
     # pylint: disable=consider-using-with
     if 'workflow_folder' not in session or session['workflow_folder'] is None or not os.path.isdir(session['workflow_folder']):
@@ -1357,10 +2401,22 @@ def handle_workflow_start() -> tuple:
     else:
         workflow_params = workflow_data['params']
 
+    # The run gets its own copy of the workflow so that the definition isn't changed
+    cur_workflow = copy.deepcopy(cur_workflow)
     cur_workflow['id'] = workflow_id
-    workflow_start(workflow_id, cur_workflow, workflow_params, FILE_HANDLERS, working_dir)
 
-    _handle_workflow_start_save(os.path.join(working_dir, '_workflow'), os.path.join(working_dir, '_params'), cur_workflow,
+    # The run is recorded before it starts so that the runner can record its completion
+    RUN_REGISTRY.add_run(workflow_id, _get_run_owner(), workflow_data['id'], cur_workflow, workflow_data['params'],
+                         priority=priority)
+    try:
+        workflow_start(workflow_id, cur_workflow, workflow_params, FILE_HANDLERS, working_dir, session['upload_folder'])
+    except Exception:
+        RUN_REGISTRY.remove_run(workflow_id)
+        raise
+    if stageout_path:
+        start_workflow_stageout(workflow_id, working_dir, session['connection'], stageout_path)
+
+    _handle_workflow_start_save(os.path.join(working_dir, WORKFLOW_SAVE_FILE_NAME), os.path.join(working_dir, '_params'), cur_workflow,
                                 workflow_data['params'])
 
     # Keep workflow IDs in longer term storage
@@ -1370,7 +2426,6 @@ def handle_workflow_start() -> tuple:
         updated_workflows = session['workflows']
         updated_workflows.append(workflow_id)
         session['workflows'] = updated_workflows
-    session[workflow_id] = cur_workflow
 
     return json.dumps({'id': workflow_id, 'start_ts': datetime.datetime.now().isoformat().split('.')[0]})
 
@@ -1379,54 +2434,52 @@ def handle_workflow_start() -> tuple:
 @cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
 def handle_workflow_recover() -> tuple:
     """Attempts to recover workflows
+    Request args:
+        offset: optional number of workflows to skip
+        limit: optional maximum number of workflows to return
+    Notes:
+        The workflows are returned in the order they were started. The total number of workflows is returned in the
+        X-Total-Count header
     """
-    if 'workflows' in session:
-        known_workflows = session['workflows']
-    else:
-        known_workflows = []
-    found_workflow_ids = []
-    if known_workflows:
-        for one_workflow_id in known_workflows:
-            working_dir = os.path.join(WORKFLOW_RUN_PATH, one_workflow_id)
-            workflow_params = os.path.join(working_dir, '_params')
-            workflow_file = os.path.join(working_dir, '_workflow')
-            # Disable the pylint check here to allow all the files to be checked on one line
-            # pylint: disable=too-many-boolean-expressions
-            if os.path.exists(working_dir) and os.path.isdir(working_dir) and os.path.exists(workflow_params) \
-               and os.path.isfile(workflow_params) and os.path.exists(workflow_file) and os.path.isfile(workflow_file):
-                # Recover the workflow
-                found_workflow_ids.append(one_workflow_id)
-
-    # We now have a list of workflow IDs that are valid
-    missing_workflows = list(set(known_workflows) - set(found_workflow_ids))
-
-    # Fix up the session information
-    session['workflows'] = found_workflow_ids
-    for one_missing_id in missing_workflows:
-        if one_missing_id in session:
-            session.pop(one_missing_id)
-
-    # If we have workflows
+    offset = request.args.get('offset', '0')
+    limit = request.args.get('limit')
+    if not offset.isdigit() or (limit is not None and not limit.isdigit()):
+        print(f'Invalid recover arguments requested: offset "{offset}" limit "{limit}"', flush=True)
+        return 'Invalid recover arguments', 400
+
+    runs, total = RUN_REGISTRY.list_runs(_get_run_owner(), int(offset), int(limit) if limit is not None else None)
+
+    # Only the workflows that are still running need their status checked
+    found_statuses = workflow_statuses([one_run['id'] for one_run in runs])
+
     all_workflows = []
-    for one_workflow_id in found_workflow_ids:
-        working_dir = os.path.join(WORKFLOW_RUN_PATH, one_workflow_id)
-        workflow_params = os.path.join(working_dir, '_params')
-        workflow_file = os.path.join(working_dir, '_workflow')
-        with open(workflow_params, 'r', encoding='utf8') as in_file:
-            workflow_params = json.load(in_file)
-        with open(workflow_file, 'r', encoding='utf8') as in_file:
-            found_workflow = json.load(in_file)
+    for one_run in runs:
+        # Forget workflows whose folders are gone
+        if found_statuses[one_run['id']] is None:
+            RUN_REGISTRY.remove_run(one_run['id'])
+            total -= 1
+            continue
 
         workflow_data = {
-            'id': one_workflow_id,
-            'params': workflow_params,
-            'workflow': found_workflow,
-            'status': workflow_status(one_workflow_id, working_dir)
+            'id': one_run['id'],
+            'params': one_run['params'],
+            'workflow': one_run['workflow'],
+            'status': found_statuses[one_run['id']]
             }
 
         all_workflows.append(workflow_data)
 
-    return json.dumps(all_workflows)
+    # Make sure the recovered workflows can be accessed
+    known_workflows = session['workflows'] if 'workflows' in session and session['workflows'] else []
+    known_ids = set(known_workflows)
+    missing_ids = [one_workflow['id'] for one_workflow in all_workflows if one_workflow['id'] not in known_ids]
+    if missing_ids:
+        session['workflows'] = known_workflows + missing_ids
+
+    response = make_response(json.dumps(all_workflows))
+    response.headers.set('X-Total-Count', str(total))
+    response.headers.set('Access-Control-Expose-Headers', 'X-Total-Count')
+    return response
 
 
 @app.route('/workflow/delete/<string:workflow_id>', methods=['PUT'])
@@ -1451,11 +2504,19 @@ def handle_workflow_delete(workflow_id: str) -> tuple:
 
         if os.path.isdir(working_dir):
             # If it's not completed running, return a message
-            cur_status = workflow_status(workflow_id, working_dir)
-            if not cur_status['result'] == STATUS_FINISHED:
-                return 'Workflow is still running', 409
+            run = RUN_REGISTRY.get_run(workflow_id)
+            if run is None or run['status'] not in RUN_FINISHED_STATUSES:
+                cur_status = workflow_status(workflow_id, working_dir)
+                if not cur_status['result'] == STATUS_FINISHED:
+                    return 'Workflow is still running', 409
+            if is_stageout_active(workflow_stageout_status(working_dir)):
+                return 'Workflow results are still being uploaded', 409
 
             shutil.rmtree(working_dir)
+            PARSED_STATUS_CACHE.remove(os.path.join(working_dir, 'status.json'))
+
+        RUN_REGISTRY.remove_run(workflow_id)
+        session['workflows'] = [one_id for one_id in cur_workflows if one_id != workflow_id]
 
         return json.dumps({'id': workflow_id})
 
@@ -1465,6 +2526,36 @@ def handle_workflow_delete(workflow_id: str) -> tuple:
         return str(ex), 500     # Server error
 
 
+@app.route('/workflow/status', methods=['GET'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def handle_workflow_statuses() -> tuple:
+    """Returns the status of several workflows
+    Request args:
+        ids: optional comma separated list of workflow IDs to query; all the workflows of the session are queried by default
+    """
+    try:
+        print("Workflow statuses")
+        cur_workflows = session['workflows'] if 'workflows' in session and session['workflows'] else []
+
+        requested_ids = request.args.get('ids')
+        if requested_ids:
+            workflow_ids = [one_id.strip() for one_id in requested_ids.split(',') if one_id.strip()]
+            invalid_ids = [one_id for one_id in workflow_ids if one_id not in cur_workflows]
+            if invalid_ids:
+                msg = f'ERROR: attempt made to access invalid workflows {invalid_ids}'
+                print(msg)
+                return msg, 400     # Bad request
+        else:
+            workflow_ids = cur_workflows
+
+        validator = tuple(_get_status_version(os.path.join(WORKFLOW_RUN_PATH, one_id)) for one_id in workflow_ids)
+        return conditional_response((tuple(workflow_ids), validator), lambda: json.dumps(workflow_statuses(workflow_ids)))
+    except Exception as ex:
+        print("Exception caught handling workflow statuses", str(ex))
+        traceback.print_exc()
+        return str(ex), 500     # Server error
+
+
 @app.route('/workflow/status/<string:workflow_id>', methods=['GET'])
 @cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
 def handle_workflow_status(workflow_id: str) -> tuple:
@@ -1490,19 +2581,114 @@ def handle_workflow_status(workflow_id: str) -> tuple:
             print(msg)
             return msg, 404     # Not found
 
-        return json.dumps(workflow_status(workflow_id, working_dir))
+        return conditional_response((_get_status_version(working_dir),),
+                                     lambda: json.dumps(workflow_status(workflow_id, working_dir)))
     except Exception as ex:
         print("Exception caught handling workflow status", str(ex))
         traceback.print_exc()
         return str(ex), 500     # Server error
 
 
+@app.route('/workflow/stageout/<string:workflow_id>', methods=['POST'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def handle_workflow_stageout_start(workflow_id: str) -> tuple:
+    """Starts uploading a workflow's results to iRODS once it finishes
+    Arguments:
+        workflow_id: the id of the workflow
+    Request body:
+        path: the iRODS collection to upload to; the results are put into a sub-collection named after the workflow
+    """
+    try:
+        print("Workflow stage-out", workflow_id)
+        cur_workflows = session['workflows'] if 'workflows' in session else None
+        if not cur_workflows or workflow_id not in cur_workflows:
+            msg = f'ERROR: attempt made to access invalid workflow {workflow_id}'
+            print(msg)
+            return msg, 400     # Bad request
+
+        stageout_data = request.get_json(force=True)
+        if not stageout_data or not stageout_data.get('path') or 'connection' not in session:
+            msg = "Stage-out of workflow results requires a path and an iRODS connection"
+            print(msg)
+            return msg, 400     # Bad request
+
+        working_dir = os.path.abspath(os.path.join(WORKFLOW_RUN_PATH, workflow_id))
+        if not working_dir.startswith(WORKFLOW_RUN_PATH) or not os.path.isdir(working_dir):
+            print(f'Invalid workflow requested: "{workflow_id}"', flush=True)
+            return 'Resource not found', 404
+
+        if is_stageout_active(workflow_stageout_status(working_dir)):
+            return 'Workflow results are already being uploaded', 409
+
+        start_workflow_stageout(workflow_id, working_dir, session['connection'], stageout_data['path'])
+
+        return json.dumps(workflow_stageout_status(working_dir)), 202
+    except Exception as ex:
+        print("Exception caught handling workflow stage-out", str(ex))
+        traceback.print_exc()
+        return str(ex), 500     # Server error
+
+
+@app.route('/workflow/stageout/<string:workflow_id>', methods=['GET'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def handle_workflow_stageout_status(workflow_id: str) -> tuple:
+    """Returns the status of uploading a workflow's results
+    Arguments:
+        workflow_id: the id of the workflow
+    """
+    cur_workflows = session['workflows'] if 'workflows' in session else None
+    if not cur_workflows or workflow_id not in cur_workflows:
+        msg = f'ERROR: attempt made to access invalid workflow {workflow_id}'
+        print(msg)
+        return msg, 400     # Bad request
+
+    working_dir = os.path.abspath(os.path.join(WORKFLOW_RUN_PATH, workflow_id))
+    if not working_dir.startswith(WORKFLOW_RUN_PATH) or not os.path.isdir(working_dir):
+        print(f'Invalid workflow requested: "{workflow_id}"', flush=True)
+        return 'Resource not found', 404
+
+    stageout_status = workflow_stageout_status(working_dir)
+    if stageout_status is None:
+        return 'Workflow results are not being uploaded', 404
+
+    return json.dumps(stageout_status)
+
+
+def _get_request_cursors() -> tuple:
+    """Returns the message cursors specified in the request
+    Return:
+        A 2-tuple of a dict of the 'messages' and 'errors' cursors found and an error message. The error message is None if
+        the cursors are valid
+    Notes:
+        The cursors are taken from the 'messages_cursor' and 'errors_cursor' request arguments, or from a "<messages>:<errors>"
+        Last-Event-ID header sent by a reconnecting event stream
+    """
+    cursors = {}
+
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id and ':' in last_event_id:
+        request_cursors = dict(zip(['messages', 'errors'], last_event_id.split(':', 1)))
+    else:
+        request_cursors = {one_name: request.args.get(one_name + '_cursor') for one_name in ['messages', 'errors']}
+
+    for one_name, cur_cursor in request_cursors.items():
+        if cur_cursor:
+            if not cur_cursor.isdigit():
+                return None, f'ERROR: invalid {one_name} cursor specified "{cur_cursor}"'
+            cursors[one_name] = int(cur_cursor)
+
+    return cursors, None
+
+
 @app.route('/workflow/messages/<string:workflow_id>', methods=['GET'])
 @cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
 def get_workflow_messages(workflow_id: str) -> tuple:
     """Returns the messages from the workflow
     Arguments:
         workflow_id: the id of the workflow to query
+    Request args:
+        messages_cursor: optional cursor returned by a previous call; only newer messages are returned
+        errors_cursor: optional cursor returned by a previous call; only newer errors are returned
     """
     try:
         print("Workflow messges", workflow_id)
@@ -1512,6 +2698,11 @@ def get_workflow_messages(workflow_id: str) -> tuple:
             print(msg)
             return msg, 400     # Bad request
 
+        cursors, msg = _get_request_cursors()
+        if msg is not None:
+            print(msg)
+            return msg, 400     # Bad request
+
         working_dir = os.path.abspath(os.path.join(WORKFLOW_RUN_PATH, workflow_id))
         if not working_dir.startswith(WORKFLOW_RUN_PATH):
             print(f'Invalid workflow requested: "{workflow_id}"', flush=True)
@@ -1522,13 +2713,57 @@ def get_workflow_messages(workflow_id: str) -> tuple:
             print(msg)
             return msg, 404     # Not found
 
-        return json.dumps(workflow_messages(workflow_id, working_dir))
+        return conditional_response(workflow_messages_signature(working_dir),
+                                     lambda: json.dumps(workflow_messages(workflow_id, working_dir, cursors)))
     except Exception as ex:
         print("Exception caught handling workflow messages", str(ex))
         traceback.print_exc()
         return str(ex), 500     # Server error
 
 
+@app.route('/workflow/stream/<string:workflow_id>', methods=['GET'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def get_workflow_stream(workflow_id: str) -> tuple:
+    """Streams status changes and new messages of the workflow as server-sent events
+    Arguments:
+        workflow_id: the id of the workflow to stream
+    Request args:
+        messages_cursor: optional cursor of messages already received
+        errors_cursor: optional cursor of errors already received
+    """
+    try:
+        print("Workflow stream", workflow_id)
+        cur_workflows = session['workflows']
+        if not cur_workflows or workflow_id not in cur_workflows:
+            msg = f'ERROR: attempt made to access invalid workflow {workflow_id}'
+            print(msg)
+            return msg, 400     # Bad request
+
+        cursors, msg = _get_request_cursors()
+        if msg is not None:
+            print(msg)
+            return msg, 400     # Bad request
+
+        working_dir = os.path.abspath(os.path.join(WORKFLOW_RUN_PATH, workflow_id))
+        if not working_dir.startswith(WORKFLOW_RUN_PATH):
+            print(f'Invalid workflow requested: "{workflow_id}"', flush=True)
+            return 'Resource not found', 404
+
+        if not os.path.isdir(working_dir):
+            msg = "ERROR: requested workflow no longer exists"
+            print(msg)
+            return msg, 404     # Not found
+
+        response = Response(workflow_events(workflow_id, working_dir, cursors), mimetype='text/event-stream')
+        response.headers.set('Cache-Control', 'no-cache')
+        response.headers.set('X-Accel-Buffering', 'no')
+        return response
+    except Exception as ex:
+        print("Exception caught handling workflow stream", str(ex))
+        traceback.print_exc()
+        return str(ex), 500     # Server error
+
+
 @app.route('/workflow/download', methods=['POST'])
 @cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
 def return_workflow_download() -> tuple:
@@ -1596,66 +2831,146 @@ def return_workflow_download_all() -> tuple:
     return response
 
 
-@app.route('/workflow/artifact', methods=['POST'])
-@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
-def return_workflow_artifact() -> tuple:
-    """Handles returning a workflow for downloading"""
-    # Get the form contents
-    print("Workflow artifact")
-    workflow = json.loads(request.form['workflow'])
-    workflow_id = request.form['workflow_id']
-    data_path = request.form['workflow_path']
-    if 'filename' in request.form:
-        save_filename = request.form['filename']
-    else:
-        save_filename = None
-
-    print("ARTIFACT:", workflow_id, data_path, str(save_filename), workflow)
+def _return_workflow_artifact(workflow_id: str, data_path: str, save_filename: Optional[str]) -> tuple:
+    """Returns a workflow artifact for downloading
+    Arguments:
+        workflow_id: the ID of the workflow run
+        data_path: the step command and artifact name separated by a '|'
+        save_filename: optional name to save the file as; the name of the artifact's file is used by default
+    Notes:
+        The artifact is looked up in the workflow saved for the run
+    """
+    print("ARTIFACT:", workflow_id, data_path, str(save_filename))
 
     # Check parameters
-    cur_workflows = session['workflows']
+    cur_workflows = session['workflows'] if 'workflows' in session else None
     if not cur_workflows or workflow_id not in cur_workflows:
         msg = f'ERROR: attempt made to access invalid workflow {workflow_id}'
         print(msg)
         return msg, 400     # Bad request
 
+    if data_path.count('|') != 1:
+        msg = f'ERROR: invalid workflow artifact requested {data_path}'
+        print(msg)
+        return msg, 400     # Bad request
+
     working_dir = os.path.abspath(os.path.join(WORKFLOW_RUN_PATH, workflow_id))
-    if not working_dir.startswith(WORKFLOW_RUN_PATH):
+    if not working_dir.startswith(WORKFLOW_RUN_PATH) or not os.path.isdir(working_dir):
         print(f'Invalid workflow artifact requested: "{workflow_id}"', flush=True)
         return 'Resource not found', 404
 
     # Find the file to download
-    found_file = None
+    workflow = load_run_workflow(working_dir, RUN_REGISTRY.get_run(workflow_id))
     step_command, artifact_name = data_path.split('|')
-    print("ARTIFACT:",step_command, artifact_name)
-    for one_step in workflow['steps']:
-        if one_step['command'] == step_command:
-            for one_result in one_step['results']:
-                if one_result['name'] == artifact_name:
-                    found_file = one_result['filename']
-                    break
-        if found_file is not None:
-            break
-
-    # Check that we can download it
-    artifact_path = os.path.abspath(os.path.join(working_dir, step_command, found_file))
-    print("ARTIFACT PATH:",artifact_path,working_dir)
-    if not artifact_path.startswith(working_dir):
-        print(f'Invalid workflow artifact requested: "{workflow_id}" "{artifact_name}"', flush=True)
+    found = find_artifact(working_dir, workflow, step_command, artifact_name) if workflow is not None else None
+    if found is None:
+        print(f'Unknown workflow artifact requested: "{workflow_id}" "{data_path}"', flush=True)
         return 'Resource not found', 404
-    if not os.path.exists(artifact_path) or not os.path.isfile(artifact_path):
-        print(f'Invalid workflow artifact file requested: "{workflow_id}" "{artifact_name}"', flush=True)
+
+    artifact_path, found_file = found
+    print("ARTIFACT RETURNING", artifact_path, save_filename or found_file)
+    return artifact_response(artifact_path, save_filename or found_file)
+
+
+@app.route('/workflow/artifact', methods=['GET', 'POST'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def return_workflow_artifact() -> tuple:
+    """Handles returning a workflow artifact for downloading
+    Request values:
+        workflow_id: the ID of the workflow run
+        workflow_path: the step command and artifact name separated by a '|'
+        filename: optional name to save the file as
+    Notes:
+        The values can be sent as form fields or as query arguments. A 'workflow' value sent by older clients is ignored;
+        the artifact is looked up in the workflow saved for the run. Range requests are better made to
+        /workflow/artifact/<workflow_id>, which names the artifact without a form
+    """
+    print("Workflow artifact")
+    return _return_workflow_artifact(request.values['workflow_id'], request.values['workflow_path'],
+                                     request.values.get('filename'))
+
+
+@app.route('/workflow/artifact/<string:workflow_id>', methods=['GET'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def return_run_artifact(workflow_id: str) -> tuple:
+    """Handles returning a workflow artifact for downloading
+    Arguments:
+        workflow_id: the ID of the workflow run
+    Request args:
+        path: the step command and artifact name separated by a '|'
+        filename: optional name to save the file as
+    Notes:
+        The file is streamed with a content type based on its name and ETag and Last-Modified headers. Conditional and
+        Range requests are supported so that downloads can be resumed
+    """
+    print("Workflow run artifact", workflow_id)
+    return _return_workflow_artifact(workflow_id, request.args['path'], request.args.get('filename'))
+
+
+def _get_workflow_archive_entries(working_dir: str, steps: Optional[list] = None) -> list:
+    """Returns the files of a workflow run to include in an archive
+    Arguments:
+        working_dir: the working folder of the workflow run
+        steps: optional list of the step folders to include; the whole working folder is included by default
+    Return:
+        Returns a list of (file path, name in the archive) tuples sorted by name
+    Notes:
+        Hidden files, the files in WORKFLOW_ARCHIVE_EXCLUDED_NAMES, links, and the placeholders of mounted files are skipped
+    """
+    excluded_paths = {os.path.join(working_dir, one_name) for one_name in WORKFLOW_ARCHIVE_EXCLUDED_NAMES}
+    excluded_paths.update(os.path.join(working_dir, one_mount[1]) for one_mount in load_read_only_mounts(working_dir))
+
+    top_folders = [os.path.join(working_dir, one_step) for one_step in steps] if steps else [working_dir]
+    entries = []
+    for one_folder in top_folders:
+        for dir_path, dir_names, file_names in os.walk(one_folder):
+            dir_names[:] = sorted(one_name for one_name in dir_names if one_name[0] != '.')
+            for one_name in sorted(file_names):
+                file_path = os.path.join(dir_path, one_name)
+                if one_name[0] == '.' or file_path in excluded_paths or os.path.islink(file_path):
+                    continue
+                entries.append((file_path, os.path.relpath(file_path, working_dir).replace(os.sep, '/')))
+
+    return entries
+
+
+@app.route('/workflow/archive/<string:workflow_id>', methods=['GET'])
+@cross_origin(origin='127.0.0.1:3000', headers=['Content-Type','Authorization'])
+def return_workflow_archive(workflow_id: str) -> tuple:
+    """Returns a ZIP archive of the files of a finished workflow run
+    Arguments:
+        workflow_id: the id of the workflow run
+    Request args:
+        steps: optional comma separated list of the step commands to include the results of; all the files are included by default
+    Notes:
+        The archive is streamed as it's generated
+    """
+    print("Workflow archive", workflow_id)
+    cur_workflows = session['workflows'] if 'workflows' in session else None
+    if not cur_workflows or workflow_id not in cur_workflows:
+        msg = f'ERROR: attempt made to access invalid workflow {workflow_id}'
+        print(msg)
+        return msg, 400     # Bad request
+
+    working_dir = os.path.abspath(os.path.join(WORKFLOW_RUN_PATH, workflow_id))
+    if not working_dir.startswith(WORKFLOW_RUN_PATH) or not os.path.isdir(working_dir):
+        print(f'Invalid workflow archive requested: "{workflow_id}"', flush=True)
         return 'Resource not found', 404
 
-    if not save_filename:
-        save_filename = found_file
+    steps = None
+    if request.args.get('steps'):
+        steps = [one_step.strip() for one_step in request.args['steps'].split(',') if one_step.strip()]
+        for one_step in steps:
+            step_dir = os.path.abspath(os.path.join(working_dir, one_step))
+            if not step_dir.startswith(working_dir + os.sep) or not os.path.isdir(step_dir):
+                print(f'Invalid workflow archive step requested: "{workflow_id}" "{one_step}"', flush=True)
+                return 'Resource not found', 404
 
-    print("ARTIFACT RETURNING", artifact_path, save_filename)
-    with open(artifact_path, 'r', encoding='utf8') as in_file:
-        response = make_response(in_file.read())
-    response.headers.set('Content-Type', 'text')
-    response.headers.set('Content-Disposition', 'attachment', filename=save_filename)
+    if workflow_status(workflow_id, working_dir)['result'] != STATUS_FINISHED:
+        return 'Workflow is still running', 409
 
+    response = Response(stream_zip(_get_workflow_archive_entries(working_dir, steps)), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=workflow_id + '.zip')
     return response
 
 
@@ -1721,7 +3036,8 @@ def _workflow_upload_file_handle(workflow_path: str, workflow_def: dict) -> tupl
         The list of workflows may be None if a problem is found. The workflow IDs may be None if the workflows are definitions and not one
         that had already been run. The message may be None if no problems were found
     Notes:
-        Contains the logic for processing uploaded workflow related files
+        Contains the logic for processing uploaded workflow related files. Workflow definitions are returned without being
+        added to the registry
     """
     msg = None
     workflow_id = None
@@ -1737,16 +3053,7 @@ def _workflow_upload_file_handle(workflow_path: str, workflow_def: dict) -> tupl
             print(msg, WORKFLOW_DEFINITION_SAVE_VERSIONS_SUPPORTED)
             return None, None, msg
 
-        for one_workflow_def in workflow_def['workflows']:
-            found = False
-            for tmp_workflow in WORKFLOW_DEFINITIONS:
-                if tmp_workflow['id'] == one_workflow_def['id']:
-                    found = True
-                    break
-
-            if not found:
-                WORKFLOW_DEFINITIONS.append(one_workflow_def)
-                return_workflows.append(one_workflow_def)
+        return_workflows.extend(workflow_def['workflows'])
     else:
         # Workflow "run" file
         if str(workflow_def['version']) not in WORKFLOW_SAVE_VERSIONS_SUPPORTED:
@@ -1789,7 +3096,7 @@ def workflow_upload_file():
 
     # Load the workflows while checking their contents
     # TODO: handle zip files: see return_workflow_download()
-    return_workflows, return_messages, loaded_file_info = ([], [], {})
+    return_workflows, return_messages, loaded_file_info, new_definitions = ([], [], {}, [])
 
     for one_workflow in loaded_filenames:
         # Load the workflow file
@@ -1809,10 +3116,18 @@ def workflow_upload_file():
 
         if workflow_id is not None:
             loaded_file_info[workflow_id] = one_workflow
+        elif final_workflow_list is not None:
+            new_definitions.extend(final_workflow_list)
 
         if final_workflow_list is not None:
             return_workflows.extend(final_workflow_list)
 
+    # The uploaded definitions are only added when none of them replace a known definition
+    duplicate_ids = WORKFLOW_REGISTRY.add_unique(new_definitions)
+    if duplicate_ids:
+        msg = f'ERROR: uploaded workflow definitions have IDs that are already in use: {duplicate_ids}'
+        print(msg)
+        return msg, 409     # Conflict
 
     if 'workflow_files' not in session or session['workflow_files'] is None:
         print("SESSION WORKFLOW FILES: ", str(loaded_file_info))
@@ -1842,8 +3157,10 @@ def workflow_new():
         print ("Missing or bad workflow:", str(new_workflow))
         return 'Repository fields are missing or invalid', 400
 
-    # Get our additional parameters
-    WORKFLOW_DEFINITIONS.append(new_workflow)
+    if not WORKFLOW_REGISTRY.add(new_workflow):
+        msg = f'ERROR: a workflow definition with the ID "{new_workflow["id"]}" already exists'
+        print(msg)
+        return msg, 409     # Conflict
 
     return json.dumps({'id': new_workflow['id']})
 
@@ -2029,60 +3346,54 @@ def algo_git_check():
     # Get the list of branches and tags
     local_repo_id = uuid.uuid4().hex
     local_repo_dir = os.path.join(CODE_REPOSITORY_PATH, local_repo_id)
-    cur_dir = os.getcwd()
     os.makedirs(local_repo_dir)
-    os.chdir(local_repo_dir)
     results = {'id': local_repo_id, 'branches': [], 'tags': []}
 
-    try:
-        cmd = ['git', 'init']
-        res = subprocess.run(cmd, stdout=subprocess.DEVNULL, check=False)
-        if res.returncode != 0:
-            print("Unable to initialize git repository at", local_repo_dir)
-            return "Internal error", 500
-
-        cmd = ['git', 'remote', 'add', 'origin', repo_url]
-        res = subprocess.run(cmd, stdout=subprocess.DEVNULL, check=False)
-        if res.returncode != 0:
-            print("Unable to configure git repository at", local_repo_dir)
-            return "Configuration error", 400
-
-        cmd = ['git', 'fetch']
-        res = subprocess.run(cmd, stdout=subprocess.DEVNULL, check=False)
-        if res.returncode != 0:
-            print("Unable to fetch git repository at", local_repo_dir)
-            return "Update error", 400
-
-        # Get the branches and try to find the specified one
-        cmd = ['git', 'branch', '-r']
-        res = subprocess.run(cmd, stdout=subprocess.PIPE, check=False)
-        if res.returncode != 0:
-            print("Unable to list branches for git repository at", local_repo_dir)
-            return "Branch listing error", 400
-
-        branches = res.stdout.decode("utf-8").split('\n')
-        for one_branch in branches:
-            cur_branch = one_branch.strip()
-            if cur_branch:
-                if cur_branch.startswith('origin/'):
-                    cur_branch = cur_branch[len('origin/'):]
-                results['branches'].append(cur_branch)
-
-        # Get the tags and try to find the specified one
-        cmd = ['git', 'tag', '-l']
-        res = subprocess.run(cmd, stdout=subprocess.PIPE, check=False)
-        if res.returncode != 0:
-            print("Unable to list tags for git repository at", local_repo_dir)
-            return "Tags listing error", 400
-
-        tags = res.stdout.decode("utf-8").split('\n')
-        for one_tag in tags:
-            cur_tag = one_tag.strip()
-            if cur_tag:
-                results['tags'].append(cur_tag)
-    finally:
-        print("CHANGING BACK TO FOLDER", cur_dir)
-        os.chdir(cur_dir)
+    cmd = ['git', 'init']
+    res = subprocess.run(cmd, stdout=subprocess.DEVNULL, check=False, cwd=local_repo_dir)
+    if res.returncode != 0:
+        print("Unable to initialize git repository at", local_repo_dir)
+        return "Internal error", 500
+
+    cmd = ['git', 'remote', 'add', 'origin', repo_url]
+    res = subprocess.run(cmd, stdout=subprocess.DEVNULL, check=False, cwd=local_repo_dir)
+    if res.returncode != 0:
+        print("Unable to configure git repository at", local_repo_dir)
+        return "Configuration error", 400
+
+    cmd = ['git', 'fetch']
+    res = subprocess.run(cmd, stdout=subprocess.DEVNULL, check=False, cwd=local_repo_dir)
+    if res.returncode != 0:
+        print("Unable to fetch git repository at", local_repo_dir)
+        return "Update error", 400
+
+    # Get the branches and try to find the specified one
+    cmd = ['git', 'branch', '-r']
+    res = subprocess.run(cmd, stdout=subprocess.PIPE, check=False, cwd=local_repo_dir)
+    if res.returncode != 0:
+        print("Unable to list branches for git repository at", local_repo_dir)
+        return "Branch listing error", 400
+
+    branches = res.stdout.decode("utf-8").split('\n')
+    for one_branch in branches:
+        cur_branch = one_branch.strip()
+        if cur_branch:
+            if cur_branch.startswith('origin/'):
+                cur_branch = cur_branch[len('origin/'):]
+            results['branches'].append(cur_branch)
+
+    # Get the tags and try to find the specified one
+    cmd = ['git', 'tag', '-l']
+    res = subprocess.run(cmd, stdout=subprocess.PIPE, check=False, cwd=local_repo_dir)
+    if res.returncode != 0:
+        print("Unable to list tags for git repository at", local_repo_dir)
+        return "Tags listing error", 400
+
+    tags = res.stdout.decode("utf-8").split('\n')
+    for one_tag in tags:
+        cur_tag = one_tag.strip()
+        if cur_tag:
+            results['tags'].append(cur_tag)
 
     repo_info = {'id': local_repo_id, 'url': repo_url}
     if 'repos' not in session or session['repos'] is None:
@@ -2120,4 +3431,5 @@ def algo_git_clear(repo_id: str):
     return json.dumps({'id': repo_id})
 
 if __name__ == '__main__':
+    start_workflow_services(os.getpid())
     app.run(debug=False)
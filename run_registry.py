@@ -0,0 +1,347 @@
+"""Implements the registry of workflow runs shared by the server and the workflow runner"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from typing import Optional
+
+# Status of runs that are having their input files staged
+RUN_STATUS_STAGING = 'staging'
+
+# Status of runs that are waiting for the scheduler to run them
+RUN_STATUS_QUEUED = 'queued'
+
+# Status of runs whose workflow runner has been started
+RUN_STATUS_RUNNING = 'running'
+
+# Status of runs that finished without an error
+RUN_STATUS_COMPLETED = 'completed'
+
+# Status of runs that finished with an error
+RUN_STATUS_FAILED = 'failed'
+
+# Statuses of runs that have finished
+RUN_FINISHED_STATUSES = (RUN_STATUS_COMPLETED, RUN_STATUS_FAILED)
+
+# Number of seconds to wait for another process to finish writing to the registry
+RUN_REGISTRY_TIMEOUT_SEC = 30
+
+# Columns returned for runs, in the order they're selected
+RUN_COLUMNS = ('id', 'owner', 'definition_id', 'name', 'start_time', 'end_time', 'status', 'completion', 'output_bytes',
+               'workflow', 'params', 'priority')
+
+# Columns added to the runs table after it was first created, with their definitions
+RUN_ADDED_COLUMNS = {'priority': 'INTEGER NOT NULL DEFAULT 0', 'queued_time': 'REAL', 'admit_time': 'REAL',
+                     'pid': 'INTEGER', 'queue_position': 'INTEGER'}
+
+
+def order_queued_runs(queued: list, running_counts: dict) -> list:
+    """Returns queued runs in the order they're to be run, sharing the running slots fairly between owners
+    Arguments:
+        queued - the queued runs as dicts with 'id', 'owner', 'priority' and 'queued_time' keys
+        running_counts - the number of running runs of each owner
+    Return:
+        Returns the list of queued runs in the order they're to be run
+    Notes:
+        The next run is always taken from the owner with the fewest running, or already chosen, runs; between owners with
+        the same number, the owner whose oldest remaining run was queued first goes first. Priorities only order an
+        owner's own runs, so that an owner can't get ahead of others by raising them: the owner's run with the highest
+        priority goes first, then the one queued first
+    """
+    owner_runs = {}
+    for one_run in sorted(queued, key=lambda one_run: (-one_run['priority'], one_run['queued_time'], one_run['id'])):
+        owner_runs.setdefault(one_run['owner'], []).append(one_run)
+
+    counts = dict(running_counts)
+    ordered = []
+    while owner_runs:
+        next_owner = min(owner_runs, key=lambda owner: (counts.get(owner, 0),
+                                                        min(one_run['queued_time'] for one_run in owner_runs[owner]),
+                                                        owner))
+        ordered.append(owner_runs[next_owner].pop(0))
+        if not owner_runs[next_owner]:
+            del owner_runs[next_owner]
+        counts[next_owner] = counts.get(next_owner, 0) + 1
+    return ordered
+
+
+class RunRegistry:
+    """Keeps a record of workflow runs in an SQLite database
+
+    Runs are added when they're started and updated by the workflow runner when they finish. Runs are indexed by their
+    owner and start time so that the runs of an owner are listed a page at a time. The workflow and parameters of a run
+    are kept as JSON and returned as loaded values
+
+    Runs are staged, queued, and then admitted to run by the scheduler. Admitting runs is done in an exclusive
+    transaction so that the server's processes agree on which runs are running
+    """
+
+    def __init__(self, db_path: str):
+        """Initializes class instance
+        Arguments:
+            db_path - the path of the database file, which is created if needed
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = sqlite3.connect(self.db_path, timeout=RUN_REGISTRY_TIMEOUT_SEC)
+        try:
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, owner TEXT, definition_id TEXT, '
+                             'name TEXT, start_time REAL NOT NULL, end_time REAL, status TEXT NOT NULL, completion TEXT, '
+                             'output_bytes INTEGER, workflow TEXT, params TEXT)')
+                existing = [one_row[1] for one_row in conn.execute('PRAGMA table_info(runs)')]
+                for one_column, one_definition in RUN_ADDED_COLUMNS.items():
+                    if one_column not in existing:
+                        conn.execute(f'ALTER TABLE runs ADD COLUMN {one_column} {one_definition}')
+                conn.execute('CREATE INDEX IF NOT EXISTS runs_owner ON runs (owner, start_time)')
+                conn.execute('CREATE INDEX IF NOT EXISTS runs_status ON runs (status)')
+        finally:
+            conn.close()
+
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns this thread's connection to the database"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=RUN_REGISTRY_TIMEOUT_SEC)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+
+    def close(self) -> None:
+        """Closes this thread's connection to the database"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+    @staticmethod
+    def _to_run(row: tuple) -> dict:
+        """Returns the run of a database row
+        Arguments:
+            row - the row selected with RUN_COLUMNS
+        """
+        run = dict(zip(RUN_COLUMNS, row))
+        for one_key in ('completion', 'workflow', 'params'):
+            if run[one_key] is not None:
+                run[one_key] = json.loads(run[one_key])
+        return run
+
+
+    def add_run(self, run_id: str, owner: str, definition_id: str, workflow: dict, params: list,
+                start_time: float = None, priority: int = 0, pid: int = None) -> None:
+        """Adds a workflow that's having its input files staged
+        Arguments:
+            run_id - the ID of the run
+            owner - the ID of the owner of the run
+            definition_id - the ID of the workflow definition being run
+            workflow - the workflow being run
+            params - the parameters of the run
+            start_time - the time the run started; the current time is used by default
+            priority - the priority of the run over the owner's other runs; higher priority runs are run first
+            pid - the ID of the process staging the run's input files; the current process by default
+        """
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO runs (id, owner, definition_id, name, start_time, status, workflow, params, '
+                         'priority, pid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (run_id, owner, definition_id, workflow.get('name'),
+                          start_time if start_time is not None else time.time(), RUN_STATUS_STAGING, json.dumps(workflow),
+                          json.dumps(params), priority, pid if pid is not None else os.getpid()))
+
+
+    def queue_run(self, run_id: str, queued_time: float = None) -> None:
+        """Queues a staged run to be run by the scheduler
+        Arguments:
+            run_id - the ID of the run
+            queued_time - the time the run was queued; the current time is used by default
+        """
+        with self._connect() as conn:
+            conn.execute('UPDATE runs SET status = ?, queued_time = ?, queue_position = NULL, pid = NULL WHERE id = ?',
+                         (RUN_STATUS_QUEUED, queued_time if queued_time is not None else time.time(), run_id))
+
+
+    def admit_runs(self, can_admit: Callable, position_func: Callable = None) -> list:
+        """Marks queued runs as running, in fair share order, for as long as there's room for them
+        Arguments:
+            can_admit - called with the number of running runs and the number of runs admitted so far, returns whether
+                        another run can be admitted
+            position_func - called with the run ID and the new queue position of each run still queued whose position
+                            changed, and with the run ID and None for each admitted run
+        Return:
+            Returns the list of IDs of the admitted runs
+        Notes:
+            The database stays locked until position_func has been called for every run, so that updates of the runs'
+            status files aren't mixed up with those of other processes
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            running_counts = dict(conn.execute('SELECT owner, COUNT(*) FROM runs WHERE status = ? GROUP BY owner',
+                                               (RUN_STATUS_RUNNING,)).fetchall())
+            queued = [dict(zip(('id', 'owner', 'priority', 'queued_time', 'queue_position'), one_row)) for one_row in
+                      conn.execute('SELECT id, owner, priority, queued_time, queue_position FROM runs WHERE status = ?',
+                                   (RUN_STATUS_QUEUED,))]
+            ordered = order_queued_runs(queued, running_counts)
+
+            running_total = sum(running_counts.values())
+            admitted = []
+            while len(admitted) < len(ordered) and can_admit(running_total + len(admitted), len(admitted)):
+                admitted.append(ordered[len(admitted)]['id'])
+
+            now = time.time()
+            for one_id in admitted:
+                conn.execute('UPDATE runs SET status = ?, admit_time = ?, queue_position = NULL WHERE id = ?',
+                             (RUN_STATUS_RUNNING, now, one_id))
+                if position_func is not None:
+                    position_func(one_id, None)
+            for position, one_run in enumerate(ordered[len(admitted):], start=1):
+                if one_run['queue_position'] != position:
+                    conn.execute('UPDATE runs SET queue_position = ? WHERE id = ?', (position, one_run['id']))
+                    if position_func is not None:
+                        position_func(one_run['id'], position)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        return admitted
+
+
+    def set_run_pid(self, run_id: str, pid: int) -> None:
+        """Records the process ID of the workflow runner of a run
+        Arguments:
+            run_id - the ID of the run
+            pid - the process ID of the run's workflow runner
+        """
+        with self._connect() as conn:
+            conn.execute('UPDATE runs SET pid = ? WHERE id = ?', (pid, run_id))
+
+
+    def get_running_runs(self) -> list:
+        """Returns the runs that have been admitted and haven't finished
+        Return:
+            Returns a list of 3-tuples of the run ID, the process ID of its workflow runner (None if it hasn't been
+            recorded), and the time it was admitted
+        """
+        return self._connect().execute('SELECT id, pid, admit_time FROM runs WHERE status = ?',
+                                       (RUN_STATUS_RUNNING,)).fetchall()
+
+
+    def get_staging_runs(self) -> list:
+        """Returns the runs that are having their input files staged
+        Return:
+            Returns a list of 2-tuples of the run ID and the ID of the process staging its files (None if it wasn't
+            recorded)
+        """
+        return self._connect().execute('SELECT id, pid FROM runs WHERE status = ?', (RUN_STATUS_STAGING,)).fetchall()
+
+
+    def fail_running_run(self, run_id: str, completion: dict, status: str = RUN_STATUS_RUNNING) -> bool:
+        """Records that a run failed, if it's still running
+        Arguments:
+            run_id - the ID of the run
+            completion - the completion status of the run
+            status - the status the run needs to still have; RUN_STATUS_STAGING fails a run that's still being staged
+        Return:
+            Returns True if the run still had the status and has been marked as failed, and False otherwise
+        """
+        with self._connect() as conn:
+            cursor = conn.execute('UPDATE runs SET end_time = ?, status = ?, completion = ?, output_bytes = 0 '
+                                  'WHERE id = ? AND status = ?',
+                                  (time.time(), RUN_STATUS_FAILED, json.dumps(completion), run_id, status))
+        return cursor.rowcount > 0
+
+
+    def finish_running_run(self, run_id: str, completion: dict) -> bool:
+        """Records that a run has finished, if it's still running
+        Arguments:
+            run_id - the ID of the run
+            completion - the completion status of the run; runs with an 'error' key have failed
+        Return:
+            Returns True if the run was still running and has been marked as finished, and False otherwise
+        Notes:
+            Used when the workflow runner wrote the completion to the run's status file but didn't record it here, so
+            the number of output bytes isn't known
+        """
+        status = RUN_STATUS_FAILED if 'error' in completion else RUN_STATUS_COMPLETED
+        with self._connect() as conn:
+            cursor = conn.execute('UPDATE runs SET end_time = ?, status = ?, completion = ?, output_bytes = 0 '
+                                  'WHERE id = ? AND status = ?',
+                                  (time.time(), status, json.dumps(completion), run_id, RUN_STATUS_RUNNING))
+        return cursor.rowcount > 0
+
+
+    def finish_run(self, run_id: str, completion: dict, output_bytes: int, end_time: float = None) -> None:
+        """Records that a run has finished
+        Arguments:
+            run_id - the ID of the run
+            completion - the completion status of the run; runs with an 'error' key have failed
+            output_bytes - the number of bytes of files in the run's folder
+            end_time - the time the run finished; the current time is used by default
+        """
+        status = RUN_STATUS_FAILED if 'error' in completion else RUN_STATUS_COMPLETED
+        with self._connect() as conn:
+            conn.execute('UPDATE runs SET end_time = ?, status = ?, completion = ?, output_bytes = ? WHERE id = ?',
+                         (end_time if end_time is not None else time.time(), status, json.dumps(completion), output_bytes,
+                          run_id))
+
+
+    def get_run(self, run_id: str) -> Optional[dict]:
+        """Returns a run
+        Arguments:
+            run_id - the ID of the run
+        Return:
+            Returns the run, or None if it's not found
+        """
+        row = self._connect().execute(f'SELECT {", ".join(RUN_COLUMNS)} FROM runs WHERE id = ?', (run_id,)).fetchone()
+        return self._to_run(row) if row is not None else None
+
+
+    def get_runs(self, run_ids: list) -> dict:
+        """Returns several runs
+        Arguments:
+            run_ids - the IDs of the runs
+        Return:
+            Returns a dict of the found runs keyed by their ID
+        """
+        runs = {}
+        conn = self._connect()
+        # Stay well within the limit on the number of query parameters
+        for index in range(0, len(run_ids), 500):
+            batch = run_ids[index:index + 500]
+            query = f'SELECT {", ".join(RUN_COLUMNS)} FROM runs WHERE id IN ({", ".join("?" * len(batch))})'
+            for one_row in conn.execute(query, batch):
+                run = self._to_run(one_row)
+                runs[run['id']] = run
+        return runs
+
+
+    def list_runs(self, owner: str, offset: int = 0, limit: Optional[int] = None) -> tuple:
+        """Returns a page of the runs of an owner in the order they were started
+        Arguments:
+            owner - the ID of the owner of the runs
+            offset - the number of runs to skip
+            limit - the maximum number of runs to return; all the remaining runs are returned when None
+        Return:
+            Returns a 2-tuple of the list of runs and the total number of runs of the owner
+        """
+        conn = self._connect()
+        rows = conn.execute(f'SELECT {", ".join(RUN_COLUMNS)} FROM runs WHERE owner = ? ORDER BY start_time, id '
+                            'LIMIT ? OFFSET ?', (owner, limit if limit is not None else -1, offset)).fetchall()
+        total = conn.execute('SELECT COUNT(*) FROM runs WHERE owner = ?', (owner,)).fetchone()[0]
+        return [self._to_run(one_row) for one_row in rows], total
+
+
+    def remove_run(self, run_id: str) -> None:
+        """Removes a run
+        Arguments:
+            run_id - the ID of the run
+        """
+        with self._connect() as conn:
+            conn.execute('DELETE FROM runs WHERE id = ?', (run_id,))
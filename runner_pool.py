@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""Implements a pool of workflow runner processes that are started before the workflows they run"""
+
+import argparse
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+import os
+import selectors
+import socket
+import subprocess
+import threading
+import time
+from typing import Optional
+
+from workflow_scheduler import is_process_alive
+
+# Maximum number of workflows a runner process runs before it's replaced, releasing anything it's held on to
+RUNNER_POOL_MAX_RUNS_PER_PROCESS = 50
+
+# Number of seconds to wait for the pool when asking it to run a workflow
+RUNNER_POOL_REQUEST_TIMEOUT_SEC = 5
+
+# Maximum number of bytes in a request to the pool
+RUNNER_POOL_MAX_REQUEST_SIZE = 64 * 1024
+
+# Minimum number of seconds between attempts by a server process to start the pool
+RUNNER_POOL_START_INTERVAL_SEC = 30
+
+# Number of seconds the pool waits for events before checking on its processes
+RUNNER_POOL_POLL_SEC = 1
+
+# Number of seconds the pool keeps running without being asked to run a workflow
+RUNNER_POOL_MAX_IDLE_SEC = 60 * 60
+
+
+def runner_version(script_folder: str) -> str:
+    """Returns a value identifying the scripts that run workflows
+    Arguments:
+        script_folder: the folder containing the workflow runner and pool scripts
+    Return:
+        Returns a value that's different for another folder, or when a script in the folder has changed
+    """
+    real_folder = os.path.realpath(script_folder)
+    hasher = hashlib.sha1(real_folder.encode('utf8'))
+    for one_path in sorted(glob.glob(os.path.join(real_folder, '*.py'))):
+        with open(one_path, 'rb') as in_file:
+            hasher.update(os.path.basename(one_path).encode('utf8'))
+            hasher.update(in_file.read())
+    return hasher.hexdigest()
+
+
+def _run_worker(conn: socket.socket, max_runs: int) -> None:
+    """Runs the workflows sent by the pool until the pool goes away or enough workflows have been run
+    Arguments:
+        conn: the connection to the pool
+        max_runs: the maximum number of workflows to run
+    Notes:
+        A line of JSON is sent back to the pool each time a workflow finishes; it's marked as the 'last' one when the
+        process is about to stop
+    """
+    # The pool imports the runner before starting its processes so that they're ready to run workflows
+    # pylint: disable=import-outside-toplevel
+    import workflow_runner
+
+    with conn.makefile('r', encoding='utf8') as reader:
+        for run_count in range(1, max_runs + 1):
+            line = reader.readline()
+            if not line:
+                break
+
+            request = json.loads(line)
+            working_folder = request['working_folder']
+            try:
+                workflow_runner.run_workflow_folder(working_folder,
+                                                    os.path.join(working_folder, workflow_runner.QUEUE_FILE_NAME),
+                                                    request.get('registry'))
+            except Exception as ex:
+                logging.exception('Exception caught running workflow in folder "%s"', working_folder)
+                workflow_runner.write_completion(os.path.join(working_folder, workflow_runner.STATUS_FILE_NAME),
+                                                 {'error': f'Exception caught running workflow: {ex}'},
+                                                 request.get('registry'))
+
+            conn.sendall((json.dumps({'done': working_folder, 'last': run_count >= max_runs}) + '\n').encode('utf8'))
+
+
+class RunnerPool:
+    """Keeps workflow runner processes ready to run the workflows sent over a Unix socket
+
+    Arguments:
+      socket_path - the path of the Unix socket to listen on
+      size - the number of runner processes
+      max_runs_per_process - the number of workflows a runner process runs before it's replaced
+      server_pid - the ID of the server process the pool stops with, or None to keep running without a server
+      max_idle_sec - the number of seconds the pool keeps running when it's not asked to run workflows
+
+    Requests are a line of JSON with the 'working_folder' of a queued workflow, the path of the run 'registry', and the
+    'version' of the scripts the server is running. The reply is a line of JSON with the 'pid' of the process running
+    the workflow, or an 'error' when it can't be run. Runner processes that stop are replaced, and only one pool runs
+    for a socket.
+    The pool stops when the server process stops, when it's been idle too long, or when it's asked to run a workflow by
+    a server running other scripts; in that case the reply has 'restart' set so that the server starts a new pool.
+    Runner processes that are running a workflow when the pool stops finish it first
+    """
+
+    def __init__(self, socket_path: str, size: int, max_runs_per_process: int = RUNNER_POOL_MAX_RUNS_PER_PROCESS,
+                 server_pid: int = None, max_idle_sec: float = RUNNER_POOL_MAX_IDLE_SEC):
+        """Initializes class instance"""
+        self.socket_path = socket_path
+        self.size = size
+        self.max_runs_per_process = max_runs_per_process
+        self.server_pid = server_pid
+        self.max_idle_sec = max_idle_sec
+        self.version = runner_version(os.path.dirname(os.path.abspath(__file__)))
+        self._workers = {}
+        self._selector = selectors.DefaultSelector()
+        self._listener = None
+        self._lock_file = None
+        self._last_active = time.monotonic()
+
+
+    def _start_worker(self) -> None:
+        """Starts a runner process"""
+        pool_conn, worker_conn = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            # The runner process only keeps its own connection to the pool
+            exit_code = 0
+            try:
+                self._lock_file.close()
+                self._listener.close()
+                self._selector.close()
+                pool_conn.close()
+                for one_worker in self._workers.values():
+                    if one_worker['conn'] is not None:
+                        one_worker['conn'].close()
+                _run_worker(worker_conn, self.max_runs_per_process)
+            except BaseException:
+                logging.exception('Exception caught in workflow runner process')
+                exit_code = 1
+            finally:
+                os._exit(exit_code)     # pylint: disable=protected-access
+
+        worker_conn.close()
+        self._workers[pid] = {'conn': pool_conn, 'busy': False}
+        self._selector.register(pool_conn, selectors.EVENT_READ, pid)
+        logging.info('Started workflow runner process %s', str(pid))
+
+
+    def _remove_worker(self, pid: int) -> None:
+        """Forgets a runner process that has stopped
+        Arguments:
+            pid: the process ID of the runner
+        """
+        worker = self._workers.pop(pid, None)
+        if worker is not None:
+            if worker['conn'] is not None:
+                self._selector.unregister(worker['conn'])
+                worker['conn'].close()
+            logging.info('Workflow runner process %s stopped', str(pid))
+
+
+    def _reap_workers(self) -> None:
+        """Waits on stopped runner processes and starts new ones to keep the pool full"""
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            self._remove_worker(pid)
+
+        while len(self._workers) < self.size:
+            self._start_worker()
+
+
+    def _handle_worker(self, pid: int) -> None:
+        """Handles a message from a runner process
+        Arguments:
+            pid: the process ID of the runner
+        """
+        worker = self._workers[pid]
+        try:
+            data = worker['conn'].recv(4096)
+        except OSError:
+            data = b''
+        if not data:
+            # The process is stopping; it's waited on and replaced once it's gone
+            self._selector.unregister(worker['conn'])
+            worker['conn'].close()
+            worker['conn'] = None
+            worker['busy'] = True
+            return
+        for one_line in data.splitlines():
+            # Processes that have run their last workflow aren't sent any more
+            worker['busy'] = bool(json.loads(one_line).get('last'))
+
+
+    def _send_to_worker(self, request: dict, working_folder: str) -> dict:
+        """Sends a workflow to an idle runner process
+        Arguments:
+            request: the request to run the workflow
+            working_folder: the working folder of the workflow
+        Return:
+            Returns the reply to the request
+        """
+        for pid, one_worker in self._workers.items():
+            if not one_worker['busy'] and one_worker['conn'] is not None:
+                one_worker['busy'] = True
+                try:
+                    one_worker['conn'].sendall((json.dumps(request) + '\n').encode('utf8'))
+                except OSError:
+                    continue
+                logging.info('Running workflow "%s" in process %s', working_folder, str(pid))
+                return {'pid': pid}
+
+        return {'error': 'No workflow runner processes are idle'}
+
+
+    def _handle_request(self, conn: socket.socket) -> None:
+        """Handles a request to run a workflow
+        Arguments:
+            conn: the connection the request was made on
+        """
+        conn.settimeout(RUNNER_POOL_REQUEST_TIMEOUT_SEC)
+        with conn, conn.makefile('rb') as reader:
+            try:
+                request = json.loads(reader.readline(RUNNER_POOL_MAX_REQUEST_SIZE))
+                working_folder = request['working_folder']
+            except (OSError, ValueError, KeyError, TypeError) as ex:
+                logging.warning('Invalid request received by the workflow runner pool: %s', str(ex))
+                return
+
+            self._last_active = time.monotonic()
+            if request.get('version') != self.version:
+                # Stop before replying so that the server's new pool can take over the socket
+                logging.info('Stopping the workflow runner pool for a server running other scripts')
+                self._stop_listening()
+                reply = {'error': 'The workflow runner pool is running other scripts', 'restart': True}
+            else:
+                reply = self._send_to_worker(request, working_folder)
+
+            try:
+                conn.sendall((json.dumps(reply) + '\n').encode('utf8'))
+            except OSError as ex:
+                logging.warning('Unable to reply to a workflow runner pool request: %s', str(ex))
+
+
+    def _stop_listening(self) -> None:
+        """Stops taking requests and lets another pool start for the socket"""
+        self._selector.unregister(self._listener)
+        self._listener.close()
+        self._listener = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._lock_file.close()
+
+
+    def _is_unneeded(self) -> bool:
+        """Returns whether the pool is no longer needed, because the server has stopped or because it's been idle"""
+        if self.server_pid is not None and not is_process_alive(self.server_pid):
+            logging.info('Stopping the workflow runner pool since server process %s stopped', str(self.server_pid))
+            return True
+
+        if any(one_worker['busy'] for one_worker in self._workers.values()):
+            self._last_active = time.monotonic()
+        elif time.monotonic() - self._last_active >= self.max_idle_sec:
+            logging.info('Stopping the idle workflow runner pool')
+            return True
+
+        return False
+
+
+    def serve_forever(self) -> bool:
+        """Starts the runner processes and handles requests to run workflows until the pool is no longer needed
+        Return:
+            Returns False if another pool is already running for the socket, and True once the pool has stopped
+        """
+        # pylint: disable=consider-using-with
+        self._lock_file = open(self.socket_path + '.lock', 'w', encoding='utf8')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            return False
+
+        # Preload the runner and its backend so that the runner processes start with them
+        # pylint: disable=import-outside-toplevel, unused-import
+        import workflow_runner
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self._listener.listen()
+        self._selector.register(self._listener, selectors.EVENT_READ, None)
+        logging.info('Workflow runner pool of %s processes listening on "%s"', str(self.size), self.socket_path)
+
+        while self._listener is not None:
+            if self._is_unneeded():
+                self._stop_listening()
+                break
+            self._reap_workers()
+            for key, _ in self._selector.select(RUNNER_POOL_POLL_SEC):
+                if key.data is None:
+                    conn, _ = self._listener.accept()
+                    self._handle_request(conn)
+                    if self._listener is None:
+                        break
+                elif key.data in self._workers:
+                    self._handle_worker(key.data)
+
+        # Runner processes stop once they've finished their workflow and find the pool's gone
+        for one_worker in self._workers.values():
+            if one_worker['conn'] is not None:
+                one_worker['conn'].close()
+        self._selector.close()
+        return True
+
+
+class RunnerPoolClient:
+    """Starts workflow runners in the runner pool, or in new processes when the pool can't run them
+
+    Arguments:
+      socket_path - the path of the Unix socket of the pool
+      size - the number of processes in the pool; when zero, every workflow is run in a new process
+      registry_path - the path of the run registry database the runners record the completion of workflows in
+      script_folder - the folder containing the workflow runner and pool scripts
+
+    The pool is started by the first server process to find it isn't running, and stops with the server process given to
+    start_pool(). A pool running other scripts than the client's is replaced. Processes started by the client are waited
+    on by reap() so that they don't linger after they've finished
+    """
+
+    def __init__(self, socket_path: str, size: int, registry_path: str, script_folder: str):
+        """Initializes class instance"""
+        self.socket_path = socket_path
+        self.size = size
+        self.registry_path = registry_path
+        self.script_folder = script_folder
+        self.version = runner_version(script_folder)
+        self.server_pid = os.getpid()
+        self._children = {}
+        self._lock = threading.Lock()
+        self._last_pool_start = None
+
+
+    def _start_process(self, cmd: list, **kwargs) -> subprocess.Popen:
+        """Starts a process that's waited on by reap()
+        Arguments:
+            cmd: the command to run
+            kwargs: additional arguments for subprocess.Popen
+        """
+        # Deliberately let the command run
+        # pylint: disable=consider-using-with
+        proc = subprocess.Popen(cmd, **kwargs)
+        with self._lock:
+            self._children[proc.pid] = proc
+        return proc
+
+
+    def start_pool(self, server_pid: int = None, force: bool = False) -> None:
+        """Starts the pool in the background, unless it was tried recently; a pool that's already running is left alone
+        Arguments:
+            server_pid: the ID of the server process the pool stops with; when None, the previous one is used, which is
+                        this process to begin with
+            force: start the pool even when it was tried recently
+        """
+        now = time.time()
+        with self._lock:
+            if server_pid is not None:
+                self.server_pid = server_pid
+            if self.size <= 0 or (not force and self._last_pool_start is not None and
+                                  now - self._last_pool_start < RUNNER_POOL_START_INTERVAL_SEC):
+                return
+            self._last_pool_start = now
+
+        cmd = ['python3', os.path.join(self.script_folder, 'runner_pool.py'), self.socket_path, '-size', str(self.size),
+               '-server_pid', str(self.server_pid)]
+        print("Starting workflow runner pool", cmd)
+        self._start_process(cmd, start_new_session=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+
+    def _request_run(self, working_folder: str) -> Optional[int]:
+        """Asks the pool to run a workflow
+        Arguments:
+            working_folder: the working folder of the queued workflow
+        Return:
+            Returns the ID of the process running the workflow, or None if the pool didn't run it
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(RUNNER_POOL_REQUEST_TIMEOUT_SEC)
+            conn.connect(self.socket_path)
+            conn.sendall((json.dumps({'working_folder': working_folder, 'registry': self.registry_path,
+                                      'version': self.version}) + '\n').encode('utf8'))
+            with conn.makefile('rb') as reader:
+                reply = json.loads(reader.readline(RUNNER_POOL_MAX_REQUEST_SIZE))
+
+        if 'pid' not in reply:
+            print("Workflow runner pool didn't run workflow", working_folder, reply.get('error'))
+            if reply.get('restart'):
+                self.start_pool(force=True)
+            return None
+        return int(reply['pid'])
+
+
+    def start_run(self, working_folder: str) -> int:
+        """Starts running a queued workflow
+        Arguments:
+            working_folder: the working folder of the workflow
+        Return:
+            Returns the ID of the process running the workflow
+        """
+        if self.size > 0:
+            try:
+                pid = self._request_run(working_folder)
+                if pid is not None:
+                    return pid
+            except (OSError, ValueError) as ex:
+                print("Unable to reach the workflow runner pool", self.socket_path, str(ex))
+                self.start_pool()
+
+        cmd = ['python3', os.path.join(self.script_folder, 'workflow_runner.py'), working_folder, '-registry',
+               self.registry_path]
+        proc = self._start_process(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        print("PROC: ", cmd, proc.pid)
+        return proc.pid
+
+
+    def reap(self) -> None:
+        """Waits on the processes started by the client that have finished"""
+        with self._lock:
+            for one_pid, one_proc in list(self._children.items()):
+                if one_proc.poll() is not None:
+                    del self._children[one_pid]
+
+
+def parse_args() -> tuple:
+    """Parses the command line arguments
+    Return:
+        A tuple containing the command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Runs queued workflows in a pool of processes')
+    parser.add_argument('socket', help='the path of the Unix socket to listen on for workflows to run')
+    parser.add_argument('-size', type=int, default=4, help='the number of runner processes (default=4)')
+    parser.add_argument('-max_runs', type=int, default=RUNNER_POOL_MAX_RUNS_PER_PROCESS,
+                        help=f'the number of workflows a process runs before being replaced '
+                             f'(default={RUNNER_POOL_MAX_RUNS_PER_PROCESS})')
+    parser.add_argument('-server_pid', type=int, help='the ID of the server process to stop with (default=none)')
+    parser.add_argument('-max_idle', type=float, default=RUNNER_POOL_MAX_IDLE_SEC,
+                        help=f'the number of seconds to keep running without being asked to run workflows '
+                             f'(default={RUNNER_POOL_MAX_IDLE_SEC})')
+    parser.add_argument('-debug', action='store_const', default=logging.WARN, const=logging.DEBUG,
+                        help='enable debug logging (default=WARN)')
+    parser.add_argument('-info', action='store_const', default=logging.WARN, const=logging.INFO,
+                        help='enable info logging (default=WARN)')
+
+    args = parser.parse_args()
+
+    if args.size < 1 or args.max_runs < 1:
+        raise RuntimeError(f'Invalid pool size {args.size} or runs per process {args.max_runs} specified')
+
+    logging_level = args.debug if args.debug == logging.DEBUG else args.info
+
+    return args.socket, args.size, args.max_runs, args.server_pid, args.max_idle, logging_level
+
+
+def run_pool():
+    """Runs the pool of workflow runners specified on the command line"""
+    socket_path, size, max_runs, server_pid, max_idle, logging_level = parse_args()
+
+    logging.getLogger().setLevel(logging_level)
+
+    if not RunnerPool(socket_path, size, max_runs, server_pid, max_idle).serve_forever():
+        logging.info('A workflow runner pool is already running for "%s"', socket_path)
+
+
+if __name__ == "__main__":
+    run_pool()
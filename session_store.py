@@ -0,0 +1,240 @@
+"""Implements a server-side session store that keeps only the session ID in the cookie"""
+
+import os
+import secrets
+import sqlite3
+import stat
+import threading
+import time
+from typing import Optional
+
+from flask import Flask, Request, Response
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+
+# Salt used when signing session IDs
+SESSION_ID_SALT = 'atlana-session-id'
+
+# Number of seconds between removals of expired sessions from the store
+SESSION_CLEANUP_INTERVAL_SEC = 60 * 60
+
+# Number of seconds to wait for another process to finish writing to the store
+SESSION_STORE_TIMEOUT_SEC = 30
+
+# Suffixes of the files SQLite keeps next to the database in WAL mode
+SESSION_DB_FILE_SUFFIXES = ('', '-wal', '-shm')
+
+
+def make_private_folder(folder: str) -> None:
+    """Creates a folder that only the current user can use, or checks that an existing one is
+    Arguments:
+        folder - the path of the folder
+    Exceptions:
+        PermissionError is raised if the folder belongs to another user or can be used by other users
+    """
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    folder_stat = os.lstat(folder)
+    if not stat.S_ISDIR(folder_stat.st_mode) or folder_stat.st_uid != os.getuid() or folder_stat.st_mode & 0o077:
+        raise PermissionError(f'The session folder "{folder}" needs to be a folder that only its owner can use')
+
+
+class ServerSession(SessionMixin):
+    """Session whose values are loaded from the store the first time they're used
+
+    Requests that don't use the session, such as those for static files, don't touch the store
+    """
+
+    def __init__(self, interface: 'SqliteSessionInterface', sid: Optional[str]):
+        """Initializes class instance
+        Arguments:
+            interface - the session interface used to load the session's values
+            sid - the ID of the session, or None for a new session
+        """
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.expires = None
+        self._interface = interface
+        self._data = None
+
+
+    def _get_data(self) -> dict:
+        """Returns the values of the session, loading them if needed"""
+        self.accessed = True
+        if self._data is None:
+            loaded = self._interface.load(self.sid) if self.sid is not None else None
+            if loaded is None:
+                self._data = {}
+                if self.sid is not None:
+                    # The session has expired or was removed; it continues with a new ID
+                    self.sid, self.new = None, True
+            else:
+                self._data, self.expires = loaded
+        return self._data
+
+
+    def is_loaded(self) -> bool:
+        """Returns whether the values of the session have been loaded"""
+        return self._data is not None
+
+
+    def __getitem__(self, key: str) -> object:
+        return self._get_data()[key]
+
+
+    def __setitem__(self, key: str, value: object) -> None:
+        self._get_data()[key] = value
+        self.modified = True
+
+
+    def __delitem__(self, key: str) -> None:
+        del self._get_data()[key]
+        self.modified = True
+
+
+    def __iter__(self):
+        return iter(self._get_data())
+
+
+    def __len__(self) -> int:
+        return len(self._get_data())
+
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._get_data()
+
+
+class SqliteSessionInterface(SessionInterface):
+    """Keeps session values in an SQLite database shared by the server's processes
+
+    The cookie only holds the signed session ID, so requests stay the same size no matter how much is kept in the
+    session. Sessions are kept for the app's PERMANENT_SESSION_LIFETIME after they were last saved or used.
+    Sessions hold connection passwords, so the database and the files SQLite keeps next to it are only readable by the
+    server's user
+    """
+
+    def __init__(self, db_path: str):
+        """Initializes class instance
+        Arguments:
+            db_path - the path of the database file, which is created if needed
+        """
+        self.db_path = db_path
+        self.lifetime_sec = None
+        self._local = threading.local()
+        self._last_cleanup = 0
+
+        # SQLite creates the -wal and -shm files with the permissions of the database
+        os.close(os.open(self.db_path, os.O_RDWR | os.O_CREAT, 0o600))
+        for one_suffix in SESSION_DB_FILE_SUFFIXES:
+            if os.path.exists(self.db_path + one_suffix):
+                os.chmod(self.db_path + one_suffix, 0o600)
+
+        conn = sqlite3.connect(self.db_path, timeout=SESSION_STORE_TIMEOUT_SEC)
+        try:
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, '
+                             'expires REAL NOT NULL)')
+        finally:
+            conn.close()
+
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns this thread's connection to the database"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=SESSION_STORE_TIMEOUT_SEC)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+
+    def _get_signer(self, app: Flask) -> Signer:
+        """Returns the signer for session IDs
+        Arguments:
+            app - the app the session belongs to
+        """
+        return Signer(app.secret_key, salt=SESSION_ID_SALT)
+
+
+    def load(self, sid: str) -> Optional[tuple]:
+        """Loads the values of a session
+        Arguments:
+            sid - the ID of the session
+        Return:
+            Returns a 2-tuple of the session's values and the time when it expires, or None if it's not found or has expired
+        """
+        row = self._connect().execute('SELECT data, expires FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return session_json_serializer.loads(row[0]), row[1]
+
+
+    def open_session(self, app: Flask, request: Request) -> Optional[ServerSession]:
+        """Returns the session of the request without loading its values
+        Arguments:
+            app - the app handling the request
+            request - the request to return the session for
+        """
+        if not app.secret_key:
+            return None
+        self.lifetime_sec = app.permanent_session_lifetime.total_seconds()
+
+        sid = None
+        cookie_value = request.cookies.get(self.get_cookie_name(app))
+        if cookie_value:
+            try:
+                sid = self._get_signer(app).unsign(cookie_value).decode('utf8')
+            except BadSignature:
+                sid = None
+
+        return ServerSession(self, sid)
+
+
+    def save_session(self, app: Flask, session: ServerSession, response: Response) -> None:
+        """Saves the session if it was changed and sets the cookie when needed
+        Arguments:
+            app - the app handling the request
+            session - the session to save
+            response - the response to the request
+        """
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.is_loaded():
+            return
+
+        cookie_args = {'domain': self.get_cookie_domain(app), 'path': self.get_cookie_path(app),
+                       'secure': self.get_cookie_secure(app), 'samesite': self.get_cookie_samesite(app),
+                       'httponly': self.get_cookie_httponly(app)}
+        now = time.time()
+        conn = self._connect()
+
+        if not session:
+            if session.modified and session.sid is not None:
+                with conn:
+                    conn.execute('DELETE FROM sessions WHERE sid = ?', (session.sid,))
+                response.delete_cookie(self.get_cookie_name(app), **cookie_args)
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+
+        # Sessions that are in use are kept alive, without writing to the store on every request
+        expires = now + self.lifetime_sec
+        if session.modified:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)',
+                             (session.sid, session_json_serializer.dumps(dict(session)), expires))
+        elif session.expires is not None and session.expires - now < self.lifetime_sec / 2:
+            with conn:
+                conn.execute('UPDATE sessions SET expires = ? WHERE sid = ?', (expires, session.sid))
+
+        if session.new or (session.permanent and self.should_set_cookie(app, session)):
+            response.set_cookie(self.get_cookie_name(app), self._get_signer(app).sign(session.sid).decode('utf8'),
+                                expires=self.get_expiration_time(app, session), **cookie_args)
+
+        if now - self._last_cleanup >= SESSION_CLEANUP_INTERVAL_SEC:
+            self._last_cleanup = now
+            with conn:
+                conn.execute('DELETE FROM sessions WHERE expires < ?', (now,))
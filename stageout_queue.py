@@ -0,0 +1,76 @@
+"""Holds the uploads of workflow results until their workflows finish"""
+
+import os
+from concurrent.futures import Executor
+from threading import Lock
+from collections.abc import Callable
+
+
+class StageoutQueue:
+    """Starts the uploads of workflow results once their workflows have finished
+
+    Arguments:
+      executor - the executor to run the uploads on
+      is_finished_func - called with a workflow ID and its working folder, returns whether the workflow has finished
+      stageout_func - called on the executor with a workflow ID, its working folder, the connection information, and the
+                      destination path to upload the workflow's results
+
+    The waiting uploads are kept in the memory of the process that accepted them, since they hold the connection
+    information, and don't hold a thread while they wait. submit_finished() is called periodically to start the uploads
+    of the workflows that have finished. Uploads of workflows whose folder is removed are dropped
+    """
+
+    def __init__(self, executor: Executor, is_finished_func: Callable, stageout_func: Callable):
+        """Initializes class instance"""
+        self.executor = executor
+        self.is_finished_func = is_finished_func
+        self.stageout_func = stageout_func
+        self._pending = {}
+        self._lock = Lock()
+
+
+    def add(self, workflow_id: str, working_folder: str, auth: dict, dest_path: str) -> None:
+        """Adds an upload of a workflow's results, starting it right away if the workflow has finished
+        Arguments:
+            workflow_id - the ID of the workflow
+            working_folder - the working folder of the workflow
+            auth - the connection information to upload with
+            dest_path - the path to upload the results to
+        """
+        with self._lock:
+            self._pending[workflow_id] = (working_folder, dict(auth), dest_path)
+        self.submit_finished()
+
+
+    def submit_finished(self) -> list:
+        """Starts the uploads of the workflows that have finished
+        Return:
+            Returns the list of IDs of the workflows whose uploads were started
+        """
+        with self._lock:
+            pending = list(self._pending.items())
+
+        submitted = []
+        for workflow_id, (working_folder, auth, dest_path) in pending:
+            if not os.path.isdir(working_folder):
+                print("Dropping stage-out of removed workflow", workflow_id)
+            elif not self.is_finished_func(workflow_id, working_folder):
+                continue
+
+            with self._lock:
+                # A newer upload of the workflow's results replaces this one
+                if self._pending.get(workflow_id) != (working_folder, auth, dest_path):
+                    continue
+                del self._pending[workflow_id]
+
+            if os.path.isdir(working_folder):
+                self.executor.submit(self.stageout_func, workflow_id, working_folder, auth, dest_path)
+                submitted.append(workflow_id)
+
+        return submitted
+
+
+    def pending_count(self) -> int:
+        """Returns the number of uploads waiting for their workflow to finish"""
+        with self._lock:
+            return len(self._pending)
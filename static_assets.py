@@ -0,0 +1,164 @@
+"""Keeps an index of the static assets served to browsers"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from threading import Lock
+from typing import Optional
+
+# Sub-folders of the asset folder that are indexed when the index is loaded, with '' being the folder itself
+STATIC_ASSET_FOLDERS = ('', 'css', 'js', 'media')
+
+# Extensions of files that aren't indexed when the index is loaded; compressed variants are found with their asset
+STATIC_ASSET_SKIPPED_EXTENSIONS = ('.py', '.pyc', '.sh', '.gz', '.br')
+
+# Extensions of the precompressed variants of an asset, by their content encoding
+STATIC_ASSET_ENCODING_EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+# Content types that are compressed when an asset doesn't have a precompressed variant
+STATIC_ASSET_COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/manifest+json',
+                                   'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon')
+
+# Assets with names containing a content hash, such as main.1a2b3c4d.chunk.js, never change and can be cached forever
+STATIC_ASSET_HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.')
+
+# Number of bytes read at a time when hashing assets
+STATIC_ASSET_READ_SIZE = 1024 * 1024
+
+
+class StaticAsset:
+    """An indexed static asset and its encoded variants
+
+    Each variant is a (data, path) tuple, where data is the bytes of the variant when held in memory and None when the
+    variant is sent from its path
+    """
+
+    def __init__(self, path: str, max_memory_size: int):
+        """Initializes class instance by reading the asset
+        Arguments:
+            path - the path of the asset
+            max_memory_size - the largest asset or variant held in memory
+        """
+        file_stat = os.stat(path)
+        self.path = path
+        self.size = file_stat.st_size
+        self.mtime = file_stat.st_mtime
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.immutable = STATIC_ASSET_HASHED_NAME.search(os.path.basename(path)) is not None
+
+        data = None
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as in_file:
+            if self.size <= max_memory_size:
+                data = in_file.read()
+                hasher.update(data)
+            else:
+                while True:
+                    chunk = in_file.read(STATIC_ASSET_READ_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+        self.etag = hasher.hexdigest()[:32]
+        self.variants = {'identity': (data, path)}
+
+        for encoding, extension in STATIC_ASSET_ENCODING_EXTENSIONS.items():
+            encoded_path = path + extension
+            if os.path.isfile(encoded_path):
+                encoded_data = None
+                if os.path.getsize(encoded_path) <= max_memory_size:
+                    with open(encoded_path, 'rb') as in_file:
+                        encoded_data = in_file.read()
+                self.variants[encoding] = (encoded_data, encoded_path)
+
+        # Compress small assets that weren't precompressed when it's worthwhile
+        if data and 'gzip' not in self.variants and self.mimetype.startswith(STATIC_ASSET_COMPRESSIBLE_TYPES):
+            encoded_data = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(encoded_data) < len(data) * 0.9:
+                self.variants['gzip'] = (encoded_data, None)
+
+
+    def is_current(self) -> bool:
+        """Returns whether the asset file is unchanged since it was indexed"""
+        try:
+            file_stat = os.stat(self.path)
+        except OSError:
+            return False
+        return file_stat.st_mtime == self.mtime and file_stat.st_size == self.size
+
+
+    def get_encodings(self) -> list:
+        """Returns the content encodings the asset is available in, with the preferred ones first"""
+        return [one_encoding for one_encoding in list(STATIC_ASSET_ENCODING_EXTENSIONS) + ['identity']
+                if one_encoding in self.variants]
+
+
+    def get_etag(self, encoding: str) -> str:
+        """Returns the entity tag of a variant of the asset
+        Arguments:
+            encoding - the content encoding of the variant
+        """
+        return self.etag if encoding == 'identity' else self.etag + '-' + encoding
+
+
+class StaticAssets:
+    """Index of the static assets in a folder
+
+    The assets are hashed when the index is loaded so that requests can be answered without reading or checking the
+    files. Assets that aren't indexed are added when they're first requested. Assets with hashed names are expected to
+    never change; other assets are checked for changes when they're requested
+    """
+
+    def __init__(self, folder: str, max_memory_size: int):
+        """Initializes class instance
+        Arguments:
+            folder - the folder containing the assets
+            max_memory_size - the largest asset or variant held in memory
+        """
+        self.folder = os.path.realpath(folder)
+        self.max_memory_size = max_memory_size
+        self._assets = {}
+        self._lock = Lock()
+
+
+    def load(self) -> None:
+        """Indexes the assets in the folder and its STATIC_ASSET_FOLDERS sub-folders"""
+        for sub_folder in STATIC_ASSET_FOLDERS:
+            cur_folder = os.path.join(self.folder, sub_folder)
+            if not os.path.isdir(cur_folder):
+                continue
+            for one_name in os.listdir(cur_folder):
+                if one_name.startswith('.') or os.path.splitext(one_name)[1].lower() in STATIC_ASSET_SKIPPED_EXTENSIONS:
+                    continue
+                self.get('/'.join(part for part in (sub_folder, one_name) if part))
+
+
+    def get(self, rel_path: str) -> Optional[StaticAsset]:
+        """Returns an asset
+        Arguments:
+            rel_path - the path of the asset relative to the folder
+        Return:
+            Returns the asset, or None if it's not found in the folder
+        """
+        asset = self._assets.get(rel_path)
+        if asset is not None and (asset.immutable or asset.is_current()):
+            return asset
+
+        # Make sure we're only indexing files that are in the folder
+        full_path = os.path.realpath(os.path.join(self.folder, rel_path.lstrip('/')))
+        if not full_path.startswith(self.folder + os.sep) or not os.path.isfile(full_path):
+            with self._lock:
+                self._assets.pop(rel_path, None)
+            return None
+
+        try:
+            asset = StaticAsset(full_path, self.max_memory_size)
+        except OSError as ex:
+            print(f'Unable to index static asset "{full_path}"', ex)
+            return None
+
+        with self._lock:
+            self._assets[rel_path] = asset
+
+        return asset
@@ -0,0 +1,88 @@
+"""Writes and reads the status files of workflows, which are replaced in one step each time they're written"""
+
+import fcntl
+import json
+import os
+import tempfile
+import time
+from typing import Optional
+
+# Key of the status sequence number that's incremented each time the status is written
+STATUS_SEQUENCE_KEY = 'sequence'
+
+
+def _load_sequence(status_path: str) -> int:
+    """Returns the sequence number of the status file, or 0 if there isn't a usable one
+    Arguments:
+        status_path: the path to the status file
+    """
+    try:
+        with open(status_path, 'r', encoding='utf8') as in_file:
+            cur_status = json.load(in_file)
+    except (OSError, ValueError):
+        return 0
+
+    if isinstance(cur_status, dict) and isinstance(cur_status.get(STATUS_SEQUENCE_KEY), int):
+        return cur_status[STATUS_SEQUENCE_KEY]
+    return 0
+
+
+def write_status_file(status_path: str, status: dict) -> int:
+    """Replaces the status file with the status and the next sequence number
+    Arguments:
+        status_path: the path to the status file
+        status: the status to write
+    Return:
+        Returns the sequence number that was written
+    Exceptions:
+        OSError and TypeError are raised when the status can't be written; the previous status file is left as it was
+    Notes:
+        The server and the workflow runner both write the status, so the sequence continues from the one in the file
+        while the folder is locked. The new file is given a later modification time than the file it replaces, so that
+        the signature returned by status_file_signature() is different for each status that's written
+    """
+    folder_fd = os.open(os.path.dirname(status_path) or '.', os.O_RDONLY)
+    try:
+        fcntl.flock(folder_fd, fcntl.LOCK_EX)
+        sequence = _load_sequence(status_path) + 1
+
+        temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(status_path),
+                                              prefix='.' + os.path.basename(status_path) + '.')
+        try:
+            with os.fdopen(temp_fd, 'w', encoding='utf8') as out_file:
+                json.dump({**status, STATUS_SEQUENCE_KEY: sequence}, out_file, indent=2)
+
+            modified_ns = time.time_ns()
+            try:
+                modified_ns = max(modified_ns, os.stat(status_path).st_mtime_ns + 1)
+            except FileNotFoundError:
+                pass
+            os.utime(temp_path, ns=(modified_ns, modified_ns))
+
+            os.replace(temp_path, status_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+    finally:
+        os.close(folder_fd)
+
+    return sequence
+
+
+def status_file_signature(status_path: str) -> Optional[tuple]:
+    """Returns a value that's different for each status written to the file
+    Arguments:
+        status_path: the path to the status file
+    Return:
+        Returns a tuple of the inode, modification time, and size of the file, or None if the file doesn't exist
+    Notes:
+        Each status is written to a new file with a later modification time than the one before it, so the signature
+        changes even when the timestamps of the file system are too coarse to tell quick writes apart
+    """
+    try:
+        file_stat = os.stat(status_path)
+    except OSError:
+        return None
+
+    return (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
@@ -0,0 +1,95 @@
+"""Tests resumable chunked uploads"""
+
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+import chunked_upload
+
+# Data used for testing uploads
+TEST_DATA = os.urandom(3 * chunked_upload.UPLOAD_BLOCK_SIZE + 100)
+
+
+def test_resumed_upload(tmp_path):
+    """Tests that an upload can be resumed from its offset, including by another process"""
+    folder = str(tmp_path)
+    state = chunked_upload.start_upload(folder, 'image.tif', len(TEST_DATA), hashlib.sha256(TEST_DATA).hexdigest())
+    upload_id = state['id']
+
+    state, accepted = chunked_upload.write_chunk(folder, upload_id, 0, io.BytesIO(TEST_DATA[:1000]))
+    assert accepted is True and state['offset'] == 1000
+
+    # Chunks at the wrong offset are rejected
+    state, accepted = chunked_upload.write_chunk(folder, upload_id, 0, io.BytesIO(TEST_DATA[:1000]))
+    assert accepted is False and state['offset'] == 1000
+
+    # Hashes kept by another process aren't available here
+    chunked_upload.UPLOAD_HASHERS.remove(os.path.join(folder, '.' + upload_id + chunked_upload.PARTIAL_UPLOAD_EXTENSION))
+    state, accepted = chunked_upload.write_chunk(folder, upload_id, 1000, io.BytesIO(TEST_DATA[1000:]))
+    assert accepted is True and state['offset'] == len(TEST_DATA)
+
+    assert chunked_upload.finish_upload(folder, upload_id) == {'filename': 'image.tif', 'size': len(TEST_DATA),
+                                                               'sha256': hashlib.sha256(TEST_DATA).hexdigest()}
+    assert os.listdir(folder) == ['image.tif']
+    assert (tmp_path / 'image.tif').read_bytes() == TEST_DATA
+    assert chunked_upload.load_upload(folder, upload_id) is None
+
+
+def test_interrupted_chunk(tmp_path):
+    """Tests that the bytes received before a chunk is interrupted are kept"""
+    class BrokenStream(io.BytesIO):
+        """Stream that fails after its first read"""
+        def read(self, size=-1):
+            if self.tell() > 0:
+                raise ConnectionError('Client disconnected')
+            return super().read(size)
+
+    folder = str(tmp_path)
+    upload_id = chunked_upload.start_upload(folder, 'image.tif')['id']
+    with pytest.raises(ConnectionError):
+        chunked_upload.write_chunk(folder, upload_id, 0, BrokenStream(TEST_DATA))
+
+    assert chunked_upload.load_upload(folder, upload_id)['offset'] == chunked_upload.UPLOAD_BLOCK_SIZE
+
+
+def test_bad_uploads(tmp_path):
+    """Tests that invalid IDs and files that don't match are rejected"""
+    folder = str(tmp_path)
+    with pytest.raises(ValueError):
+        chunked_upload.load_upload(folder, '../escape')
+    assert chunked_upload.finish_upload(folder, '0' * 32) is None
+
+    upload_id = chunked_upload.start_upload(folder, 'image.tif', 10, hashlib.sha256(b'0123456789').hexdigest())['id']
+    with pytest.raises(ValueError):
+        chunked_upload.write_chunk(folder, upload_id, 0, io.BytesIO(b'0123456789A'))
+    with pytest.raises(ValueError):
+        chunked_upload.finish_upload(folder, upload_id)
+
+    chunked_upload.write_chunk(folder, upload_id, 0, io.BytesIO(b'abcdefghij'))
+    with pytest.raises(ValueError):
+        chunked_upload.finish_upload(folder, upload_id)
+
+
+def test_abandoned_uploads(tmp_path):
+    """Tests that uploads that haven't received a chunk for a while are removed when an upload starts"""
+    folder = str(tmp_path)
+    old_id = chunked_upload.start_upload(folder, 'old.tif')['id']
+    chunked_upload.write_chunk(folder, old_id, 0, io.BytesIO(TEST_DATA[:1000]))
+    recent_id = chunked_upload.start_upload(folder, 'recent.tif')['id']
+    old_time = time.time() - chunked_upload.UPLOAD_MAX_IDLE_SEC - 60
+    for one_name in os.listdir(folder):
+        if old_id in one_name:
+            os.utime(os.path.join(folder, one_name), (old_time, old_time))
+
+    new_id = chunked_upload.start_upload(folder, 'new.tif')['id']
+
+    assert chunked_upload.load_upload(folder, old_id) is None
+    assert all(old_id not in one_name for one_name in os.listdir(folder))
+    assert chunked_upload.UPLOAD_HASHERS.get(os.path.join(folder, '.' + old_id + chunked_upload.PARTIAL_UPLOAD_EXTENSION),
+                                             (1000,)) is None
+    assert chunked_upload.write_chunk(folder, old_id, 1000, io.BytesIO(TEST_DATA[1000:2000])) == (None, False)
+    assert chunked_upload.load_upload(folder, recent_id) is not None
+    assert chunked_upload.load_upload(folder, new_id) is not None
@@ -0,0 +1,74 @@
+"""Tests the responses answered with 304 Not Modified"""
+
+from flask import Flask
+
+from conditional_responses import body_conditional_response, conditional_response
+
+# Application providing the request contexts
+TEST_APP = Flask(__name__)
+
+
+def test_conditional_response():
+    """Tests that the response is only built when the client doesn't have it"""
+    built = []
+
+    def build_response():
+        """Records that the response was built"""
+        built.append(True)
+        return 'body'
+
+    with TEST_APP.test_request_context('/status?id=1'):
+        response = conditional_response(('first',), build_response)
+        assert response.status_code == 200
+        assert response.cache_control.no_cache
+        etag, weak = response.get_etag()
+        assert weak
+
+    with TEST_APP.test_request_context('/status?id=1', headers={'If-None-Match': f'W/"{etag}"'}):
+        assert conditional_response(('first',), build_response).status_code == 304
+        assert len(built) == 1
+
+        # The response changes with the validator
+        response = conditional_response(('second',), build_response)
+        assert response.status_code == 200
+        assert response.get_etag()[0] != etag
+
+    # The tag includes the request's arguments
+    with TEST_APP.test_request_context('/status?id=2', headers={'If-None-Match': f'W/"{etag}"'}):
+        assert conditional_response(('first',), build_response).status_code == 200
+
+    # Responses without a validator aren't tagged
+    with TEST_APP.test_request_context('/status?id=1', headers={'If-None-Match': f'W/"{etag}"'}):
+        response = conditional_response(None, build_response)
+        assert response.status_code == 200
+        assert response.get_etag() == (None, None)
+    assert len(built) == 4
+
+
+def test_conditional_response_error():
+    """Tests that error responses aren't tagged"""
+    with TEST_APP.test_request_context('/status'):
+        response = conditional_response(('first',), lambda: ('missing', 404))
+        assert response.status_code == 404
+        assert response.get_etag() == (None, None)
+
+
+def test_body_conditional_response():
+    """Tests that the body is only sent when the client doesn't have it"""
+    with TEST_APP.test_request_context('/irods/files'):
+        response = body_conditional_response(lambda: '["a.tif"]')
+        assert response.status_code == 200
+        etag, weak = response.get_etag()
+        assert weak
+
+    with TEST_APP.test_request_context('/irods/files', headers={'If-None-Match': f'W/"{etag}"'}):
+        response = body_conditional_response(lambda: '["a.tif"]')
+        assert response.status_code == 304
+
+        response = body_conditional_response(lambda: '["a.tif", "b.tif"]')
+        assert response.status_code == 200
+        assert response.get_etag()[0] != etag
+
+        response = body_conditional_response(lambda: ('missing', 404))
+        assert response.status_code == 404
+        assert response.get_etag() == (None, None)
@@ -0,0 +1,76 @@
+"""Tests the file value cache"""
+
+from file_cache import FileCache
+
+
+def test_signature_change():
+    """Tests that values are only returned while the file signature is unchanged"""
+    cache = FileCache(10)
+
+    assert cache.get('status.json', (1, 10)) is None
+    cache.put('status.json', (1, 10), {'running': {}})
+    assert cache.get('status.json', (1, 10)) == {'running': {}}
+    assert cache.get('status.json', (2, 10)) is None
+    assert cache.get('status.json', (1, 10)) is None
+
+    assert cache.stats() == {'entries': 0, 'pinned': 0, 'size': 0, 'hits': 1, 'misses': 3, 'evictions': 0}
+
+
+def test_eviction():
+    """Tests that the least recently used values are evicted"""
+    cache = FileCache(2)
+
+    cache.put('a', (1, 1), 'a')
+    cache.put('b', (1, 1), 'b')
+    assert cache.get('a', (1, 1)) == 'a'
+    cache.put('c', (1, 1), 'c')
+
+    assert cache.get('b', (1, 1)) is None
+    assert cache.get('a', (1, 1)) == 'a'
+    assert cache.get('c', (1, 1)) == 'c'
+    assert cache.evictions == 1
+
+
+def test_pinned():
+    """Tests that pinned values aren't evicted by other values, are checked against their file, and are bounded"""
+    cache = FileCache(1, max_pinned=2)
+
+    cache.put('done', (1, 1), {'completion': {}}, pinned=True)
+    cache.put('a', (1, 1), 'a')
+    cache.put('b', (1, 1), 'b')
+
+    assert cache.get('done') is None
+    assert cache.get('done', (1, 1)) == {'completion': {}}
+    assert cache.get('a', (1, 1)) is None
+
+    # A recovered workflow writes its status file again
+    assert cache.get('done', (5, 5)) is None
+    cache.put('done', (5, 5), {'running': {}})
+    assert cache.get('done', (5, 5)) == {'running': {}}
+
+    cache.put('first', (1, 1), 'first', pinned=True)
+    cache.put('second', (1, 1), 'second', pinned=True)
+    cache.put('third', (1, 1), 'third', pinned=True)
+    assert cache.get('first', (1, 1)) is None
+    assert cache.get('third', (1, 1)) == 'third'
+
+    cache.remove('third')
+    assert cache.get('third', (1, 1)) is None
+    assert cache.stats()['pinned'] == 1
+
+
+def test_sized_eviction():
+    """Tests that values are evicted to keep the total size within the maximum"""
+    cache = FileCache(5, len)
+
+    cache.put('a', (1, 1), [1, 2])
+    cache.put('b', (1, 1), [1, 2, 3])
+    assert cache.size == 5
+    cache.put('a', (2, 1), [1])
+    assert cache.size == 4
+    cache.put('c', (1, 1), [1, 2, 3])
+
+    assert cache.get('b', (1, 1)) is None
+    assert cache.get('a', (2, 1)) == [1]
+    assert cache.size == 4
+    assert cache.evictions == 1
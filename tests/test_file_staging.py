@@ -0,0 +1,138 @@
+"""Tests staging files concurrently and without copying them"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from file_staging import HostLimits, StagingProgress, clone_or_copy_file, link_read_only_file, load_read_only_mounts, \
+                         stage_files
+
+
+@pytest.fixture(name='executor')
+def fixture_executor():
+    """Returns an executor for running transfers"""
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def test_host_limits(executor):
+    """Tests that transfers run concurrently without exceeding the per-host limit"""
+    running = {'slow.example.org': 0, 'fast.example.org': 0}
+    max_running = dict(running)
+    lock = threading.Lock()
+
+    def make_transfer(host: str, index: int):
+        def transfer(progress_func):
+            with lock:
+                running[host] += 1
+                max_running[host] = max(max_running[host], running[host])
+            time.sleep(0.05)
+            progress_func(10)
+            with lock:
+                running[host] -= 1
+            return index
+        return transfer
+
+    transfers = [('slow.example.org', make_transfer('slow.example.org', idx)) for idx in range(3)] + \
+                [('fast.example.org', make_transfer('fast.example.org', 3))]
+    reports = []
+    progress = StagingProgress(len(transfers), reports.append, 60)
+
+    assert stage_files(transfers, executor, HostLimits(1), progress) == [0, 1, 2, 3]
+    assert max_running == {'slow.example.org': 1, 'fast.example.org': 1}
+    assert progress.summary() == {'files_done': 4, 'files_total': 4, 'bytes_done': 40}
+    assert reports[-1] == progress.summary()
+
+
+def test_busy_host_doesnt_block():
+    """Tests that transfers queued for a busy host don't keep the executor from running other hosts' transfers"""
+    other_started = threading.Event()
+    small_executor = ThreadPoolExecutor(max_workers=2)
+
+    def busy_transfer(progress_func):
+        return other_started.wait(5)
+
+    def other_transfer(progress_func):
+        other_started.set()
+        return True
+
+    transfers = [('busy.example.org', busy_transfer) for _ in range(3)] + [('other.example.org', other_transfer)]
+    try:
+        results = stage_files(transfers, small_executor, HostLimits(1),
+                              StagingProgress(len(transfers), lambda summary: None, 60))
+    finally:
+        small_executor.shutdown(wait=True)
+
+    assert results == [True, True, True, True]
+
+
+def test_cancelled_transfers(executor):
+    """Tests that queued transfers can be cancelled and that their places are reused"""
+    release = threading.Event()
+    host_limits = HostLimits(1)
+
+    first = host_limits.submit('one.example.org', executor, release.wait, 5)
+    second = host_limits.submit('one.example.org', executor, lambda: 'second')
+    third = host_limits.submit('one.example.org', executor, lambda: 'third')
+    assert second.cancel()
+
+    release.set()
+    assert first.result(5) is True
+    assert third.result(5) == 'third'
+    assert second.cancelled()
+    assert host_limits.submit('one.example.org', executor, lambda: 'fourth').result(5) == 'fourth'
+
+
+def test_failed_transfer(executor):
+    """Tests that a failed transfer raises its exception once the running transfers are done"""
+    finished = []
+
+    def bad_transfer(progress_func):
+        raise RuntimeError('Transfer failed')
+
+    def good_transfer(progress_func):
+        time.sleep(0.05)
+        finished.append(True)
+        return True
+
+    transfers = [('one.example.org', good_transfer), ('two.example.org', bad_transfer)]
+    with pytest.raises(RuntimeError, match='Transfer failed'):
+        stage_files(transfers, executor, HostLimits(2), StagingProgress(len(transfers), lambda summary: None, 60))
+
+    assert finished == [True]
+
+
+def test_clone_or_copy_file(tmp_path):
+    """Tests that files are copied so that changing the copy doesn't change the source"""
+    source_path = tmp_path / 'source.tif'
+    source_path.write_bytes(b'image data')
+    source_path.chmod(0o444)
+    dest_path = tmp_path / 'dest.tif'
+    dest_path.write_bytes(b'old data')
+
+    assert clone_or_copy_file(str(source_path), str(dest_path)) in ('reflink', 'copy_file_range', 'copy')
+    assert not os.path.samefile(source_path, dest_path)
+    assert dest_path.read_bytes() == b'image data'
+
+    dest_path.write_bytes(b'changed data')
+    assert source_path.read_bytes() == b'image data'
+
+
+def test_read_only_files(tmp_path):
+    """Tests that read-only files are mounted or symbolically linked"""
+    source_path = tmp_path / 'shared.tif'
+    source_path.write_bytes(b'image data')
+    run_folder = tmp_path / 'run'
+    run_folder.mkdir()
+
+    assert link_read_only_file(str(source_path), str(run_folder / 'shared.tif'), True) == 'mount'
+    assert link_read_only_file(str(source_path), str(run_folder / 'shared.tif'), True) == 'mount'
+    assert (run_folder / 'shared.tif').read_bytes() == b''
+    assert load_read_only_mounts(str(run_folder)) == [[str(source_path), 'shared.tif']]
+
+    assert link_read_only_file(str(source_path), str(run_folder / 'linked.tif'), False) == 'symlink'
+    assert (run_folder / 'linked.tif').read_bytes() == b'image data'
@@ -0,0 +1,50 @@
+"""Tests listing folder contents"""
+
+import os
+import tempfile
+import pytest
+
+import folder_listing
+
+
+def _make_folder(folder: str) -> None:
+    """Creates test files and folders
+    Arguments:
+        folder - the folder to create the files and folders in
+    """
+    for name, size in [('b.tif', 30), ('a.csv', 20), ('c.tif', 10)]:
+        with open(os.path.join(folder, name), 'wb') as out_file:
+            out_file.write(b'0' * size)
+    os.mkdir(os.path.join(folder, 'plots'))
+    os.mkdir(os.path.join(folder, '.hidden'))
+
+
+def test_scan_folder():
+    """Tests scanning a folder"""
+    with tempfile.TemporaryDirectory() as folder:
+        _make_folder(folder)
+        entries = {one_entry['name']: one_entry for one_entry in folder_listing.scan_folder(folder)}
+
+        assert sorted(entries.keys()) == ['a.csv', 'b.tif', 'c.tif', 'plots']
+        assert entries['a.csv']['size'] == 20
+        assert entries['a.csv']['type'] == 'file'
+        assert entries['plots']['type'] == 'folder'
+        assert entries['b.tif']['mtime'] == os.path.getmtime(os.path.join(folder, 'b.tif'))
+
+
+def test_page_entries():
+    """Tests filtering, sorting, and paging entries"""
+    with tempfile.TemporaryDirectory() as folder:
+        _make_folder(folder)
+        entries = folder_listing.scan_folder(folder)
+
+        page, total = folder_listing.page_entries(entries, '*.tif')
+        assert [one_entry['name'] for one_entry in page] == ['b.tif', 'c.tif']
+        assert total == 2
+
+        page, total = folder_listing.page_entries(entries, '*.*', 'size', True, offset=1, limit=1)
+        assert [one_entry['name'] for one_entry in page] == ['a.csv']
+        assert total == 3
+
+        with pytest.raises(ValueError):
+            folder_listing.sort_entries(entries, 'owner')
@@ -0,0 +1,110 @@
+"""Tests the cache of fetched input files"""
+
+import os
+import threading
+import time
+
+from input_cache import InputCache
+
+
+def make_fetch(contents: bytes, fetches: list):
+    """Returns a fetch function writing the contents and recording each call"""
+    def fetch(dest_path: str) -> bool:
+        fetches.append(dest_path)
+        time.sleep(0.05)
+        with open(dest_path, 'wb') as out_file:
+            out_file.write(contents)
+        return True
+    return fetch
+
+
+def test_hit_copies_file(tmp_path):
+    """Tests that a cached file is copied to later destinations without fetching it again"""
+    cache = InputCache(str(tmp_path / 'cache'), 1024)
+    fetches = []
+    first_path, second_path = str(tmp_path / 'first.tif'), str(tmp_path / 'second.tif')
+
+    assert cache.fetch('/zone/a.tif', 'abc', 5, first_path, make_fetch(b'hello', fetches)) is True
+    assert cache.fetch('/zone/a.tif', 'abc', 5, second_path, make_fetch(b'hello', fetches)) is True
+
+    assert len(fetches) == 1
+    assert not os.path.samefile(first_path, second_path)
+    with open(second_path, 'rb') as in_file:
+        assert in_file.read() == b'hello'
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+    # A changed checksum is a different file
+    assert cache.fetch('/zone/a.tif', 'def', 5, second_path, make_fetch(b'world', fetches)) is True
+    assert len(fetches) == 2
+    with open(second_path, 'rb') as in_file:
+        assert in_file.read() == b'world'
+
+
+def test_single_flight(tmp_path):
+    """Tests that concurrent requests for the same file share one fetch"""
+    cache = InputCache(str(tmp_path / 'cache'), 1024)
+    fetches = []
+    threads = [threading.Thread(target=cache.fetch,
+                                args=('/zone/a.tif', 'abc', 5, str(tmp_path / f'{idx}.tif'), make_fetch(b'hello', fetches)))
+               for idx in range(4)]
+    for one_thread in threads:
+        one_thread.start()
+    for one_thread in threads:
+        one_thread.join()
+
+    assert len(fetches) == 1
+    assert all(os.path.exists(tmp_path / f'{idx}.tif') for idx in range(4))
+
+
+def test_failed_fetch(tmp_path):
+    """Tests that failed fetches aren't cached"""
+    cache = InputCache(str(tmp_path / 'cache'), 1024)
+    dest_path = str(tmp_path / 'a.tif')
+
+    assert cache.fetch('/zone/a.tif', 'abc', 5, dest_path, lambda path: False) is False
+    assert not os.path.exists(dest_path)
+    assert cache.fetch('/zone/a.tif', 'abc', 5, dest_path, make_fetch(b'hello', [])) is True
+
+
+def test_eviction(tmp_path):
+    """Tests that the least recently used files are removed once the budget is exceeded"""
+    cache = InputCache(str(tmp_path / 'cache'), 10)
+    cache_paths = []
+    for idx, name in enumerate(('a', 'b')):
+        cache.fetch(f'/zone/{name}', 'abc', 6, str(tmp_path / name), make_fetch(b'012345', []))
+        # pylint: disable=protected-access
+        cache_paths.append(cache._get_cache_path(cache.get_key(f'/zone/{name}', 'abc', 6)))
+        os.utime(cache_paths[-1], (idx, idx))
+    cache.evict()
+
+    assert [os.path.exists(one_path) for one_path in cache_paths] == [False, True]
+    # Copied files are still available after they're removed from the cache
+    assert os.path.exists(tmp_path / 'a')
+
+
+def test_fetch_while_evicting(tmp_path):
+    """Tests that files aren't removed while they're being linked, and that lock files are removed with their file"""
+    # Only one file fits, so each fetch removes the other file
+    cache = InputCache(str(tmp_path / 'cache'), 8)
+    errors = []
+
+    def fetch_repeatedly(name: str):
+        """Fetches the same file over and over"""
+        try:
+            for idx in range(200):
+                dest_path = str(tmp_path / f'{name}{idx}')
+                assert cache.fetch(f'/zone/{name}', 'abc', 6, dest_path, make_fetch(b'012345', [])) is True
+                os.unlink(dest_path)
+        except Exception as ex:     # pylint: disable=broad-exception-caught
+            errors.append(ex)
+
+    threads = [threading.Thread(target=fetch_repeatedly, args=(name,)) for name in ('a', 'b')]
+    for one_thread in threads:
+        one_thread.start()
+    for one_thread in threads:
+        one_thread.join()
+
+    assert not errors
+    cached_names = [one_name for _, _, file_names in os.walk(cache.folder) for one_name in file_names]
+    assert len([one_name for one_name in cached_names if one_name.endswith('.lock')]) <= 2
+    assert len(cache._key_locks) <= 2      # pylint: disable=protected-access
@@ -0,0 +1,168 @@
+"""Tests listing iRODS collections"""
+
+import datetime
+
+import pytest
+from irods.exception import CollectionDoesNotExist
+from irods.models import Collection, DataObject
+
+from irods_listing import irods_like_pattern, list_irods_collection
+
+# Modification time of the test data objects
+TEST_MODIFY_TIME = datetime.datetime(2024, 5, 1, 12, 30, 0)
+
+
+class FakeResults(list):
+    """Stands in for the results of an executed query"""
+    continue_index = 0
+
+
+class FakeQuery:
+    """Stands in for a catalog query over a collection's sub-collections and data object replicas"""
+
+    def __init__(self, conn: 'FakeSession', column: object):
+        """Initializes class instance"""
+        self.conn = conn
+        self.column = column
+        self.aggregated = False
+        self.counted = False
+        self.offset_rows = 0
+        self.limit_rows = None
+        self.first_replicas = False
+
+    def filter(self, *conditions):
+        """Only the conditions on replica numbers are applied; the fake only holds one collection"""
+        for one_condition in conditions:
+            if getattr(one_condition, 'query_key', None) == DataObject.replica_number:
+                assert one_condition.value == 0
+                self.first_replicas = True
+        return self
+
+    def order_by(self, _):
+        """The fake's rows are already sorted"""
+        return self
+
+    def count(self, _):
+        """Counts the rows"""
+        self.counted = True
+        return self
+
+    def max(self, *_):
+        """Aggregates the replicas of each data object"""
+        self.aggregated = True
+        return self
+
+    def offset(self, offset: int):
+        """Skips rows"""
+        self.offset_rows = offset
+        return self
+
+    def limit(self, limit: int):
+        """Limits the number of rows"""
+        self.limit_rows = limit
+        return self
+
+    def _rows(self) -> list:
+        """Returns the rows of the query"""
+        if self.column in (Collection.id, Collection.name):
+            rows = [{Collection.name: one_name} for one_name in self.conn.folders]
+        elif self.aggregated:
+            rows = [{DataObject.name: one_name, DataObject.size: max(sizes), DataObject.modify_time: TEST_MODIFY_TIME}
+                    for one_name, sizes in self.conn.files]
+        elif self.column == DataObject.name:
+            # Catalog queries return distinct rows
+            self.conn.name_scans += 1
+            rows = [{DataObject.name: one_name} for one_name, _ in self.conn.files]
+        else:
+            # Each replica has its own row
+            rows = [{DataObject.id: one_name} for one_name, sizes in self.conn.files
+                    for _ in (sizes[:1] if self.first_replicas else sizes)]
+
+        if self.counted:
+            return [{self.column: str(len(rows))}]
+        end = self.offset_rows + self.limit_rows if self.limit_rows is not None else None
+        return rows[self.offset_rows:end]
+
+    def execute(self) -> FakeResults:
+        """Returns the rows"""
+        return FakeResults(self._rows())
+
+    def get_results(self):
+        """Returns the rows"""
+        return iter(self._rows())
+
+
+class FakeCollections:
+    """Stands in for the collection manager of a session"""
+    # pylint: disable=too-few-public-methods
+    def __init__(self, exists: bool):
+        """Initializes class instance"""
+        self._exists = exists
+
+    def exists(self, _) -> bool:
+        """Returns whether the collection exists"""
+        return self._exists
+
+
+class FakeSession:
+    """Stands in for an iRODS session with one collection"""
+    # pylint: disable=too-few-public-methods
+    def __init__(self, folders: list, files: list, exists: bool = True):
+        """Initializes class instance"""
+        self.folders = folders
+        self.files = files
+        self.collections = FakeCollections(exists)
+        self.name_scans = 0
+
+    def query(self, column: object) -> FakeQuery:
+        """Returns a query"""
+        return FakeQuery(self, column)
+
+
+@pytest.mark.parametrize('file_filter, expected', [
+    ('*.tif', ('%.tif', True)),
+    ('plot_?.csv', ('plot__.csv', False)),
+    ('100%.txt', ('100%.txt', False)),
+    ('[ab]*.tif', ('_%.tif', False)),
+    ('[a', ('[a', True)),
+])
+def test_irods_like_pattern(file_filter, expected):
+    """Tests converting shell-style filters to LIKE patterns"""
+    assert irods_like_pattern(file_filter) == expected
+
+
+def test_list_replicated_objects():
+    """Tests that data objects with several replicas are listed and counted once"""
+    conn = FakeSession(['/zone/home/plots'], [('a.tif', [10, 10]), ('b.tif', [20, 25]), ('c.tif', [30])])
+
+    entries, total = list_irods_collection(conn, '/zone/home', None, 0, 2)
+    assert total == 4
+    assert [one_entry['name'] for one_entry in entries] == ['plots', 'a.tif']
+
+    entries, total = list_irods_collection(conn, '/zone/home', None, 2, 5)
+    assert total == 4
+    assert [(one_entry['name'], one_entry['size']) for one_entry in entries] == [('b.tif', 25), ('c.tif', 30)]
+    assert entries[0]['date'] == '2024-05-01 12:30:00'
+
+
+def test_count_in_catalog():
+    """Tests that data objects without extra replicas are counted by the catalog instead of fetching their names"""
+    conn = FakeSession([], [(f'{index:05d}.tif', [10]) for index in range(10000)])
+
+    entries, total = list_irods_collection(conn, '/zone/home', None, 0, 100)
+    assert total == 10000
+    assert len(entries) == 100
+    assert conn.name_scans == 0
+
+    conn = FakeSession([], [('a.tif', [10, 10]), ('b.tif', [20]), ('c.tif', [30])])
+    _, total = list_irods_collection(conn, '/zone/home', None, 0, 2)
+    assert total == 3
+    assert conn.name_scans == 1
+
+
+def test_list_missing_collection():
+    """Tests that listing a missing collection raises an exception, while an empty one is listed"""
+    with pytest.raises(CollectionDoesNotExist):
+        list_irods_collection(FakeSession([], [], exists=False), '/zone/home/missing', None, 0, None)
+
+    assert list_irods_collection(FakeSession([], []), '/zone/home/empty', '*.tif', 0, 10) == ([], 0)
@@ -0,0 +1,123 @@
+"""Tests the iRODS session pool"""
+
+import threading
+
+import pytest
+
+import irods_pool
+
+# Connection information used for testing
+TEST_AUTH = {'host': 'data.example.org', 'port': '1247', 'zone': 'testzone', 'user': 'tester', 'password': 'secret'}
+
+
+class FakeSession:
+    """Stands in for an iRODS session"""
+    # pylint: disable=too-few-public-methods
+    def __init__(self, **kwargs):
+        """Initializes class instance"""
+        self.kwargs = kwargs
+        self.cleaned_up = False
+
+    def cleanup(self):
+        """Marks the session as cleaned up"""
+        self.cleaned_up = True
+
+
+@pytest.fixture(name='pool')
+def fixture_pool(monkeypatch):
+    """Returns a session pool that creates fake sessions"""
+    monkeypatch.setattr(irods_pool, 'iRODSSession', FakeSession)
+    return irods_pool.IRODSSessionPool(1, 600, 60)
+
+
+def test_reuse(pool):
+    """Tests that sessions are reused for the same connection information only"""
+    with pool.session(TEST_AUTH) as conn:
+        first_conn = conn
+    with pool.session(TEST_AUTH) as conn:
+        assert conn is first_conn
+    with pool.session({**TEST_AUTH, 'password': 'other'}) as conn:
+        assert conn is not first_conn
+
+    # The pool only keeps one idle session
+    assert first_conn.cleaned_up is False
+    assert pool.stats() == {'idle': 1, 'open': 1, 'created': 2, 'reused': 1, 'discarded': 1, 'waits': 0}
+
+
+def test_discard_on_exception(pool):
+    """Tests that a session is discarded when an exception is raised while it's in use"""
+    with pytest.raises(RuntimeError):
+        with pool.session(TEST_AUTH) as conn:
+            raise RuntimeError('Lost connection')
+
+    assert conn.cleaned_up is True
+    with pool.session(TEST_AUTH) as new_conn:
+        assert new_conn is not conn
+
+
+def test_idle_timeout(pool):
+    """Tests that sessions idle for too long are not reused"""
+    pool.idle_timeout_sec = 0
+    with pool.session(TEST_AUTH) as conn:
+        first_conn = conn
+    with pool.session(TEST_AUTH) as conn:
+        assert conn is not first_conn
+
+    assert first_conn.cleaned_up is True
+
+
+def test_session_limit(pool):
+    """Tests that callers wait for a session once the limit of open sessions is reached"""
+    pool.max_sessions_per_key = 1
+    pool.wait_timeout_sec = 5
+    received = []
+
+    def use_session():
+        with pool.session(TEST_AUTH) as conn:
+            received.append(conn)
+
+    with pool.session(TEST_AUTH) as first_conn:
+        waiting = threading.Thread(target=use_session)
+        waiting.start()
+        waiting.join(0.2)
+        assert waiting.is_alive() and not received
+    waiting.join(5)
+
+    assert received == [first_conn]
+    assert pool.stats()['created'] == 1
+
+    pool.wait_timeout_sec = 0.1
+    with pool.session(TEST_AUTH):
+        with pytest.raises(TimeoutError):
+            with pool.session(TEST_AUTH):
+                pass
+
+
+def test_waiters_of_other_keys(pool):
+    """Tests that a returned session goes to a caller waiting for its key while callers of other keys are waiting"""
+    pool.max_sessions_per_key = 1
+    pool.wait_timeout_sec = 3
+    other_auth = {**TEST_AUTH, 'user': 'other'}
+    received = {}
+
+    def use_session(name: str, auth: dict):
+        with pool.session(auth) as conn:
+            received[name] = conn
+
+    with pool.session(other_auth):
+        with pool.session(TEST_AUTH) as first_conn:
+            # The caller of the other key starts waiting first
+            other_waiting = threading.Thread(target=use_session, args=('other', other_auth))
+            other_waiting.start()
+            other_waiting.join(0.1)
+            waiting = threading.Thread(target=use_session, args=('test', TEST_AUTH))
+            waiting.start()
+            waiting.join(0.1)
+            assert not received
+
+        # The session is returned while the other key's session is still in use
+        waiting.join(1)
+        assert not waiting.is_alive()
+        assert received == {'test': first_conn}
+    other_waiting.join(3)
+    assert 'other' in received
@@ -0,0 +1,135 @@
+"""Tests transferring files to iRODS"""
+
+import hashlib
+import io
+
+from irods_transfers import irods_checksum_hasher, irods_checksum_value, put_irods_data_object
+
+# Contents of the uploaded test file
+TEST_CONTENTS = b'0123456789' * 100
+
+
+class FakeDataObject(io.BytesIO):
+    """Stands in for an open data object, keeping its contents when it's closed"""
+
+    def __init__(self, objects: dict, path: str):
+        """Initializes class instance"""
+        super().__init__()
+        self.objects = objects
+        self.path = path
+
+    def close(self):
+        """Stores the written contents"""
+        self.objects[self.path] = self.getvalue()
+        super().close()
+
+
+class FakeDataObjects:
+    """Stands in for the data object manager of a session"""
+
+    def __init__(self, scheme: str, corrupt_count: int):
+        """Initializes class instance"""
+        self.objects = {}
+        self.opens = 0
+        self.puts = []
+        self.scheme = scheme
+        self.corrupt_count = corrupt_count
+
+    def open(self, path: str, mode: str) -> FakeDataObject:
+        """Opens a data object for writing"""
+        assert mode == 'w'
+        self.opens += 1
+        return FakeDataObject(self.objects, path)
+
+    def put(self, local_path: str, irods_path: str, num_threads: int = 0, updatables: list = (), **options) -> None:
+        """Uploads a file in parts over several connections"""
+        assert 'forceFlag' in options
+        self.puts.append(num_threads)
+        with open(local_path, 'rb') as in_file:
+            self.objects[irods_path] = in_file.read()
+        for one_updatable in updatables:
+            one_updatable(len(self.objects[irods_path]))
+
+    def chksum(self, path: str) -> str:
+        """Returns the checksum of a data object, corrupting the first ones"""
+        contents = self.objects[path]
+        if self.corrupt_count > 0:
+            self.corrupt_count -= 1
+            contents = contents[1:]
+        hasher = irods_checksum_hasher(self.scheme)
+        hasher.update(contents)
+        return irods_checksum_value(hasher)
+
+
+class FakeSession:
+    """Stands in for an iRODS session"""
+    # pylint: disable=too-few-public-methods
+    def __init__(self, scheme: str, corrupt_count: int = 0):
+        """Initializes class instance"""
+        self.data_objects = FakeDataObjects(scheme, corrupt_count)
+
+
+def test_checksum_values():
+    """Tests that checksums are formatted the way the server stores them"""
+    sha256 = irods_checksum_hasher('sha2:abc')
+    sha256.update(b'data')
+    assert irods_checksum_value(sha256) == 'sha2:Om6weQ85rIfJTzhWst0sXREOaBFgImGpqSPTuyOtyLc='
+
+    md5 = irods_checksum_hasher('0123456789abcdef')
+    md5.update(b'data')
+    assert irods_checksum_value(md5) == hashlib.md5(b'data').hexdigest()
+
+
+def test_put_data_object(tmp_path):
+    """Tests that uploads are checked against either of the server's checksum schemes"""
+    source_path = tmp_path / 'result.csv'
+    source_path.write_bytes(TEST_CONTENTS)
+
+    for scheme in ('sha2:', '0123'):
+        conn = FakeSession(scheme)
+        sent = []
+        assert put_irods_data_object(conn, str(source_path), '/zone/home/result.csv', 64, 2, sent.append)
+        assert conn.data_objects.objects['/zone/home/result.csv'] == TEST_CONTENTS
+        assert sum(sent) == len(TEST_CONTENTS)
+        assert conn.data_objects.opens == 1
+
+
+def test_put_data_object_retries(tmp_path):
+    """Tests that an upload with a bad checksum is tried again until the tries run out"""
+    source_path = tmp_path / 'result.csv'
+    source_path.write_bytes(TEST_CONTENTS)
+
+    conn = FakeSession('sha2:', corrupt_count=1)
+    assert put_irods_data_object(conn, str(source_path), '/zone/home/result.csv', 64, 2)
+    assert conn.data_objects.opens == 2
+
+    conn = FakeSession('sha2:', corrupt_count=2)
+    assert not put_irods_data_object(conn, str(source_path), '/zone/home/result.csv', 64, 2)
+
+
+def test_put_large_data_object(tmp_path):
+    """Tests that large files are uploaded over several connections and checked against the local file's checksum"""
+    source_path = tmp_path / 'mask.tif'
+    source_path.write_bytes(TEST_CONTENTS)
+
+    for scheme in ('sha2:', '0123'):
+        conn = FakeSession(scheme)
+        sent = []
+        assert put_irods_data_object(conn, str(source_path), '/zone/home/mask.tif', 64, 2, sent.append,
+                                     parallel_min_size=len(TEST_CONTENTS), num_threads=4)
+        assert conn.data_objects.objects['/zone/home/mask.tif'] == TEST_CONTENTS
+        assert sum(sent) == len(TEST_CONTENTS)
+        assert conn.data_objects.puts == [4]
+        assert conn.data_objects.opens == 0
+
+    # Smaller files are still streamed
+    conn = FakeSession('sha2:')
+    assert put_irods_data_object(conn, str(source_path), '/zone/home/mask.tif', 64, 2,
+                                 parallel_min_size=len(TEST_CONTENTS) + 1, num_threads=4)
+    assert not conn.data_objects.puts
+    assert conn.data_objects.opens == 1
+
+    conn = FakeSession('sha2:', corrupt_count=1)
+    assert put_irods_data_object(conn, str(source_path), '/zone/home/mask.tif', 64, 2,
+                                 parallel_min_size=len(TEST_CONTENTS), num_threads=4)
+    assert conn.data_objects.puts == [4, 4]
@@ -0,0 +1,42 @@
+"""Tests the server's handling of workflow runs"""
+
+import json
+import os
+import tempfile
+
+import pytest
+
+from run_registry import RUN_STATUS_FAILED
+
+# The server's folders are made in a temporary folder instead of the source tree
+TEST_SERVER_FOLDER = tempfile.mkdtemp()
+for one_variable in ('WORKING_FOLDER', 'WORKFLOW_FOLDER', 'CODE_CHECK_FOLDER', 'CODE_TEMPLATE_FOLDER',
+                     'CODE_REPOSITORY_FOLDER', 'INPUT_CACHE_FOLDER'):
+    os.environ.setdefault(one_variable, os.path.join(TEST_SERVER_FOLDER, one_variable.lower()))
+
+# The server needs all of its dependencies
+main = pytest.importorskip('main')
+
+
+def test_stage_and_run_failed_fetch():
+    """Tests that a workflow whose input file can't be fetched is failed in its status and in the run registry"""
+    def failing_fetch(auth: dict, source_path: str, dest_path: str, progress_func=None) -> bool:
+        raise RuntimeError(f'Unable to fetch {source_path}')
+
+    run_id = 'stagingfailure'
+    working_folder = os.path.join(main.WORKFLOW_RUN_PATH, run_id)
+    os.makedirs(working_folder, exist_ok=True)
+    main.RUN_REGISTRY.add_run(run_id, 'owner', 'definition', {'name': 'Test'}, [])
+
+    workflow = [{'step': 'Plot heights', 'command': 'plot_height', 'working_folder': working_folder,
+                 'parameters': [{'field_name': 'image', 'type': 'file', 'value': '/zone/missing.tif', 'auth': {},
+                                 'getFile': failing_fetch, 'name': 'Test'}]}]
+    assert main.workflow_stage_and_run(run_id, workflow, working_folder, {}, TEST_SERVER_FOLDER) is False
+
+    with open(os.path.join(working_folder, 'status.json'), 'r', encoding='utf8') as in_file:
+        status = json.load(in_file)
+    assert 'Unable to fetch /zone/missing.tif' in status['completion']['error']
+
+    run = main.RUN_REGISTRY.get_run(run_id)
+    assert run['status'] == RUN_STATUS_FAILED
+    assert run['completion'] == status['completion']
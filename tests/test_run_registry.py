@@ -0,0 +1,34 @@
+"""Tests the registry of workflow runs"""
+
+from run_registry import RUN_STATUS_COMPLETED, RUN_STATUS_FAILED, RUN_STATUS_STAGING, RunRegistry
+
+
+def test_run_registry(tmp_path):
+    """Tests recording runs, listing them a page at a time, and recording their completion from another connection"""
+    db_path = str(tmp_path / 'runs.sqlite')
+    registry = RunRegistry(db_path)
+    for index in range(5):
+        registry.add_run(f'run{index}', 'owner', 'definition', {'name': 'Canopy Cover', 'steps': []}, [{'index': index}],
+                         start_time=1000 + index)
+    registry.add_run('other', 'other owner', 'definition', {'name': 'Other'}, [])
+
+    runs, total = registry.list_runs('owner', 1, 2)
+    assert total == 5
+    assert [one_run['id'] for one_run in runs] == ['run1', 'run2']
+    assert runs[0]['params'] == [{'index': 1}]
+    assert runs[0]['name'] == 'Canopy Cover' and runs[0]['status'] == RUN_STATUS_STAGING
+
+    # The workflow runner records completions with its own connection
+    RunRegistry(db_path).finish_run('run1', {'message': 'Completed'}, 100, end_time=2000)
+    RunRegistry(db_path).finish_run('run2', {'error': 'Unknown command'}, 0)
+
+    runs = registry.get_runs(['run1', 'run2', 'missing'])
+    assert sorted(runs) == ['run1', 'run2']
+    assert runs['run1']['status'] == RUN_STATUS_COMPLETED
+    assert runs['run1']['completion'] == {'message': 'Completed'}
+    assert runs['run1']['end_time'] == 2000 and runs['run1']['output_bytes'] == 100
+    assert runs['run2']['status'] == RUN_STATUS_FAILED
+
+    registry.remove_run('run1')
+    assert registry.get_run('run1') is None
+    assert registry.list_runs('owner')[1] == 4
@@ -0,0 +1,145 @@
+"""Tests the pool of workflow runner processes"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from run_registry import RUN_STATUS_COMPLETED, RunRegistry
+from runner_pool import RunnerPoolClient
+
+# The folder containing the runner and pool scripts
+SCRIPT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _queue_workflow(tmp_path, registry: RunRegistry, run_id: str) -> str:
+    """Returns the working folder of a queued workflow without any commands"""
+    working_folder = tmp_path / run_id
+    working_folder.mkdir()
+    (working_folder / 'queue').write_text(json.dumps([]), encoding='utf8')
+    registry.add_run(run_id, 'owner', 'definition', {'name': 'Test'}, [])
+    registry.queue_run(run_id)
+    return str(working_folder)
+
+
+def _wait_for_completion(registry: RunRegistry, run_id: str) -> dict:
+    """Returns the run once it's completed"""
+    for _ in range(100):
+        run = registry.get_run(run_id)
+        if run['status'] == RUN_STATUS_COMPLETED:
+            return run
+        time.sleep(0.1)
+    raise AssertionError(f'Run {run_id} did not complete')
+
+
+def test_runner_pool(tmp_path):
+    """Tests that workflows are run by the pool's processes, which are reused"""
+    registry_path = str(tmp_path / 'runs.sqlite')
+    registry = RunRegistry(registry_path)
+    socket_path = str(tmp_path / 'pool.sock')
+    pool = subprocess.Popen([sys.executable, os.path.join(SCRIPT_FOLDER, 'runner_pool.py'), socket_path, '-size', '1'],
+                            start_new_session=True)
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.1)
+
+        client = RunnerPoolClient(socket_path, 1, registry_path, SCRIPT_FOLDER)
+        pids = []
+        for run_id in ('first', 'second'):
+            pids.append(client.start_run(_queue_workflow(tmp_path, registry, run_id)))
+            assert _wait_for_completion(registry, run_id)['completion'] == {'message': 'No commands were found to execute'}
+            # The pool notices the process is idle again
+            time.sleep(0.5)
+        assert pids[0] == pids[1]
+        assert pids[0] != pool.pid
+
+        # Only one pool runs for a socket
+        duplicate = subprocess.run([sys.executable, os.path.join(SCRIPT_FOLDER, 'runner_pool.py'), socket_path],
+                                   check=False, timeout=30)
+        assert duplicate.returncode == 0
+    finally:
+        os.killpg(pool.pid, signal.SIGTERM)
+        pool.wait()
+
+
+def test_runner_pool_fallback(tmp_path):
+    """Tests that workflows are run in new processes when there's no pool"""
+    registry_path = str(tmp_path / 'runs.sqlite')
+    registry = RunRegistry(registry_path)
+    client = RunnerPoolClient(str(tmp_path / 'pool.sock'), 0, registry_path, SCRIPT_FOLDER)
+
+    client.start_run(_queue_workflow(tmp_path, registry, 'run'))
+    _wait_for_completion(registry, 'run')
+    for _ in range(100):
+        client.reap()
+        if not client._children:    # pylint: disable=protected-access
+            break
+        time.sleep(0.1)
+    assert not client._children     # pylint: disable=protected-access
+
+
+def _start_pool(socket_path: str, *args) -> subprocess.Popen:
+    """Returns a pool process once it's listening on the socket"""
+    pool = subprocess.Popen([sys.executable, os.path.join(SCRIPT_FOLDER, 'runner_pool.py'), socket_path, '-size', '1',
+                             *args], start_new_session=True)
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.1)
+    return pool
+
+
+def test_runner_pool_stops(tmp_path):
+    """Tests that the pool stops with the server process and when it's idle"""
+    socket_path = str(tmp_path / 'pool.sock')
+    with subprocess.Popen(['sleep', '60']) as server:
+        pool = _start_pool(socket_path, '-server_pid', str(server.pid))
+        try:
+            assert pool.poll() is None
+            server.kill()
+            server.wait()
+            assert pool.wait(timeout=30) == 0
+            assert not os.path.exists(socket_path)
+        finally:
+            if pool.poll() is None:
+                os.killpg(pool.pid, signal.SIGTERM)
+                pool.wait()
+
+    pool = _start_pool(socket_path, '-max_idle', '1')
+    try:
+        assert pool.wait(timeout=30) == 0
+        assert not os.path.exists(socket_path)
+    finally:
+        if pool.poll() is None:
+            os.killpg(pool.pid, signal.SIGTERM)
+            pool.wait()
+
+
+def test_runner_pool_other_scripts(tmp_path, monkeypatch):
+    """Tests that a pool running other scripts stops and is restarted by the server instead of running workflows"""
+    registry_path = str(tmp_path / 'runs.sqlite')
+    registry = RunRegistry(registry_path)
+    socket_path = str(tmp_path / 'pool.sock')
+    pool = _start_pool(socket_path)
+    try:
+        client = RunnerPoolClient(socket_path, 1, registry_path, SCRIPT_FOLDER)
+        client.version = 'other'
+        restarts = []
+        monkeypatch.setattr(client, 'start_pool', lambda **kwargs: restarts.append(kwargs))
+
+        pid = client.start_run(_queue_workflow(tmp_path, registry, 'run'))
+        assert pid != pool.pid
+        assert restarts == [{'force': True}]
+        assert pool.wait(timeout=30) == 0
+        assert not os.path.exists(socket_path)
+
+        _wait_for_completion(registry, 'run')
+    finally:
+        if pool.poll() is None:
+            os.killpg(pool.pid, signal.SIGTERM)
+            pool.wait()
+        client.reap()
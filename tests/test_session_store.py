@@ -0,0 +1,92 @@
+"""Tests the server-side session store"""
+
+import os
+import stat
+
+import pytest
+from flask import Flask, session
+
+from session_store import SESSION_DB_FILE_SUFFIXES, SqliteSessionInterface, make_private_folder
+
+
+@pytest.fixture(name='app')
+def fixture_app(tmp_path):
+    """Returns an app that keeps its sessions in a store"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test secret key'
+    app.session_interface = SqliteSessionInterface(str(tmp_path / 'sessions.sqlite'))
+
+    @app.route('/set/<string:value>')
+    def set_value(value: str):
+        session['values'] = session.get('values', []) + [value]
+        return 'set'
+
+    @app.route('/get')
+    def get_value():
+        return ','.join(session.get('values', []))
+
+    @app.route('/static')
+    def static_file():
+        return 'static'
+
+    return app
+
+
+def test_session_store(app):
+    """Tests that session values are kept on the server and that the cookie stays the same size"""
+    client = app.test_client()
+    assert client.get('/get').text == ''
+    assert client.get('/get').headers.get('Set-Cookie') is None
+
+    response = client.get('/set/first')
+    cookie = client.get_cookie('session').value
+    assert response.headers.get('Set-Cookie') is not None
+
+    for index in range(50):
+        response = client.get(f'/set/value{index}')
+        assert response.headers.get('Set-Cookie') is None
+    assert client.get_cookie('session').value == cookie
+    assert client.get('/get').text.startswith('first,value0,value1')
+
+    # Requests that don't use the session don't touch it
+    response = client.get('/static')
+    assert response.headers.get('Vary') is None
+
+    # Other clients can't use a session without its signed ID
+    other_client = app.test_client()
+    other_client.set_cookie('session', cookie.split('.')[0] + '.forged')
+    assert other_client.get('/get').text == ''
+
+
+def test_store_permissions(tmp_path):
+    """Tests that the session database and the files next to it can only be read by their owner"""
+    db_path = tmp_path / 'sessions.sqlite'
+    db_path.write_bytes(b'')
+    os.chmod(db_path, 0o644)
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test secret key'
+    app.session_interface = SqliteSessionInterface(str(db_path))
+
+    @app.route('/set')
+    def set_value():
+        session['connection'] = {'password': 'secret'}
+        return 'set'
+
+    app.test_client().get('/set')
+
+    db_files = [tmp_path / ('sessions.sqlite' + one_suffix) for one_suffix in SESSION_DB_FILE_SUFFIXES]
+    assert all(one_file.exists() for one_file in db_files)
+    assert all(stat.S_IMODE(os.stat(one_file).st_mode) == 0o600 for one_file in db_files)
+
+
+def test_private_folder(tmp_path):
+    """Tests that session folders are only used when they're private"""
+    folder = tmp_path / 'sessions'
+    make_private_folder(str(folder))
+    assert stat.S_IMODE(os.stat(folder).st_mode) == 0o700
+    make_private_folder(str(folder))
+
+    os.chmod(folder, 0o755)
+    with pytest.raises(PermissionError):
+        make_private_folder(str(folder))
@@ -0,0 +1,51 @@
+"""Tests the queue of uploads waiting for their workflows to finish"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from stageout_queue import StageoutQueue
+
+
+def test_submit_finished(tmp_path):
+    """Tests that uploads are only started once their workflow has finished"""
+    finished = set()
+    uploads = []
+    folders = {}
+    for one_id in ('first', 'second'):
+        folders[one_id] = tmp_path / one_id
+        folders[one_id].mkdir()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        queue = StageoutQueue(executor, lambda workflow_id, working_folder: workflow_id in finished,
+                              lambda *args: uploads.append(args))
+        auth = {'host': 'irods.example.org'}
+        queue.add('first', str(folders['first']), auth, '/zone/home/results')
+        finished.add('second')
+        queue.add('second', str(folders['second']), auth, '/zone/home/results')
+
+        assert queue.pending_count() == 1
+        assert not queue.submit_finished()
+
+        finished.add('first')
+        assert queue.submit_finished() == ['first']
+        assert not queue.submit_finished()
+        assert queue.pending_count() == 0
+
+    assert uploads == [('second', str(folders['second']), auth, '/zone/home/results'),
+                       ('first', str(folders['first']), auth, '/zone/home/results')]
+
+
+def test_removed_workflow(tmp_path):
+    """Tests that the uploads of removed workflows are dropped"""
+    uploads = []
+    working_folder = tmp_path / 'removed'
+    working_folder.mkdir()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        queue = StageoutQueue(executor, lambda workflow_id, working_folder: False, lambda *args: uploads.append(args))
+        queue.add('removed', str(working_folder), {}, '/zone/home/results')
+        working_folder.rmdir()
+
+        assert not queue.submit_finished()
+        assert queue.pending_count() == 0
+
+    assert not uploads
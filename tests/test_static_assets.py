@@ -0,0 +1,53 @@
+"""Tests the index of static assets"""
+
+import gzip
+import os
+
+from static_assets import StaticAssets
+
+# Content used for testing compressible assets
+TEST_SCRIPT = b'console.log("static asset");\n' * 200
+
+
+def test_load_assets(tmp_path):
+    """Tests that assets are indexed with their variants and that hashed names are immutable"""
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'js' / 'main.1a2b3c4d.chunk.js').write_bytes(TEST_SCRIPT)
+    (tmp_path / 'js' / 'main.1a2b3c4d.chunk.js.br').write_bytes(b'brotli data')
+    (tmp_path / 'logo.png').write_bytes(b'image data')
+    (tmp_path / 'main.py').write_bytes(b'print("server")')
+
+    assets = StaticAssets(str(tmp_path), 1024 * 1024)
+    assets.load()
+    assert sorted(assets._assets) == ['js/main.1a2b3c4d.chunk.js', 'logo.png']  # pylint: disable=protected-access
+
+    script = assets.get('js/main.1a2b3c4d.chunk.js')
+    assert script.immutable is True
+    assert script.mimetype in ('application/javascript', 'text/javascript')
+    assert script.get_encodings() == ['br', 'gzip', 'identity']
+    assert script.variants['br'][0] == b'brotli data'
+    assert gzip.decompress(script.variants['gzip'][0]) == TEST_SCRIPT
+    assert script.get_etag('gzip') == script.etag + '-gzip'
+
+    logo = assets.get('logo.png')
+    assert logo.immutable is False
+    assert logo.get_encodings() == ['identity']
+
+
+def test_changed_assets(tmp_path):
+    """Tests that changed assets are indexed again and that files outside the folder aren't found"""
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'secret.txt').write_bytes(b'secret')
+    asset_path = tmp_path / 'assets' / 'manifest.json'
+    asset_path.write_bytes(b'{}')
+
+    assets = StaticAssets(str(tmp_path / 'assets'), 1)
+    first = assets.get('manifest.json')
+    assert first.variants['identity'] == (None, str(asset_path))
+
+    asset_path.write_bytes(b'{"name": "Atlana"}')
+    os.utime(asset_path, (first.mtime + 10, first.mtime + 10))
+    assert assets.get('manifest.json').etag != first.etag
+
+    assert assets.get('../secret.txt') is None
+    assert assets.get('missing.json') is None
@@ -0,0 +1,44 @@
+"""Tests writing and reading workflow status files"""
+
+import json
+import os
+
+import pytest
+
+from status_file import STATUS_SEQUENCE_KEY, status_file_signature, write_status_file
+
+
+def test_sequence(tmp_path):
+    """Tests that the sequence number continues from the status file"""
+    status_path = str(tmp_path / 'status.json')
+    assert status_file_signature(status_path) is None
+
+    assert write_status_file(status_path, {'starting': {'message': 'Staging'}}) == 1
+    assert write_status_file(status_path, {'running': {'message': 'Running'}}) == 2
+
+    with open(status_path, 'r', encoding='utf8') as in_file:
+        assert json.load(in_file) == {'running': {'message': 'Running'}, STATUS_SEQUENCE_KEY: 2}
+    assert os.listdir(tmp_path) == ['status.json']
+
+
+def test_signature_changes(tmp_path):
+    """Tests that the signature changes for quick writes of statuses that are the same size"""
+    status_path = str(tmp_path / 'status.json')
+    signatures = set()
+    for index in range(200):
+        write_status_file(status_path, {'running': {'message': f'Running step {index % 10}'}})
+        signatures.add(status_file_signature(status_path))
+    assert len(signatures) == 200
+
+
+def test_failed_write(tmp_path):
+    """Tests that a failed write keeps the previous status and removes the temporary file"""
+    status_path = str(tmp_path / 'status.json')
+    write_status_file(status_path, {'running': {'message': 'Running'}})
+    signature = status_file_signature(status_path)
+
+    with pytest.raises(TypeError):
+        write_status_file(status_path, {'running': {'message': object()}})
+
+    assert status_file_signature(status_path) == signature
+    assert os.listdir(tmp_path) == ['status.json']
@@ -0,0 +1,79 @@
+"""Tests finding and returning workflow artifacts"""
+
+import json
+
+from flask import Flask, request
+
+from workflow_artifacts import WORKFLOW_SAVE_FILE_NAME, artifact_response, find_artifact, load_run_workflow
+
+# Contents of the test artifact
+TEST_CONTENTS = b'plot,height\n' + b'1,25.5\n' * 100
+
+# Workflow producing the test artifact
+TEST_WORKFLOW = {'id': 'workflow', 'steps': [{'command': 'plot_height', 'results': [{'name': 'heights',
+                                                                                    'filename': 'heights.csv'}]}]}
+
+# Application serving the test artifact
+TEST_APP = Flask(__name__)
+
+
+@TEST_APP.route('/artifact')
+def return_artifact():
+    """Returns the artifact at the requested path"""
+    return artifact_response(request.args['path'], 'plot heights.csv')
+
+
+def _make_run(tmp_path) -> str:
+    """Returns the working folder of a run that produced the test artifact"""
+    working_dir = tmp_path / 'run'
+    (working_dir / 'plot_height').mkdir(parents=True)
+    (working_dir / 'plot_height' / 'heights.csv').write_bytes(TEST_CONTENTS)
+    (working_dir / WORKFLOW_SAVE_FILE_NAME).write_text(json.dumps(TEST_WORKFLOW), encoding='utf8')
+    return str(working_dir)
+
+
+def test_find_artifact(tmp_path):
+    """Tests finding artifacts in the workflow saved for a run"""
+    working_dir = _make_run(tmp_path)
+
+    assert load_run_workflow(working_dir, None) == TEST_WORKFLOW
+    assert load_run_workflow(working_dir, {'workflow': {'steps': []}}) == {'steps': []}
+    assert load_run_workflow(str(tmp_path), None) is None
+
+    assert find_artifact(working_dir, TEST_WORKFLOW, 'plot_height', 'heights') == \
+           (str(tmp_path / 'run' / 'plot_height' / 'heights.csv'), 'heights.csv')
+    assert find_artifact(working_dir, TEST_WORKFLOW, 'plot_height', 'widths') is None
+
+    # Result files outside of the run's folder aren't returned
+    (tmp_path / 'secret.txt').write_text('secret', encoding='utf8')
+    escaping_workflow = {'steps': [{'command': 'plot_height', 'results': [{'name': 'secret',
+                                                                           'filename': '../../secret.txt'}]}]}
+    assert find_artifact(working_dir, escaping_workflow, 'plot_height', 'secret') is None
+
+
+def test_artifact_ranges(tmp_path):
+    """Tests that artifacts can be downloaded in ranges and revalidated"""
+    artifact_path = find_artifact(_make_run(tmp_path), TEST_WORKFLOW, 'plot_height', 'heights')[0]
+    client = TEST_APP.test_client()
+
+    response = client.get('/artifact', query_string={'path': artifact_path})
+    assert response.status_code == 200
+    assert response.data == TEST_CONTENTS
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert 'plot heights.csv' in response.headers['Content-Disposition']
+    etag = response.headers['ETag']
+
+    response = client.get('/artifact', query_string={'path': artifact_path}, headers={'Range': 'bytes=100-'})
+    assert response.status_code == 206
+    assert response.data == TEST_CONTENTS[100:]
+    assert response.headers['Content-Range'] == f'bytes 100-{len(TEST_CONTENTS) - 1}/{len(TEST_CONTENTS)}'
+
+    # A range of a changed file isn't returned when resuming
+    response = client.get('/artifact', query_string={'path': artifact_path},
+                          headers={'Range': 'bytes=100-', 'If-Range': '"changed"'})
+    assert response.status_code == 200
+    assert response.data == TEST_CONTENTS
+
+    response = client.get('/artifact', query_string={'path': artifact_path}, headers={'If-None-Match': etag})
+    assert response.status_code == 304
@@ -0,0 +1,45 @@
+"""Tests the registry of workflow definitions"""
+
+import gzip
+import json
+
+from workflow_registry import WorkflowRegistry
+
+
+def test_registry():
+    """Tests finding and adding definitions and that their serialised form follows changes"""
+    registry = WorkflowRegistry([{'id': 'one', 'name': 'First'}, {'id': 'one', 'name': 'Duplicate'}])
+    assert registry.version == 1
+    assert registry.find('one') == {'id': 'one', 'name': 'First'}
+    assert registry.find('two') is None
+
+    first_json, first_gzip, first_digest = registry.get_serialised()
+    assert json.loads(first_json) == [{'id': 'one', 'name': 'First'}]
+    assert gzip.decompress(first_gzip).decode('utf8') == first_json
+    assert registry.get_serialised()[0] is first_json
+
+    assert registry.add({'id': 'one', 'name': 'Again'}) is False
+    assert registry.version == 1
+
+    added = registry.add_many([{'id': 'two', 'name': 'Second'}, {'id': 'one'}, {'id': 'three', 'name': 'Third'}])
+    assert [one_definition['id'] for one_definition in added] == ['two', 'three']
+    assert registry.version == 2
+
+    new_json, _, new_digest = registry.get_serialised()
+    assert [one_definition['id'] for one_definition in json.loads(new_json)] == ['one', 'two', 'three']
+    assert new_digest != first_digest
+
+
+def test_add_unique():
+    """Tests that definitions are only added when none of their IDs are in use"""
+    registry = WorkflowRegistry([{'id': 'one', 'name': 'First'}])
+
+    assert registry.add_unique([{'id': 'two'}, {'id': 'one'}, {'id': 'three'}]) == ['one']
+    assert registry.add_unique([{'id': 'two'}, {'id': 'two'}]) == ['two']
+    assert registry.find('two') is None
+    assert registry.version == 1
+
+    assert not registry.add_unique([{'id': 'two', 'name': 'Second'}, {'id': 'three', 'name': 'Third'}])
+    assert registry.find('three') == {'id': 'three', 'name': 'Third'}
+    assert registry.version == 2
+    assert [one_definition['id'] for one_definition in json.loads(registry.get_serialised()[0])] == ['one', 'two', 'three']
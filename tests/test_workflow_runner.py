@@ -0,0 +1,19 @@
+"""Tests the status files written by the workflow runner"""
+
+import json
+import os
+
+import workflow_runner
+
+
+def test_write_status(tmp_path):
+    """Tests that the status replaces the previous one without leaving temporary files behind"""
+    status_path = str(tmp_path / workflow_runner.STATUS_FILE_NAME)
+
+    workflow_runner.write_status(status_path, workflow_runner.STATUS_RUNNING, {'message': 'Running first'})
+    workflow_runner.write_status(status_path, workflow_runner.STATUS_COMPLETED, {'message': 'Completed'})
+
+    with open(status_path, 'r', encoding='utf8') as in_file:
+        assert json.load(in_file) == {'completion': {'message': 'Completed'}, 'sequence': 2}
+    assert os.listdir(tmp_path) == [workflow_runner.STATUS_FILE_NAME]
+
@@ -0,0 +1,121 @@
+"""Tests the scheduler of workflow runs"""
+
+import os
+import subprocess
+import sys
+
+from run_registry import RUN_STATUS_COMPLETED, RUN_STATUS_FAILED, RUN_STATUS_QUEUED, RUN_STATUS_RUNNING, RUN_STATUS_STAGING, RunRegistry, \
+                         order_queued_runs
+from workflow_scheduler import WorkflowScheduler
+
+
+def test_order_queued_runs():
+    """Tests that sessions share the running slots and that priorities order a session's own runs"""
+    queued = [{'id': 'a1', 'owner': 'a', 'priority': 0, 'queued_time': 1},
+              {'id': 'a2', 'owner': 'a', 'priority': 5, 'queued_time': 2},
+              {'id': 'a3', 'owner': 'a', 'priority': 0, 'queued_time': 3},
+              {'id': 'b1', 'owner': 'b', 'priority': 0, 'queued_time': 4},
+              {'id': 'c1', 'owner': 'c', 'priority': 0, 'queued_time': 5}]
+    ordered = order_queued_runs(queued, {'c': 1})
+    assert [one_run['id'] for one_run in ordered] == ['a2', 'b1', 'a1', 'c1', 'a3']
+
+
+def test_priority_across_owners():
+    """Tests that a session's priority doesn't put its runs ahead of another session's older runs"""
+    queued = [{'id': 'b1', 'owner': 'b', 'priority': 0, 'queued_time': 1},
+              {'id': 'a1', 'owner': 'a', 'priority': 10, 'queued_time': 5}]
+    assert [one_run['id'] for one_run in order_queued_runs(queued, {})] == ['b1', 'a1']
+
+    # An owner's oldest run holds its place in the queue for its highest priority run
+    queued.append({'id': 'a0', 'owner': 'a', 'priority': 0, 'queued_time': 0})
+    assert [one_run['id'] for one_run in order_queued_runs(queued, {})] == ['a1', 'b1', 'a0']
+
+
+def test_scheduler(tmp_path):
+    """Tests that runs wait for room to run, report their queue position, and free their slot when their runner stops"""
+    registry = RunRegistry(str(tmp_path / 'runs.sqlite'))
+    statuses = {}
+    launched = {}
+
+    def launch(run_id: str) -> int:
+        # pylint: disable=consider-using-with
+        launched[run_id] = subprocess.Popen([sys.executable, '-c', 'pass'])
+        return launched[run_id].pid
+
+    def write_status(run_id: str, status: dict) -> None:
+        statuses[run_id] = status
+
+    scheduler = WorkflowScheduler(registry, launch, write_status, max_running=2, memory_per_run_mb=0)
+    for index, owner in enumerate(('a', 'a', 'a', 'b')):
+        registry.add_run(f'run{index}', owner, 'definition', {'name': 'Test'}, [])
+        registry.queue_run(f'run{index}', queued_time=index)
+
+    assert scheduler.schedule() == ['run0', 'run3']
+    assert list(launched) == ['run0', 'run3']
+    assert registry.get_run('run0')['status'] == RUN_STATUS_RUNNING
+    assert registry.get_run('run1')['status'] == RUN_STATUS_QUEUED
+    assert statuses['run1']['starting']['queue_position'] == 1
+    assert statuses['run2']['starting']['queue_position'] == 2
+
+    # Nothing more is run until a slot is free
+    assert not scheduler.schedule()
+
+    # The runners exit without recording a completion, so their runs are failed
+    for one_proc in launched.values():
+        one_proc.wait()
+    scheduler.reap()
+    assert registry.get_run('run0')['status'] == RUN_STATUS_FAILED
+    assert 'error' in statuses['run3']['completion']
+
+    assert scheduler.schedule() == ['run1', 'run2']
+    assert statuses['run1'] == {'starting': {'message': 'Starting workflow'}}
+    for one_proc in launched.values():
+        one_proc.wait()
+
+
+def test_reap_staging(tmp_path):
+    """Tests that runs being staged by a process that has stopped are failed"""
+    registry = RunRegistry(str(tmp_path / 'runs.sqlite'))
+    statuses = {}
+    scheduler = WorkflowScheduler(registry, lambda run_id: None, statuses.__setitem__, max_running=1)
+
+    stopped = subprocess.Popen([sys.executable, '-c', 'pass'])     # pylint: disable=consider-using-with
+    stopped.wait()
+    registry.add_run('lost', 'a', 'definition', {'name': 'Test'}, [], pid=stopped.pid)
+    registry.add_run('staging', 'a', 'definition', {'name': 'Test'}, [])
+    registry.add_run('queued', 'a', 'definition', {'name': 'Test'}, [], pid=stopped.pid)
+    registry.queue_run('queued')
+
+    scheduler.reap()
+    assert registry.get_run('lost')['status'] == RUN_STATUS_FAILED
+    assert 'error' in statuses['lost']['completion']
+    assert registry.get_run('staging')['status'] == RUN_STATUS_STAGING
+    assert registry.get_run('queued')['status'] == RUN_STATUS_QUEUED
+    assert list(statuses) == ['lost']
+
+
+def test_reap_completed_status(tmp_path):
+    """Tests that a run whose status has its completion frees its slot while its runner process keeps running"""
+    registry = RunRegistry(str(tmp_path / 'runs.sqlite'))
+    completions = {}
+    statuses = {}
+    # The runners stand in for pool processes that stay alive between runs
+    scheduler = WorkflowScheduler(registry, lambda run_id: os.getpid(), statuses.__setitem__, max_running=1,
+                                  memory_per_run_mb=0, completion_func=completions.get)
+    for run_id in ('first', 'second'):
+        registry.add_run(run_id, 'a', 'definition', {'name': 'Test'}, [])
+        registry.queue_run(run_id)
+
+    assert scheduler.schedule() == ['first']
+    scheduler.reap()
+    assert scheduler.schedule() == []
+    assert registry.get_run('first')['status'] == RUN_STATUS_RUNNING
+
+    # The runner wrote the completion but didn't record it in the registry
+    completions['first'] = {'message': 'Completed'}
+    scheduler.reap()
+    run = registry.get_run('first')
+    assert run['status'] == RUN_STATUS_COMPLETED
+    assert run['completion'] == {'message': 'Completed'}
+    assert 'completion' not in statuses.get('first', {})
+    assert scheduler.schedule() == ['second']
@@ -0,0 +1,33 @@
+"""Tests streaming ZIP archives"""
+
+import io
+import os
+import zipfile
+
+from zip_stream import ARCHIVE_READ_SIZE, stream_zip
+
+
+def test_stream_zip(tmp_path):
+    """Tests that the streamed archive contains the files, with compressed files stored"""
+    tif_data = os.urandom(2 * ARCHIVE_READ_SIZE + 10)
+    csv_data = b'plot,value\n' * 1000
+    (tmp_path / 'mask.tif').write_bytes(tif_data)
+    (tmp_path / 'results.csv').write_bytes(csv_data)
+
+    chunks = list(stream_zip([(str(tmp_path / 'mask.tif'), 'soilmask/mask.tif'),
+                              (str(tmp_path / 'results.csv'), 'results.csv')]))
+    assert len(chunks) > 2
+
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ['soilmask/mask.tif', 'results.csv']
+        assert archive.getinfo('soilmask/mask.tif').compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo('results.csv').compress_type == zipfile.ZIP_DEFLATED
+        assert archive.read('soilmask/mask.tif') == tif_data
+        assert archive.read('results.csv') == csv_data
+
+
+def test_empty_zip():
+    """Tests that an archive without files is valid"""
+    with zipfile.ZipFile(io.BytesIO(b''.join(stream_zip([])))) as archive:
+        assert not archive.namelist()
@@ -0,0 +1,81 @@
+"""Finds and returns the artifacts produced by workflow runs"""
+
+import json
+import mimetypes
+import os
+from typing import Optional
+
+from flask import Response, send_file
+
+# Name of the file in a workflow's folder holding the workflow that's being run
+WORKFLOW_SAVE_FILE_NAME = '_workflow'
+
+
+def load_run_workflow(working_dir: str, run: Optional[dict]) -> Optional[dict]:
+    """Returns the workflow of a run
+    Arguments:
+        working_dir: the working folder of the run
+        run: the run from the run registry, or None if the run isn't in the registry
+    Return:
+        Returns the workflow from the registry, or the one saved in the run's folder when the run isn't in the registry,
+        or None if it can't be found
+    """
+    if run is not None and run.get('workflow'):
+        return run['workflow']
+
+    try:
+        with open(os.path.join(working_dir, WORKFLOW_SAVE_FILE_NAME), 'r', encoding='utf8') as in_file:
+            return json.load(in_file)
+    except (OSError, ValueError) as ex:
+        print(f'Unable to load the saved workflow of "{working_dir}"', ex)
+
+    return None
+
+
+def find_artifact(working_dir: str, workflow: dict, step_command: str, artifact_name: str) -> Optional[tuple]:
+    """Finds the file of a workflow artifact
+    Arguments:
+        working_dir: the working folder of the run
+        workflow: the workflow that was run
+        step_command: the command of the step producing the artifact
+        artifact_name: the name of the artifact in the step's results
+    Return:
+        Returns a 2-tuple of the path of the artifact's file and the file name of the result, or None if the artifact isn't
+        found or its file isn't in the working folder
+    """
+    found_file = None
+    for one_step in workflow.get('steps', []):
+        if one_step.get('command') == step_command:
+            for one_result in one_step.get('results', []):
+                if one_result.get('name') == artifact_name:
+                    found_file = one_result['filename']
+                    break
+        if found_file is not None:
+            break
+
+    if found_file is None:
+        return None
+
+    artifact_path = os.path.abspath(os.path.join(working_dir, step_command, found_file))
+    if not artifact_path.startswith(os.path.join(working_dir, '')) or not os.path.isfile(artifact_path):
+        return None
+
+    return artifact_path, found_file
+
+
+def artifact_response(artifact_path: str, save_filename: str) -> Response:
+    """Returns the response streaming an artifact's file
+    Arguments:
+        artifact_path: the path of the artifact's file
+        save_filename: the name to save the file as
+    Return:
+        Returns the response, which has a content type based on the file's name, and ETag and Last-Modified headers
+    Notes:
+        Conditional and Range requests are answered from the file, so that downloads can be resumed
+    """
+    mimetype, _ = mimetypes.guess_type(save_filename)
+    if mimetype is None:
+        mimetype, _ = mimetypes.guess_type(artifact_path)
+
+    return send_file(artifact_path, mimetype=mimetype or 'application/octet-stream', as_attachment=True,
+                     download_name=save_filename, conditional=True, etag=True)
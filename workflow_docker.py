@@ -12,6 +12,8 @@ from threading import Event, Thread
 from collections.abc import Callable
 import logging
 
+from file_staging import load_read_only_mounts
+
 #DOCKER_IMAGE = 'agdrone/drone-workflow:1.1'
 DOCKER_IMAGE = 'chrisatua/development:drone_makeflow'
 
@@ -187,6 +189,8 @@ def _run_command(command: str, input_folder: str, output_folder: str, json_file_
         err_func: function to write errors to
         additional_copy: optional tuple of additional mount commands for the docker command; one or more [source_path, mount_point] pairs;
                          source files are copied before the command is run and folders are created as needed
+    Notes:
+        Read-only files staged into the input folder by file_staging.add_read_only_mount() are mounted over their placeholders
     """
     run_command = ['docker',
                    'run',
@@ -199,6 +203,11 @@ def _run_command(command: str, input_folder: str, output_folder: str, json_file_
                    json_file_path + ':/scif/apps/src/jx-args.json'
                    ]
 
+    # Mount the read-only input files that weren't copied into the input folder
+    for source_path, file_name in load_read_only_mounts(input_folder):
+        run_command.append('-v')
+        run_command.append(source_path + ':' + '/input/' + file_name + ':ro')
+
     if additional_mounts is not None:
         for one_mount in additional_mounts:
             if len(one_mount) == 2:
@@ -0,0 +1,118 @@
+"""Implements the registry of known workflow definitions"""
+
+import gzip
+import hashlib
+import json
+from threading import Lock
+from typing import Optional
+
+
+class WorkflowRegistry:
+    """Keeps workflow definitions indexed by their ID along with their serialised form
+
+    The definitions are kept in the order they're added. The JSON of the definitions and a gzip compressed copy are
+    built when they're first needed after a change and are reused until the next change. The version increases with
+    each change
+    """
+
+    def __init__(self, definitions: list):
+        """Initializes class instance
+        Arguments:
+            definitions - the initial workflow definitions; a definition with the same ID as an earlier one is ignored
+        """
+        self.version = 0
+        self._definitions = []
+        self._index = {}
+        self._serialised = None
+        self._lock = Lock()
+        self.add_many(definitions)
+
+
+    def find(self, workflow_id: str) -> Optional[dict]:
+        """Returns a workflow definition
+        Arguments:
+            workflow_id - the ID of the definition to return
+        Return:
+            Returns the definition, or None if it's not found
+        """
+        return self._index.get(workflow_id)
+
+
+    def add(self, definition: dict) -> bool:
+        """Adds a workflow definition
+        Arguments:
+            definition - the definition to add
+        Return:
+            Returns True if the definition was added and False if there's already a definition with its ID
+        """
+        return len(self.add_many([definition])) > 0
+
+
+    def add_many(self, definitions: list) -> list:
+        """Adds several workflow definitions as one change
+        Arguments:
+            definitions - the definitions to add
+        Return:
+            Returns the list of added definitions; definitions with the same ID as a known or earlier one aren't added
+        """
+        added = []
+        with self._lock:
+            for one_definition in definitions:
+                if one_definition['id'] in self._index:
+                    continue
+                self._index[one_definition['id']] = one_definition
+                self._definitions.append(one_definition)
+                added.append(one_definition)
+
+            if added:
+                self.version += 1
+                self._serialised = None
+
+        return added
+
+
+    def add_unique(self, definitions: list) -> list:
+        """Adds several workflow definitions as one change when none of their IDs are in use
+        Arguments:
+            definitions - the definitions to add
+        Return:
+            Returns the list of IDs that are already known or repeated in the definitions; none of the definitions are
+            added when the list isn't empty
+        """
+        with self._lock:
+            seen_ids = set()
+            duplicate_ids = []
+            for one_definition in definitions:
+                if one_definition['id'] in self._index or one_definition['id'] in seen_ids:
+                    duplicate_ids.append(one_definition['id'])
+                seen_ids.add(one_definition['id'])
+
+            if duplicate_ids or not definitions:
+                return duplicate_ids
+
+            for one_definition in definitions:
+                self._index[one_definition['id']] = one_definition
+                self._definitions.append(one_definition)
+            self.version += 1
+            self._serialised = None
+
+        return duplicate_ids
+
+
+    def get_serialised(self) -> tuple:
+        """Returns the serialised workflow definitions
+        Return:
+            Returns a 3-tuple of the JSON of the definitions, a gzip compressed copy of the JSON, and a digest of the JSON
+            that changes when the definitions change
+        """
+        serialised = self._serialised
+        if serialised is not None:
+            return serialised
+
+        with self._lock:
+            if self._serialised is None:
+                definitions_json = json.dumps(self._definitions)
+                definitions_bytes = definitions_json.encode('utf8')
+                self._serialised = (definitions_json, gzip.compress(definitions_bytes, mtime=0),
+                                    hashlib.sha256(definitions_bytes).hexdigest()[:32])
+            return self._serialised
@@ -11,6 +11,9 @@ from typing import Optional
 from collections.abc import Callable
 import logging
 
+from run_registry import RunRegistry
+from status_file import write_status_file
+
 if 'ATLANA_USE_SCIF_WORKFLOW' in os.environ:
     import workflow_scif as wd
 else:
@@ -193,6 +196,7 @@ def parse_args() -> tuple:
                         help='enable debug logging (default=WARN)')
     parser.add_argument('-info', action='store_const', default=logging.WARN, const=logging.INFO,
                         help='enable info logging (default=WARN)')
+    parser.add_argument('-registry', help='the run registry database to record the completion of the workflow in')
 
     args =  parser.parse_args()
 
@@ -208,7 +212,7 @@ def parse_args() -> tuple:
 
     logging_level = args.debug if args.debug == logging.DEBUG else args.info
 
-    return workflow_folder, workflow_file, logging_level
+    return workflow_folder, workflow_file, logging_level, args.registry
 
 
 def write_error(filename: str, messages: tuple, exception: Exception=None):
@@ -230,10 +234,61 @@ def write_status(filename: str, status: str, message: object):
         filename: the name of the file to write to
         status: the status to write to the file
         message: the message associated with the status
+    Notes:
+        The status file is replaced in one step so that readers never see a partial status, and includes an increasing
+        sequence number
+    """
+    cur_status = {status: message}
+    logging.info('Current status: %s', str(cur_status))
+    try:
+        write_status_file(filename, cur_status)
+    except Exception:
+        msg = f'Exception caught while writing status file "{filename}"'
+        logging.exception(msg)
+
+
+def _get_folder_size(folder: str) -> int:
+    """Returns the number of bytes of the files in a folder and its sub-folders
+    Arguments:
+        folder: the folder to check
+    Return:
+        Returns the number of bytes; linked files aren't counted
+    """
+    total = 0
+    for dir_path, _, file_names in os.walk(folder):
+        for one_name in file_names:
+            one_path = os.path.join(dir_path, one_name)
+            if not os.path.islink(one_path):
+                try:
+                    total += os.path.getsize(one_path)
+                except OSError:
+                    pass
+    return total
+
+
+def write_completion(filename: str, message: dict, registry_path: Optional[str]):
+    """Writes the completion status to the status file and records it in the run registry
+    Arguments:
+        filename: the name of the status file to write to
+        message: the completion message; failed workflows have an 'error' key
+        registry_path: the path of the run registry database; the completion isn't recorded when None
     """
-    lines = (json.dumps({status: message}, indent=2),)
-    logging.info('Current status: %s', str(lines))
-    _ = _write_log_file(filename, lines, append=False)
+    write_status(filename, STATUS_COMPLETED, message)
+    if not registry_path:
+        return
+
+    working_folder = os.path.dirname(filename)
+    registry = None
+    try:
+        registry = RunRegistry(registry_path)
+        registry.finish_run(os.path.basename(working_folder), message, _get_folder_size(working_folder))
+    except Exception:
+        msg = f'Exception caught while recording the workflow completion in the run registry "{registry_path}"'
+        logging.exception(msg)
+    finally:
+        # Runners in the workflow runner pool record many completions, so connections aren't left open
+        if registry is not None:
+            registry.close()
 
 
 def prepare_prev_results(parameters: list, res: dict) -> list:
@@ -288,12 +343,16 @@ y referenced files to
     return adjusted
 
 
-def run_workflow():
-    """ Runs the workflow passed in on the command line"""
-    working_folder, workflow_file, logging_level = parse_args()
-
-    logging.getLogger().setLevel(logging_level)
-
+def run_workflow_folder(working_folder: str, workflow_file: str, registry_path: Optional[str]):
+    """Runs a queued workflow
+    Arguments:
+        working_folder: the working folder of the workflow
+        workflow_file: the file containing the queued commands to execute
+        registry_path: the path of the run registry database to record the completion in; not recorded when None
+    Notes:
+        This is called once per process when run from the command line, and once per workflow by the workflow runner
+        pool's processes
+    """
     status_filename = os.path.join(working_folder, STATUS_FILE_NAME)
     # Disable pylint check since we'd lose the *_filename context if we changed lambdas to defined functions
     # pylint: disable=unnecessary-lambda-assignment
@@ -302,8 +361,8 @@ def run_workflow():
     error_filename = os.path.join(working_folder, STDERR_FILE_NAME)
     error_func = lambda msg, append: _write_log_file(error_filename, msg, append)
 
-    # Clean up from a previous run if necessary
-    for file_name in [status_filename, message_filename, error_filename]:
+    # Clean up from a previous run if necessary (the status file is replaced when the status is written)
+    for file_name in [message_filename, error_filename]:
         logging.debug('Cleaning up previous logging file "%s"', file_name)
         if os.path.exists(file_name):
             os.unlink(file_name)
@@ -314,13 +373,13 @@ def run_workflow():
     # Load our commands
     commands = _load_json_file(workflow_file, error_func)
     if commands is None:
-        write_status(status_filename, STATUS_COMPLETED, {'error': 'Unable to start workflow'})
+        write_completion(status_filename, {'error': 'Unable to start workflow'}, registry_path)
         logging.error('Unable to load workflow from file  "%s"', workflow_file)
         return
 
     if not commands:
         msg = 'No commands were found to execute'
-        write_status(status_filename, STATUS_COMPLETED, {'message': msg})
+        write_completion(status_filename, {'message': msg}, registry_path)
         logging.error('Empty workflow loaded from file  "%s"', workflow_file)
         return
 
@@ -342,16 +401,25 @@ def run_workflow():
             res = command_map[command_name](parameters, working_folder, command_working_folder, message_func, error_func)
         else:
             msg = f'Unknown command found "{command_name}"'
-            write_status(status_filename, STATUS_COMPLETED, {'error': msg})
+            write_completion(status_filename, {'error': msg}, registry_path)
             wrote_final_status = True
             logging.error('Unknown workflow command found from file  "%s"', workflow_file)
             break
 
     #  If we haven't written out final status yet, do so now
     if wrote_final_status is False:
-        write_status(status_filename, STATUS_COMPLETED, {'message': 'Completed'})
+        write_completion(status_filename, {'message': 'Completed'}, registry_path)
         logging.debug('Completed running workflow "%s"', workflow_file)
 
 
+def run_workflow():
+    """ Runs the workflow passed in on the command line"""
+    working_folder, workflow_file, logging_level, registry_path = parse_args()
+
+    logging.getLogger().setLevel(logging_level)
+
+    run_workflow_folder(working_folder, workflow_file, registry_path)
+
+
 if __name__ == "__main__":
     run_workflow()
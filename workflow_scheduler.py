@@ -0,0 +1,239 @@
+"""Implements the scheduler that limits the number of workflows running at the same time"""
+
+import os
+import threading
+import time
+import traceback
+from collections.abc import Callable
+from typing import Optional
+
+from run_registry import RUN_STATUS_RUNNING, RUN_STATUS_STAGING, RunRegistry
+
+# Number of seconds a run may be admitted without having its workflow runner recorded before it's considered lost
+SCHEDULER_LAUNCH_TIMEOUT_SEC = 120
+
+# cgroup v2 files with the container's CPU and memory limits
+CGROUP_CPU_MAX_FILE = '/sys/fs/cgroup/cpu.max'
+CGROUP_MEMORY_MAX_FILE = '/sys/fs/cgroup/memory.max'
+CGROUP_MEMORY_CURRENT_FILE = '/sys/fs/cgroup/memory.current'
+
+
+def _read_first_line(file_path: str) -> Optional[str]:
+    """Returns the first line of a file
+    Arguments:
+        file_path: the path of the file to read
+    Return:
+        Returns the stripped first line, or None if the file can't be read
+    """
+    try:
+        with open(file_path, 'r', encoding='utf8') as in_file:
+            return in_file.readline().strip()
+    except OSError:
+        return None
+
+
+def get_available_cores() -> float:
+    """Returns the number of cores available to the server
+    Return:
+        Returns the number of cores the process may run on, reduced to the container's CPU quota when there is one
+    """
+    try:
+        cores = float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        cores = float(os.cpu_count() or 1)
+
+    cpu_max = _read_first_line(CGROUP_CPU_MAX_FILE)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota.isdigit() and period.isdigit() and int(period) > 0:
+            cores = min(cores, int(quota) / int(period))
+
+    return max(cores, 1.0)
+
+
+def get_available_memory_mb() -> Optional[float]:
+    """Returns the amount of memory available for new workflows
+    Return:
+        Returns the number of available megabytes, reduced to what's left of the container's memory limit when there is one,
+        or None if it can't be determined
+    """
+    available = None
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf8') as in_file:
+            for one_line in in_file:
+                if one_line.startswith('MemAvailable:'):
+                    available = int(one_line.split()[1]) / 1024
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+
+    memory_max = _read_first_line(CGROUP_MEMORY_MAX_FILE)
+    memory_current = _read_first_line(CGROUP_MEMORY_CURRENT_FILE)
+    if memory_max and memory_max.isdigit() and memory_current and memory_current.isdigit():
+        cgroup_available = (int(memory_max) - int(memory_current)) / (1024 * 1024)
+        available = cgroup_available if available is None else min(available, cgroup_available)
+
+    return available
+
+
+def is_process_alive(pid: int) -> bool:
+    """Returns whether a process is running
+    Arguments:
+        pid: the ID of the process
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkflowScheduler:
+    """Runs queued workflows when there's room for them
+
+    Arguments:
+      registry - the run registry the queued and running workflows are kept in
+      launch_func - called with a run ID to start its workflow runner, returns the process ID of the runner
+      status_func - called with a run ID and a status dict to write to the run's status file
+      max_running - the maximum number of workflows running at the same time; when zero or less, it's the number of
+                    available cores divided by cores_per_run
+      cores_per_run - the number of cores each running workflow is expected to keep busy
+      memory_per_run_mb - the megabytes of memory each running workflow is expected to use; workflows wait while less is
+                          available, unless nothing is running
+      poll_sec - the number of seconds between checks for finished and lost workflows
+      reap_func - optionally called at each check to wait on the finished processes started by launch_func
+      completion_func - optionally called with a run ID at each check, returns the completion written to the run's
+                        status file or None if the workflow hasn't finished
+
+    Every server process has a scheduler; they share the limits through the run registry. Queued workflows are admitted
+    in the fair share order of the registry, so that one session starting many workflows doesn't hold up others
+    """
+
+    def __init__(self, registry: RunRegistry, launch_func: Callable, status_func: Callable, max_running: int = 0,
+                 cores_per_run: float = 2.0, memory_per_run_mb: int = 2048, poll_sec: float = 2.0,
+                 reap_func: Callable = None, completion_func: Callable = None):
+        """Initializes class instance"""
+        self.registry = registry
+        self.launch_func = launch_func
+        self.status_func = status_func
+        self.max_running = max_running if max_running > 0 else max(1, int(get_available_cores() // cores_per_run))
+        self.memory_per_run_mb = memory_per_run_mb
+        self.poll_sec = poll_sec
+        self.reap_func = reap_func
+        self.completion_func = completion_func
+        self._thread = None
+
+
+    def _can_admit(self, running_count: int, admitted_count: int, available_mb: Optional[float]) -> bool:
+        """Returns whether another workflow can be run
+        Arguments:
+            running_count: the number of workflows running, including the ones admitted so far
+            admitted_count: the number of workflows admitted so far
+            available_mb: the megabytes of memory available before admitting workflows, or None if it's unknown
+        """
+        if running_count >= self.max_running:
+            return False
+        if running_count == 0 or available_mb is None:
+            return True
+        # Workflows that were just admitted haven't started using memory yet
+        return available_mb - admitted_count * self.memory_per_run_mb >= self.memory_per_run_mb
+
+
+    def _update_position(self, run_id: str, position: Optional[int]) -> None:
+        """Writes the queue position of a run to its status
+        Arguments:
+            run_id: the ID of the run
+            position: the position of the run in the queue, or None if it's been admitted
+        """
+        if position is None:
+            self.status_func(run_id, {'starting': {'message': 'Starting workflow'}})
+        else:
+            self.status_func(run_id, {'starting': {'message': f'Queued to run: position {position}',
+                                                   'queue_position': position}})
+
+
+    def schedule(self) -> list:
+        """Starts the queued workflows that there's room for and updates the queue positions of the others
+        Return:
+            Returns the list of IDs of the started runs
+        """
+        available_mb = get_available_memory_mb()
+        admitted = self.registry.admit_runs(
+            lambda running_count, admitted_count: self._can_admit(running_count, admitted_count, available_mb),
+            self._update_position)
+
+        for one_id in admitted:
+            try:
+                pid = self.launch_func(one_id)
+            except Exception as ex:
+                print("Exception caught starting workflow runner", one_id, str(ex))
+                traceback.print_exc()
+                self._fail_run(one_id, f'Unable to start workflow: {ex}')
+                continue
+            self.registry.set_run_pid(one_id, pid)
+
+        return admitted
+
+
+    def _fail_run(self, run_id: str, message: str, status: str = RUN_STATUS_RUNNING) -> None:
+        """Records that a running workflow has failed
+        Arguments:
+            run_id: the ID of the run
+            message: the error message
+            status: the status the run needs to still have to be failed
+        """
+        completion = {'error': message}
+        if self.registry.fail_running_run(run_id, completion, status):
+            self.status_func(run_id, {'completion': completion})
+
+
+    def reap(self) -> None:
+        """Cleans up after finished workflow runners and fails the runs whose runner, or the server process staging their
+        input files, has stopped without finishing
+        Notes:
+            Runners in the runner pool keep running after their workflow finishes, so a run whose status file has its
+            completion is finished even when the runner didn't record it in the registry
+        """
+        # Finished children are waited on so that they don't linger and look like they're still running
+        if self.reap_func is not None:
+            self.reap_func()
+
+        now = time.time()
+        for run_id, pid, admit_time in self.registry.get_running_runs():
+            if pid is None:
+                if admit_time is not None and now - admit_time > SCHEDULER_LAUNCH_TIMEOUT_SEC:
+                    self._fail_run(run_id, 'The workflow was not started')
+                continue
+
+            completion = self.completion_func(run_id) if self.completion_func is not None else None
+            if completion is not None:
+                if self.registry.finish_running_run(run_id, completion):
+                    print("Recorded the completion of workflow", run_id, "from its status")
+            elif not is_process_alive(pid):
+                self._fail_run(run_id, 'The workflow runner stopped unexpectedly')
+
+        # Staging is done in memory by a server process; runs staged before their process was recorded can't be finished
+        for run_id, pid in self.registry.get_staging_runs():
+            if pid is None or not is_process_alive(pid):
+                self._fail_run(run_id, 'The server stopped while staging the input files', RUN_STATUS_STAGING)
+
+
+    def _run(self) -> None:
+        """Checks for finished workflows and starts queued ones until the process exits"""
+        while True:
+            time.sleep(self.poll_sec)
+            try:
+                self.reap()
+                self.schedule()
+            except Exception as ex:
+                print("Exception caught scheduling workflows", str(ex))
+                traceback.print_exc()
+
+
+    def start(self) -> None:
+        """Starts checking for finished workflows and starting queued ones in the background"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='workflow-scheduler', daemon=True)
+            self._thread.start()
@@ -0,0 +1,79 @@
+"""Generates ZIP archives as they're streamed"""
+
+import io
+import os
+import zipfile
+
+# Extensions of files that are already compressed and are stored in archives without compressing them again
+ARCHIVE_STORED_EXTENSIONS = ('.tif', '.tiff', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.jp2', '.zip', '.gz', '.tgz',
+                             '.bz2', '.xz', '.7z', '.laz')
+
+# Number of bytes read from a file at a time when adding it to an archive
+ARCHIVE_READ_SIZE = 1024 * 1024
+
+
+class _ZipStreamWriter(io.RawIOBase):
+    """Unseekable file object that collects the bytes written to it until they're taken"""
+
+    def __init__(self):
+        """Initializes class instance"""
+        super().__init__()
+        self._chunks = []
+
+
+    def writable(self) -> bool:
+        """Returns that the object can be written to"""
+        return True
+
+
+    def write(self, data: bytes) -> int:
+        """Collects the written bytes
+        Arguments:
+            data - the bytes to write
+        """
+        self._chunks.append(bytes(data))
+        return len(data)
+
+
+    def take(self) -> bytes:
+        """Returns the bytes written since the last call"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries: list):
+    """Generates a ZIP archive of files
+    Arguments:
+        entries - a list of (file path, name in the archive) tuples
+    Return:
+        Yields the bytes of the archive as it's generated
+    Notes:
+        Nothing is written to disk and at most ARCHIVE_READ_SIZE bytes of a file are held at a time. Files with one of the
+        ARCHIVE_STORED_EXTENSIONS are stored and other files are compressed
+    """
+    out_stream = _ZipStreamWriter()
+    with zipfile.ZipFile(out_stream, 'w') as archive:
+        for file_path, archive_name in entries:
+            zip_info = zipfile.ZipInfo.from_file(file_path, archive_name)
+            if os.path.splitext(file_path)[1].lower() in ARCHIVE_STORED_EXTENSIONS:
+                zip_info.compress_type = zipfile.ZIP_STORED
+            else:
+                zip_info.compress_type = zipfile.ZIP_DEFLATED
+
+            with open(file_path, 'rb') as in_file, archive.open(zip_info, 'w') as out_file:
+                while True:
+                    chunk = in_file.read(ARCHIVE_READ_SIZE)
+                    if not chunk:
+                        break
+                    out_file.write(chunk)
+                    data = out_stream.take()
+                    if data:
+                        yield data
+
+            data = out_stream.take()
+            if data:
+                yield data
+
+    # The end of the archive is written when it's closed
+    yield out_stream.take()